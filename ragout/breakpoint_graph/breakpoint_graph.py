@@ -7,182 +7,579 @@ This module implements a breakpoint graph
 which is widely used in Ragout
 """
 
-from itertools import chain
-import os
+from itertools import izip
+from array import array
 import logging
+import hashlib
 from copy import copy
 from collections import namedtuple
 
 import networkx as nx
 from networkx.drawing import nx_pydot as dot
 from ragout.shared.debug import DebugConfig
+from ragout.shared.datatypes import GenChrPair, GenomeRegistry
+from ragout.shared import config
 from ragout.phylogeny.phylogeny import *
 
 logger = logging.getLogger()
 debugger = DebugConfig.get_instance()
 
-GenChrPair = namedtuple("GenChrPair", ["genome", "chr"])
+ColoredEdge = namedtuple("ColoredEdge", ["node_1", "node_2", "genome_id",
+                                         "chr_name", "start", "end",
+                                         "infinity"])
 
 COLORS = ["blue", "green", "yellow", "black", "pink"]
-COLORSDICT = dict()
+ANCESTOR_COLOR = "red"
 
 class BreakpointGraph(object):
     """
-    Breakpoint graph implementation
+    Breakpoint graph implementation. Nodes are signed synteny block ends,
+    colored edges are kept in typed columns and indexed with
+    CSR-style adjacency arrays
     """
-    def __init__(self, perm_container=None, ancestral=False, ancestor=None, name="breakpoint_graph"):
-        self.bp_graph = nx.MultiGraph()
+    def __init__(self, perm_container=None, ancestral=False, ancestor=None):
         self.target = None
         self.references = []
+        self.genome_colors = {}
         self.debug_nodes = set()
         self.ancestral = ancestral
         self.ancestor = ancestor
+        self._init_storage()
         if perm_container is not None:
             self.build_from(perm_container)
-        self.writedot(name)
+
+    def _init_storage(self):
+        """
+        Empty node table, edge columns and adjacency index
+        """
+        #node ids (signed block ends) by dense index
+        self._nodes = array("l")
+        self._node_index = {}
+
+        #string tables, edge columns refer to them by index.
+        #Genome ids are run-wide (see GenomeRegistry)
+        self._registry = GenomeRegistry.get_instance()
+        self._genomes = self._registry.genomes
+        self._genome_ids = self._registry.genome_ids
+        self._chrs = []
+        self._colors = []
+        self._chr_ids = {}
+        self._color_ids = {}
+
+        #edge columns, node columns store dense indices
+        self._edge_node_1 = array("l")
+        self._edge_node_2 = array("l")
+        self._edge_genome = array("i")
+        self._edge_chr = array("i")
+        self._edge_start = array("l")
+        self._edge_end = array("l")
+        self._edge_infinity = array("b")
+        self._edge_color = array("i")
+
+        #CSR adjacency: edges of node i are
+        #_adj_edges[_adj_offsets[i]:_adj_offsets[i + 1]]
+        self._adj_offsets = array("l", [0])
+        self._adj_edges = array("l")
+
+        #lazily computed search helpers
+        self._fingerprint = None
+        self._neighbors_cache = {}
+        self._reset_networkx_order()
 
     def build_from(self, perm_container):
         """
         Builds breakpoint graph from permutations
         """
+        references = set(self.references)
         for perm in perm_container.ref_perms:
-            if perm.genome_name not in self.references:
+            if perm.genome_name not in references:
+                references.add(perm.genome_name)
                 self.references.append(perm.genome_name)
         self.target = perm_container.target_perms[0].genome_name
+
+        for perm in perm_container.ref_perms:
+            self._add_permutation(perm, references)
+        #reference part of the graph is never changed by contig breaks
+        self._num_ref_nodes = len(self._nodes)
+        self._num_ref_edges = len(self._edge_node_1)
+
+        self._add_draft_permutations(perm_container, references)
+        self._build_adjacency()
+        logger.debug("Built breakpoint graph with {0} nodes"
+                                        .format(len(self)))
+
+    def update_from(self, perm_container):
+        """
+        Updates the graph after target (or ancestor) contigs were broken
+        (see ChimeraDetector.break_contigs). Reference edges are kept,
+        adjacencies of the broken sequences are replaced with the
+        edges of the given permutations. The result is identical
+        to the graph built from scratch
+        """
+        for node in self._nodes[self._num_ref_nodes:]:
+            del self._node_index[node]
+        del self._nodes[self._num_ref_nodes:]
+        for column in [self._edge_node_1, self._edge_node_2,
+                       self._edge_genome, self._edge_chr,
+                       self._edge_start, self._edge_end,
+                       self._edge_infinity, self._edge_color]:
+            del column[self._num_ref_edges:]
+
+        self._add_draft_permutations(perm_container, set(self.references))
+        self._build_adjacency()
+        self._fingerprint = None
+        self._neighbors_cache = {}
+        self._reset_networkx_order()
+        logger.debug("Updated breakpoint graph: {0} nodes"
+                                        .format(len(self)))
+
+    def _add_draft_permutations(self, perm_container, references):
+        """
+        Adds edges of target (and ancestor) permutations
+        """
         self.contig_ends = []
         for perm in perm_container.target_perms:
             self.contig_ends.append((perm.blocks[0].signed_id(),
                                      -perm.blocks[-1].signed_id()))
 
-        c=0
-        for perm in chain(perm_container.ref_perms,
-                          perm_container.target_perms):
-            assert perm.blocks
-            if perm.genome_name not in COLORSDICT:
-                COLORSDICT[perm.genome_name] = COLORS[c]
-                c+=1
-            for prev_block, next_block in perm.iter_pairs():
-                self.bp_graph.add_node(-prev_block.signed_id())
-                self.bp_graph.add_node(next_block.signed_id())
-
-                self.bp_graph.add_edge(-prev_block.signed_id(),
-                                       next_block.signed_id(),
-                                       genome_id=perm.genome_name,
-                                       chr_name=perm.chr_name,
-                                       start=prev_block.end,
-                                       end=next_block.start,
-                                       infinity=False,
-                                       color = COLORSDICT[perm.genome_name])
-
-            if perm.genome_name in self.references and not perm.draft:
-                self.bp_graph.add_edge(-perm.blocks[-1].signed_id(),
-                                       perm.blocks[0].signed_id(),
-                                       genome_id=perm.genome_name,
-                                       chr_name=perm.chr_name,
-                                       infinity=True,
-                                       color = COLORSDICT[perm.genome_name])
-            if perm.genome_name in self.target and not perm.draft and self.ancestral:
-                self.bp_graph.add_edge(-perm.blocks[-1].signed_id(),
-                                       perm.blocks[0].signed_id(),
-                                       genome_id=perm.genome_name,
-                                       chr_name=perm.chr_name,
-                                       infinity=True,
-                                       color = COLORSDICT[perm.genome_name])
-            if self.target in perm.genome_name and not 'unlocalized' in perm.genome_name and not perm.draft and self.ancestral:
-                self.bp_graph.add_edge(-perm.blocks[-1].signed_id(),
-                                       perm.blocks[0].signed_id(),
-                                       genome_id=perm.genome_name,
-                                       chr_name=perm.chr_name,
-                                       infinity=True,
-                                       color = COLORS[c])
+        for perm in perm_container.target_perms:
+            self._add_permutation(perm, references)
         if self.ancestral:
             for perm in perm_container.ancestor_perms:
                 assert perm.blocks
                 for prev_block, next_block in perm.iter_pairs():
-                    self.bp_graph.add_node(-prev_block.signed_id())
-                    self.bp_graph.add_node(next_block.signed_id())
-
-                    self.bp_graph.add_edge(-prev_block.signed_id(),
-                                       next_block.signed_id(),
-                                       genome_id=perm.genome_name,
-                                       chr_name=perm.chr_name,
-                                       start=prev_block.end,
-                                       end=next_block.start,
-                                       infinity=False,
-                                       color = "red")
+                    self._add_edge(-prev_block.signed_id(),
+                                   next_block.signed_id(),
+                                   perm.genome_name, perm.chr_name,
+                                   prev_block.end, next_block.start,
+                                   False, ANCESTOR_COLOR)
 
-        logger.debug("Built breakpoint graph with {0} nodes"
-                                        .format(len(self.bp_graph)))
+    def _add_permutation(self, perm, references):
+        """
+        Adds adjacency edges of a single permutation
+        """
+        assert perm.blocks
+        if perm.genome_name not in self.genome_colors:
+            self.genome_colors[perm.genome_name] = \
+                                _genome_color(len(self.genome_colors))
+        color = self.genome_colors[perm.genome_name]
+        for prev_block, next_block in perm.iter_pairs():
+            self._add_edge(-prev_block.signed_id(),
+                           next_block.signed_id(),
+                           perm.genome_name, perm.chr_name,
+                           prev_block.end, next_block.start,
+                           False, color)
+
+        if perm.genome_name in references and not perm.draft:
+            self._add_edge(-perm.blocks[-1].signed_id(),
+                           perm.blocks[0].signed_id(),
+                           perm.genome_name, perm.chr_name,
+                           None, None, True, color)
+        if perm.genome_name in self.target and not perm.draft and self.ancestral:
+            self._add_edge(-perm.blocks[-1].signed_id(),
+                           perm.blocks[0].signed_id(),
+                           perm.genome_name, perm.chr_name,
+                           None, None, True, color)
+        if self.target in perm.genome_name and not 'unlocalized' in perm.genome_name and not perm.draft and self.ancestral:
+            self._add_edge(-perm.blocks[-1].signed_id(),
+                           perm.blocks[0].signed_id(),
+                           perm.genome_name, perm.chr_name,
+                           None, None, True,
+                           _genome_color(len(self.genome_colors)))
+
+    def _add_node(self, node):
+        """
+        Returns dense index of a node, registering it if necessary
+        """
+        index = self._node_index.get(node)
+        if index is None:
+            index = len(self._nodes)
+            self._node_index[node] = index
+            self._nodes.append(node)
+        return index
+
+    def _add_edge(self, node_1, node_2, genome_id, chr_name,
+                  start, end, infinity, color):
+        """
+        Appends a colored edge to the columns. Adjacency index
+        should be rebuilt afterwards
+        """
+        self._edge_node_1.append(self._add_node(node_1))
+        self._edge_node_2.append(self._add_node(node_2))
+        self._edge_genome.append(self._registry.genome_id(genome_id))
+        self._edge_chr.append(_intern(self._chrs,
+                                      self._chr_ids, chr_name))
+        self._edge_start.append(start if start is not None else 0)
+        self._edge_end.append(end if end is not None else 0)
+        self._edge_infinity.append(int(infinity))
+        self._edge_color.append(_intern(self._colors,
+                                        self._color_ids, color))
+
+    def _build_adjacency(self):
+        """
+        Builds CSR adjacency index with a counting sort of edge ends
+        """
+        num_nodes = len(self._nodes)
+        offsets = array("l", [0] * (num_nodes + 1))
+        for edge_id in xrange(len(self._edge_node_1)):
+            node_1 = self._edge_node_1[edge_id]
+            node_2 = self._edge_node_2[edge_id]
+            offsets[node_1 + 1] += 1
+            if node_2 != node_1:
+                offsets[node_2 + 1] += 1
+        for i in xrange(num_nodes):
+            offsets[i + 1] += offsets[i]
+
+        fill = array("l", offsets)
+        adj_edges = array("l", [0] * offsets[num_nodes])
+        for edge_id in xrange(len(self._edge_node_1)):
+            node_1 = self._edge_node_1[edge_id]
+            node_2 = self._edge_node_2[edge_id]
+            adj_edges[fill[node_1]] = edge_id
+            fill[node_1] += 1
+            if node_2 != node_1:
+                adj_edges[fill[node_2]] = edge_id
+                fill[node_2] += 1
+
+        self._adj_offsets = offsets
+        self._adj_edges = adj_edges
+        self._build_support_index()
+
+    def _build_support_index(self):
+        """
+        Precomputes genome masks and sorted tuples of (genome, chromosome)
+        pair ids for every connected pair of nodes
+        """
+        num_nodes = len(self._nodes)
+        gen_chr_ids = {}
+        pair_masks = {}
+        pair_support = {}
+        for index_1, index_2, genome, chrom in \
+                izip(self._edge_node_1, self._edge_node_2,
+                     self._edge_genome, self._edge_chr):
+            if index_1 > index_2:
+                index_1, index_2 = index_2, index_1
+            key = index_1 * num_nodes + index_2
+            gen_chr_id = gen_chr_ids.get((genome, chrom))
+            if gen_chr_id is None:
+                gen_chr_id = self._registry.pair_id(self._genomes[genome],
+                                                    self._chrs[chrom])
+                gen_chr_ids[(genome, chrom)] = gen_chr_id
+
+            pair_masks[key] = pair_masks.get(key, 0) | (1 << genome)
+            support = pair_support.get(key, ())
+            if gen_chr_id not in support:
+                pair_support[key] = support + (gen_chr_id,)
+
+        #equal supports (e.g. adjacencies within the same contigs)
+        #share one tuple
+        interned = {}
+        for key, support in pair_support.iteritems():
+            support = tuple(sorted(support))
+            pair_support[key] = interned.setdefault(support, support)
+        self._pair_masks = pair_masks
+        self._pair_support = pair_support
+
+    def _index_of(self, node):
+        """
+        Dense index of the node, None if it is not in the graph
+        """
+        return self._node_index.get(node)
+
+    def _node_pair_key(self, node_1, node_2):
+        index_1 = self._index_of(node_1)
+        index_2 = self._index_of(node_2)
+        if index_1 is None or index_2 is None:
+            return None
+        return _pair_key(index_1, index_2, len(self._nodes))
+
+    def _node_indices(self):
+        """
+        Dense indices of the graph nodes
+        """
+        return xrange(len(self._nodes))
+
+    def _edge_indices(self):
+        """
+        Ids of the graph edges
+        """
+        return xrange(len(self._edge_node_1))
+
+    def __len__(self):
+        return len(self._node_indices())
+
+    def nodes(self):
+        return list(self._nx_nodes())
+
+    def num_edges(self):
+        return len(self._edge_indices())
+
+    def _node_edges(self, index):
+        """
+        Edge ids incident to the node with the given dense index
+        """
+        return self._adj_edges[self._adj_offsets[index]:
+                               self._adj_offsets[index + 1]]
+
+    def _other_end(self, edge_id, index):
+        node_1 = self._edge_node_1[edge_id]
+        return self._edge_node_2[edge_id] if node_1 == index else node_1
+
+    def _edges_between(self, node_1, node_2):
+        """
+        Ids of all parallel edges between two nodes
+        """
+        index_1 = self._index_of(node_1)
+        index_2 = self._index_of(node_2)
+        if index_1 is None or index_2 is None:
+            return []
+        return [e for e in self._node_edges(index_1)
+                if self._other_end(e, index_1) == index_2]
+
+    def _neighbor_indices(self, index):
+        neighbors = []
+        for edge_id in self._node_edges(index):
+            other = self._other_end(edge_id, index)
+            if other not in neighbors:
+                neighbors.append(other)
+        return neighbors
+
+    def neighbors(self, node):
+        if self._index_of(node) is None:
+            raise KeyError(node)
+        return list(self._nx_adjacency(node))
+
+    def _reset_networkx_order(self):
+        self._nx_node_dict = None
+        self._nx_adj = {}
+
+    def _nx_nodes(self):
+        """
+        Nodes as a dictionary filled in the same order as the node
+        dictionary of the networkx graph that was used before,
+        so they are iterated in the same order. Ties of adjacency
+        inference and chimera detection are resolved by this order,
+        so it keeps the results the same
+        """
+        if self._nx_node_dict is None:
+            self._nx_node_dict = dict.fromkeys(self._nodes[i] for i
+                                               in self._node_indices())
+        return self._nx_node_dict
+
+    def _nx_adjacency(self, node):
+        """
+        Neighbors of the node as a dictionary filled in the same order
+        as in the networkx graph (see _nx_nodes)
+        """
+        neighbors = self._nx_adj.get(node)
+        if neighbors is None:
+            index = self._node_index[node]
+            neighbors = dict.fromkeys(self._nodes[i] for i
+                                      in self._neighbor_indices(index))
+            self._nx_adj[node] = neighbors
+        return neighbors
+
+    def _nx_source(self):
+        """
+        Node the networkx search of this component started from,
+        None for the whole graph
+        """
+        return None
+
+    def _nx_adjacency_nodes(self):
+        """
+        Nodes in the order of the networkx adjacency dictionary
+        """
+        return self._nx_nodes()
+
+    def _nx_edges(self):
+        """
+        Yields ids of the colored edges with the index of their first
+        node in the order of networkx edges_iter
+        """
+        seen = set()
+        for node in self._nx_adjacency_nodes():
+            index = self._node_index[node]
+            edges = self._node_edges(index)
+            for neighbor in self._nx_adjacency(node):
+                if neighbor in seen:
+                    continue
+                other = self._node_index[neighbor]
+                for edge_id in edges:
+                    if self._other_end(edge_id, index) == other:
+                        yield edge_id, index
+            seen.add(node)
+
+    def has_edge(self, node_1, node_2):
+        return self._node_pair_key(node_1, node_2) in self._pair_masks
+
+    def _edge_tuple(self, edge_id, first=None):
+        """
+        Colored edge by id, optionally starting from the given node index
+        """
+        index_1 = self._edge_node_1[edge_id]
+        index_2 = self._edge_node_2[edge_id]
+        if first is not None and first != index_1:
+            index_1, index_2 = index_2, index_1
+        infinity = bool(self._edge_infinity[edge_id])
+        return ColoredEdge(self._nodes[index_1], self._nodes[index_2],
+                           self._genomes[self._edge_genome[edge_id]],
+                           self._chrs[self._edge_chr[edge_id]],
+                           None if infinity else self._edge_start[edge_id],
+                           None if infinity else self._edge_end[edge_id],
+                           infinity)
+
+    def iter_edges(self):
+        """
+        Iterates over all colored edges
+        """
+        for edge_id, first in self._nx_edges():
+            yield self._edge_tuple(edge_id, first)
+
+    def genome_edges(self, genome_id):
+        """
+        Iterates over colored edges of the given genome
+        """
+        if genome_id not in self._genome_ids:
+            return
+        genome = self._genome_ids[genome_id]
+        for edge_id, first in self._nx_edges():
+            if self._edge_genome[edge_id] == genome:
+                yield self._edge_tuple(edge_id, first)
 
     def writedot(self, name):
-        l = len(self.bp_graph.nodes())
-        fout = open(name+".dot", "w")
-        fout.write("graph G{\n")
-        def _convert(n):
-            if n>0:
-                return '"%dh"' %abs(n)
-            else:
-                return '"%dt"' %abs(n)
-        for n in self.bp_graph.nodes():
-            fout.write("%s;\n" %(_convert(n)))
-        a = set()
-        for u,v in self.bp_graph.edges():
-            if "".join(map(str,[u,v])) not in a:
-                a.add("".join(map(str,[u,v])))
-                for k,value in self.bp_graph[u][v].items():
-                    fout.write("%s -- %s [color=%s, key=%d];\n" %(_convert(u),_convert(v),value["color"], k))
-        fout.write("}\n")
+        """
+        Outputs the graph with colored edges in dot format
+        into the debug directory
+        """
+        if not debugger.output_enabled("dot"):
+            return
+
+        with debugger.open(name + ".dot") as fout:
+            fout.write("graph G{\n")
+            def _convert(n):
+                if n>0:
+                    return '"%dh"' %abs(n)
+                else:
+                    return '"%dt"' %abs(n)
+            for n in self.nodes():
+                fout.write("%s;\n" %(_convert(n)))
+            keys = {}
+            for edge_id in self._edge_indices():
+                u = self._nodes[self._edge_node_1[edge_id]]
+                v = self._nodes[self._edge_node_2[edge_id]]
+                pair = (min(u, v), max(u, v))
+                keys[pair] = keys.get(pair, -1) + 1
+                fout.write("%s -- %s [color=%s, key=%d];\n"
+                           %(_convert(u),_convert(v),
+                             self._colors[self._edge_color[edge_id]], keys[pair]))
+            fout.write("}\n")
 
     def connected_components(self):
-        subgraphs = nx.connected_component_subgraphs(self.bp_graph)
-        bp_graphs = []
-        for subgr in subgraphs:
-            bg = BreakpointGraph()
-            bg.target = self.target
-            bg.references = copy(self.references)
-            bg.ancestral =self.ancestral
-            bg.ancestor = self.ancestor
-            bg.bp_graph = subgr
-            bp_graphs.append(bg)
-        return bp_graphs
+        """
+        Splits the graph into connected components, largest first.
+        Components are views that share storage with this graph
+        """
+        parents = array("l", xrange(len(self._nodes)))
+        sizes = array("l", [1] * len(self._nodes))
+
+        def find(index):
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+
+        for edge_id in self._edge_indices():
+            root_1 = find(self._edge_node_1[edge_id])
+            root_2 = find(self._edge_node_2[edge_id])
+            if root_1 == root_2:
+                continue
+            if sizes[root_1] < sizes[root_2]:
+                root_1, root_2 = root_2, root_1
+            parents[root_2] = root_1
+            sizes[root_1] += sizes[root_2]
+
+        comp_ids = {}
+        comp_nodes = []
+        for index in self._node_indices():
+            root = find(index)
+            if root not in comp_ids:
+                comp_ids[root] = len(comp_nodes)
+                comp_nodes.append(array("l"))
+            comp_nodes[comp_ids[root]].append(index)
+
+        comp_edges = [array("l") for _ in comp_nodes]
+        for edge_id in self._edge_indices():
+            root = find(self._edge_node_1[edge_id])
+            comp_edges[comp_ids[root]].append(edge_id)
+
+        #networkx searched components from nodes in the dictionary
+        #order and listed them in that order (largest first)
+        sources = [None] * len(comp_nodes)
+        found = []
+        for node in self._nx_nodes():
+            index = self._node_index[node]
+            comp = comp_ids[find(index)]
+            if sources[comp] is None:
+                sources[comp] = index
+                found.append(comp)
+
+        order = sorted(found, key=lambda c: len(comp_nodes[c]), reverse=True)
+        return [ComponentView(self, comp_nodes[c], comp_edges[c], sources[c])
+                for c in order]
 
     def genomes_chrs_support(self, node_1, node_2):
-        if not self.bp_graph.has_edge(node_1, node_2):
-            return []
-        return list(map(lambda e: GenChrPair(e["genome_id"], e["chr_name"]),
-                    self.bp_graph[node_1][node_2].values()))
+        return self._registry.id_pairs(self.support_ids(node_1, node_2))
+
+    def support_ids(self, node_1, node_2):
+        """
+        Returns (genome, chromosome) pairs of edges between two nodes
+        as a sorted tuple of GenomeRegistry pair ids
+        """
+        return self._pair_support.get(self._node_pair_key(node_1, node_2), ())
 
     def genomes_support(self, node_1, node_2):
-        return list(map(lambda gp: gp.genome,
-                    self.genomes_chrs_support(node_1, node_2)))
+        return [gc.genome for gc in self.genomes_chrs_support(node_1, node_2)]
+
+    def genomes_mask(self, node_1, node_2):
+        """
+        Returns a bitmask of genomes supporting an edge between two nodes
+        (see genome_mask)
+        """
+        return self._pair_masks.get(self._node_pair_key(node_1, node_2), 0)
+
+    def genome_mask(self, genome_id):
+        """
+        Returns a bit that corresponds to the given genome
+        in genomes_mask() output
+        """
+        if genome_id not in self._genome_ids:
+            return 0
+        return 1 << self._genome_ids[genome_id]
 
     def to_weighted_graph(self, phylogeny):
         """
         Converts a breakpoint graph into a weighted adjacency graph
         using half-breakpoint state parsimony problem
         """
-        assert len(self.bp_graph) >= 2
+        assert len(self) >= 2
         g = nx.Graph()
-        g.add_nodes_from(self.bp_graph.nodes())
+        g.add_nodes_from(self.nodes())
+        void_states = dict.fromkeys(self.references)  #"void" state in paper
 
-        for node in self.bp_graph.nodes():
-            adjacencies = {}
-            for neighbor in self.bp_graph.neighbors(node):
-                for edge in self.bp_graph[node][neighbor].values():
-                    adjacencies[edge["genome_id"]] = neighbor
+        for node in self.nodes():
+            neighbors = self.neighbors(node)
+            adjacencies = dict(void_states)
+            adjacencies.update(self._genome_states(node, neighbors))
 
-            for ref_id in self.references:
-                if ref_id not in adjacencies:
-                    adjacencies[ref_id] = None  #"void" state in paper
-
-            break_weights = {}
-            for neighbor in self.bp_graph.neighbors(node):
-                adjacencies[self.target] = neighbor
-                break_weights[neighbor] = phylogeny.estimate_tree(adjacencies)
+            break_weights = dict(izip(neighbors,
+                                      phylogeny.estimate_target_states(
+                                            adjacencies, self.target,
+                                            neighbors)))
 
             #normalization
             total_weights = sum(break_weights.values())
-            for neighbor in self.bp_graph.neighbors(node):
+            for neighbor in neighbors:
                 weight = (break_weights[neighbor] / total_weights
                           if total_weights != 0 else 0)
                 _update_edge(g, node, neighbor, weight)
@@ -194,78 +591,83 @@ class BreakpointGraph(object):
         Converts a breakpoint graph into a weighted ancestral adjacency graph
         using half-breakpoint state parsimony problem
         """
-        assert len(self.bp_graph) >= 2
+        assert len(self) >= 2
         g = nx.Graph()
-        g.add_nodes_from(self.bp_graph.nodes())
+        g.add_nodes_from(self.nodes())
+        #"void" states in paper, for references and target genome
+        void_states = dict.fromkeys(self.references + [self.target])
         #print self.references, self.target
-        for node in self.bp_graph.nodes():
-            adjacencies = {}
-            for neighbor in self.bp_graph.neighbors(node):
-                for edge in self.bp_graph[node][neighbor].values():
-                    adjacencies[edge["genome_id"]] = neighbor
-
-            for ref_id in self.references: #maybe unessesary
-                if ref_id not in adjacencies:
-                    adjacencies[ref_id] = None  #"void" state in paper
-            if self.target not in adjacencies:
-                adjacencies[self.target] = None #"void" state for target genome
-
-            break_weights = {}
-            for neighbor in self.bp_graph.neighbors(node):
-                ancestor_state = {self.ancestor: neighbor} #assign state for ancestor
-                ancestor_tree = get_node(phylogeny.tree, self.ancestor)
-                ancestor_phylo = Phylogeny(ancestor_tree)
-                ancestor_scores = estimate_labeled_tree(ancestor_phylo, adjacencies, ancestor_state)
-                break_weights[neighbor] = phylogeny.estimate_tree(adjacencies, internal_scores={ancestor_tree: ancestor_scores})
+        for node in self.nodes():
+            neighbors = self.neighbors(node)
+            adjacencies = dict(void_states)
+            adjacencies.update(self._genome_states(node, neighbors))
+
+            break_weights = dict(izip(neighbors,
+                                      phylogeny.estimate_ancestral_states(
+                                            adjacencies, self.ancestor,
+                                            neighbors)))
 
             #normalization
             total_weights = sum(break_weights.values())
-            for neighbor in self.bp_graph.neighbors(node):
+            for neighbor in neighbors:
                 weight = (break_weights[neighbor] / total_weights
                           if total_weights != 0 else 0)
                 _update_edge(g, node, neighbor, weight)
 
         return g
+
+    def _genome_states(self, node, neighbors):
+        """
+        Maps genomes to the adjacent node of the given one. Edges
+        are visited neighbor by neighbor in the given order
+        """
+        index = self._node_index[node]
+        edges = self._node_edges(index)
+        states = {}
+        for neighbor in neighbors:
+            other = self._node_index[neighbor]
+            for edge_id in edges:
+                if self._other_end(edge_id, index) == other:
+                    states[self._genomes[self._edge_genome[edge_id]]] = \
+                                                                neighbor
+        return states
     """
     def add_debug_node(self, node):
         self.debug_nodes.add(node)
     """
 
-    def alternating_cycle(self, node_1, node_2):
+    def alternating_cycle(self, node_1, node_2, cache=None):
         """
         Determines if there is a cycle of alternating colors
-        that goes through the given red-supported (!) edge
-        """
-        def get_genome_ids((u, v)):
-            return self.genomes_support(u, v)
-
-        good_path = False
-        for path in self._alternating_paths(node_1, node_2):
-            #assert len(path) % 2 == 0
-            if len(path) % 2 != 0:
-				#print len(path)
-				return None
-            if len(path) == 2:
-                continue
-
-            edges = list(zip(path[:-1], path[1:]))
-            even_colors = list(map(get_genome_ids, edges[1::2]))
-            even_good = all(map(lambda e: set(e) == set([self.target]),
-                        even_colors))
-            if not even_good:
-                continue
-
-            odd_colors = list(map(get_genome_ids, edges[0::2]))
-            common_genomes = set(odd_colors[0])
-            for edge_colors in odd_colors:
-                common_genomes = common_genomes.intersection(edge_colors)
+        that goes through the given red-supported (!) edge.
+        If cache (a dict) is given, results are stored there
+        per component (see component_fingerprint)
+        """
+        if cache is None:
+            return self._alternating_cycle_search(node_1, node_2)
 
-            if common_genomes:
-                #self._check_distances(path)
-                good_path = True
-                break
+        results = cache.setdefault(self.component_fingerprint(), {})
+        if (node_1, node_2) not in results:
+            results[(node_1, node_2)] = self._alternating_cycle_search(node_1,
+                                                                       node_2)
+        return results[(node_1, node_2)]
 
-        return len(path) / 2 if good_path else None
+    def component_fingerprint(self):
+        """
+        Digest of the target genome, the ordered list of colored edges
+        and the node the component was searched from (which defines
+        the node order, see _nx_nodes). Graphs with equal fingerprints
+        give the same alternating cycles
+        """
+        if self._fingerprint is None:
+            edges = [(self._nodes[self._edge_node_1[e]],
+                      self._nodes[self._edge_node_2[e]],
+                      self._genomes[self._edge_genome[e]])
+                     for e in self._edge_indices()]
+            self._fingerprint = hashlib.md5(repr((self.target, edges,
+                                                  self._nx_source())))\
+                                                                .hexdigest()
+        return self._fingerprint
 
     """
     def _check_distances(self, path):
@@ -282,11 +684,8 @@ class BreakpointGraph(object):
     """
 
     def is_infinity(self, node_1, node_2):
-        if not self.bp_graph.has_edge(node_1, node_2):
-            return False
-
-        for edge_data in self.bp_graph[node_1][node_2].values():
-            if edge_data["infinity"]:
+        for edge_id in self._edges_between(node_1, node_2):
+            if self._edge_infinity[edge_id]:
                 return True
         return False
 
@@ -300,10 +699,12 @@ class BreakpointGraph(object):
         else:
             genome = self.ancestor
         DEFAULT_DISTANCE = 0
-        if not self.bp_graph.has_edge(node_1, node_2):
+        edges = self._edges_between(node_1, node_2)
+        if not edges:
             return DEFAULT_DISTANCE
-        distances = {e["genome_id"] : e["end"] - e["start"]
-                     for e in self.bp_graph[node_1][node_2].values()}
+        distances = {self._genomes[self._edge_genome[e]] :
+                        self._edge_end[e] - self._edge_start[e]
+                     for e in edges}
 
         genomes_order = phylogeny.nodes_by_distance(genome, onlyLeaves = not ancestral )
         if len(distances.keys()) == 1 and genome == distances.keys()[0]:
@@ -313,44 +714,203 @@ class BreakpointGraph(object):
                 return distances[g]
 
     def debug_output(self):
-        if not debugger.debugging:
+        if not debugger.output_enabled("dot"):
             return
 
-        graph_out = os.path.join(debugger.debug_dir, "breakpoint_graph.dot")
-        _output_graph(self.bp_graph, graph_out)
+        with debugger.open("breakpoint_graph.dot") as fout:
+            _output_graph(self, fout)
 
-    def _alternating_paths(self, src, dst):
+    def _alternating_cycle_search(self, src, dst):
         """
-        Finds a path of alternating colors between two nodes
+        Iterative depth-first search of alternating paths between two nodes
+        (of at most "max_alternating_path" nodes, if set). Colored edges
+        should have a non-target genome, the others should have the target.
+        Paths are checked in the order they are found: an odd path
+        gives None, a path with target-only red edges and colored edges
+        sharing a genome gives half of its length
         """
-        visited = set()
-        def rec_helper(node, colored):
-            if node == dst:
-                return [[dst]]
-
-            visited.add(node)
-            paths = []
-            for neighbor in self.bp_graph.neighbors(node):
+        max_len = config.vals["max_alternating_path"]
+        target_mask = self.genome_mask(self.target)
+        src, dst = self._index_of(src), self._index_of(dst)
+        if src is None or dst is None:
+            raise KeyError("node is not in the graph")
+        path = [src]
+        #genomes shared by the colored edges and whether
+        #red edges are target-only, for each prefix of the path
+        common_masks = [-1]
+        red_good = [True]
+        visited = set(path)
+        stack = [iter(self._masked_neighbors(src))]
+        while stack:
+            colored = len(path) % 2 == 1
+            for neighbor, genomes in stack[-1]:
                 if neighbor in visited:
                     continue
-
-                ##
-                genomes = self.genomes_support(node, neighbor)
-                non_target = set(filter(lambda g: g != self.target, genomes))
-                if colored and len(non_target) == 0:
+                if colored:
+                    if not genomes & ~target_mask:
+                        continue
+                    common = common_masks[-1] & genomes
+                    good = red_good[-1]
+                else:
+                    if not genomes & target_mask:
+                        continue
+                    common = common_masks[-1]
+                    good = red_good[-1] and genomes == target_mask
+
+                if neighbor == dst:
+                    if not colored:
+                        return None
+                    if len(path) > 1 and good and common:
+                        return (len(path) + 1) / 2
                     continue
-                if not colored and self.target not in genomes:
+                if max_len is not None and len(path) + 2 > max_len:
                     continue
-                ##
 
-                far_paths = rec_helper(neighbor, not colored)
-                map(lambda p: p.append(node), far_paths)
-                paths.extend(far_paths)
-            visited.remove(node)
-            return paths
+                path.append(neighbor)
+                common_masks.append(common)
+                red_good.append(good)
+                visited.add(neighbor)
+                stack.append(iter(self._masked_neighbors(neighbor)))
+                break
+            else:
+                stack.pop()
+                common_masks.pop()
+                red_good.pop()
+                visited.remove(path.pop())
+
+        return None
 
-        paths = list(map(lambda p: p[::-1], rec_helper(src, True)))
-        return paths
+    def _masked_neighbors(self, index):
+        """
+        Memoized list of (neighbor index, genomes mask) pairs
+        """
+        neighbors = self._neighbors_cache.get(index)
+        if neighbors is None:
+            num_nodes = len(self._nodes)
+            neighbors = []
+            for node in self._nx_adjacency(self._nodes[index]):
+                other = self._node_index[node]
+                neighbors.append((other, self._pair_masks[_pair_key(index,
+                                                    other, num_nodes)]))
+            self._neighbors_cache[index] = neighbors
+        return neighbors
+
+
+#node table, string tables, edge columns and indices that component
+#views share with the graph. Lazily computed helpers are not shared
+_SHARED_STORAGE = ["_nodes", "_node_index", "_registry", "_genomes",
+                   "_genome_ids", "_chrs", "_colors", "_chr_ids",
+                   "_color_ids", "_edge_node_1", "_edge_node_2",
+                   "_edge_genome", "_edge_chr", "_edge_start", "_edge_end",
+                   "_edge_infinity", "_edge_color", "_adj_offsets",
+                   "_adj_edges", "_pair_masks", "_pair_support"]
+
+
+class ComponentView(BreakpointGraph):
+    """
+    Connected component of a breakpoint graph. Shares storage with
+    the parent graph and refers to its nodes and edges by index,
+    so nothing is copied. Nodes of other components are treated
+    as absent
+    """
+    def __init__(self, parent, node_indices, edge_ids, source):
+        self.target = parent.target
+        self.references = parent.references
+        self.genome_colors = parent.genome_colors
+        self.debug_nodes = parent.debug_nodes
+        self.ancestral = parent.ancestral
+        self.ancestor = parent.ancestor
+        for name in _SHARED_STORAGE:
+            setattr(self, name, getattr(parent, name))
+
+        self._parent = parent
+        self._component_nodes = node_indices
+        self._component_edges = edge_ids
+        self._source = source
+        self._member_indices = None
+        self._fingerprint = None
+        self._neighbors_cache = {}
+        self._nx_adjacency_dict = None
+        self._reset_networkx_order()
+
+    def _index_of(self, node):
+        index = self._node_index.get(node)
+        if index is None:
+            return None
+        if self._member_indices is None:
+            self._member_indices = set(self._component_nodes)
+        return index if index in self._member_indices else None
+
+    def _node_indices(self):
+        return self._component_nodes
+
+    def _edge_indices(self):
+        return self._component_edges
+
+    def _nx_source(self):
+        return self._nodes[self._source]
+
+    def _nx_nodes(self):
+        if self._nx_node_dict is None:
+            self._copy_networkx_component()
+        return self._nx_node_dict
+
+    def _nx_adjacency(self, node):
+        if self._nx_node_dict is None:
+            self._copy_networkx_component()
+        return self._nx_adj[node]
+
+    def _nx_adjacency_nodes(self):
+        if self._nx_node_dict is None:
+            self._copy_networkx_component()
+        return self._nx_adjacency_dict
+
+    def _copy_networkx_component(self):
+        """
+        Repeats what nx.connected_component_subgraphs did with the
+        dictionaries of this component: breadth-first search from the
+        source node, subgraph of the found nodes and its deep copy.
+        Resulting dictionaries are iterated in the same order
+        as the dictionaries of the networkx component
+        """
+        parent = self._parent
+        found = {}
+        level = 0
+        next_level = {self._nodes[self._source]: 1}
+        while next_level:
+            this_level = next_level
+            next_level = {}
+            for node in this_level:
+                if node not in found:
+                    found[node] = level
+                    next_level.update(parent._nx_adjacency(node))
+            level += 1
+
+        sub_nodes = dict.fromkeys(list(found.keys()))
+        sub_adj = {}
+        for node in sub_nodes:
+            neighbors = {}
+            sub_adj[node] = neighbors
+            for other in parent._nx_adjacency(node):
+                if other in sub_adj:
+                    neighbors[other] = None
+                    sub_adj[other][node] = None
+
+        self._nx_node_dict = _copy_dict(sub_nodes)
+        self._nx_adjacency_dict = {}
+        for node, neighbors in sub_adj.iteritems():
+            self._nx_adjacency_dict[node] = None
+            self._nx_adj[node] = _copy_dict(neighbors)
+
+
+def _copy_dict(source):
+    """
+    Copy of a dictionary filled in its iteration order (as deepcopy does)
+    """
+    result = {}
+    for key in source:
+        result[key] = None
+    return result
 
 
 def _update_edge(graph, v1, v2, weight):
@@ -363,18 +923,52 @@ def _update_edge(graph, v1, v2, weight):
         graph[v1][v2]["weight"] += weight
 
 
-def _output_graph(graph, out_file):
+def _output_graph(bp_graph, fout):
+    """
+    Outputs breakpoint graph in dot format
+    """
+    fout.write("graph {\n")
+    for edge in bp_graph.iter_edges():
+        fout.write("{0} -- {1}".format(edge.node_1, edge.node_2))
+        data = {"genome_id" : edge.genome_id, "chr_name" : edge.chr_name,
+                "infinity" : edge.infinity}
+        if not edge.infinity:
+            data["start"], data["end"] = edge.start, edge.end
+        extra = list(map(lambda (k, v) : "{0}=\"{1}\"".format(k, v),
+                         data.items()))
+        fout.write(" [" + ", ".join(extra) + "]")
+        fout.write(";\n")
+    fout.write("}")
+
+
+def _genome_color(number):
+    """
+    Color for the given genome number in dot output. Genomes
+    beyond the fixed palette get evenly spread hues
+    """
+    if number < len(COLORS):
+        return COLORS[number]
+    hue = (number - len(COLORS)) * 0.618034 % 1
+    return "\"{0:.3f} 0.800 0.800\"".format(hue)
+
+
+def _pair_key(index_1, index_2, num_nodes):
+    """
+    Order-independent integer key for a pair of dense node indices
+    """
+    if index_1 > index_2:
+        index_1, index_2 = index_2, index_1
+    return index_1 * num_nodes + index_2
+
+
+def _intern(table, index, value):
     """
-    Outputs graph in dot format
+    Returns position of the value in a string table, adding it if necessary
     """
-    with open(out_file, "w") as fout:
-        fout.write("graph {\n")
-        for v1, v2, data in graph.edges_iter(data=True):
-            fout.write("{0} -- {1}".format(v1, v2))
-            if len(data):
-                extra = list(map(lambda (k, v) : "{0}=\"{1}\"".format(k, v),
-                                 data.items()))
-                fout.write(" [" + ", ".join(extra) + "]")
-            fout.write(";\n")
-        fout.write("}")
+    pos = index.get(value)
+    if pos is None:
+        pos = len(table)
+        index[value] = pos
+        table.append(value)
+    return pos
 
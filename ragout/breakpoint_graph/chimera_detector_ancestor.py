@@ -10,9 +10,10 @@ in input sequences and breaks them if neccesary
 from __future__ import print_function
 import logging
 from collections import defaultdict, namedtuple
-from copy import copy, deepcopy
+from copy import copy
 
 from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
+from ragout.shared.datatypes import Block
 
 logger = logging.getLogger()
 ContigBreak = namedtuple("ContigBreak", ["seq_name", "begin", "end", "good"])
@@ -31,9 +32,13 @@ class ChimeraDetector4Ancestor(object):
         """
         seq_cuts = defaultdict(lambda : defaultdict(list))
 
-        #extracting and grouping by sequence
+        #extracting and grouping by sequence. Cycle search results are
+        #shared between stages (the refine stage repeats most components
+        #of the last one) and dropped once all stages are processed
+        cycles_cache = {}
         for stage in self.run_stages:
-            breaks = self._get_contig_breaks(self.bp_graphs[stage])
+            breaks = self._get_contig_breaks(self.bp_graphs[stage],
+                                             cycles_cache)
             for br in breaks:
                 seq_cuts[br.seq_name][stage].append(br)
 
@@ -82,7 +87,7 @@ class ChimeraDetector4Ancestor(object):
                 cur_len = 0
         return max_pos + max_len / 2
 
-    def _get_contig_breaks(self, bp_graph):
+    def _get_contig_breaks(self, bp_graph, cycles_cache=None):
         """
         Detects chimeric adjacencies
         """
@@ -90,21 +95,20 @@ class ChimeraDetector4Ancestor(object):
 
         subgraphs = bp_graph.connected_components()
         for subgr in subgraphs:
-            if len(subgr.bp_graph) > 100:
+            if len(subgr) > 100:
                 logger.debug("Processing component of size {0}"
-                             .format(len(subgr.bp_graph)))
+                             .format(len(subgr)))
 
-            for (u, v, data) in subgr.bp_graph.edges_iter(data=True):
-                if data["genome_id"] != subgr.ancestor:
-                    continue
-
-                genomes = set(subgr.genomes_support(u, v))
-                if (genomes != set([bp_graph.ancestor])
+            genome_mask = subgr.genome_mask(bp_graph.ancestor)
+            for edge in subgr.genome_edges(subgr.ancestor):
+                u, v = edge.node_1, edge.node_2
+                genomes = subgr.genomes_mask(u, v)
+                if (genomes != genome_mask
                     and not subgr.is_infinity(u, v)):
                     continue
 
-                seq_name, start, end = data["chr_name"], data["start"], data["end"]
-                if subgr.alternating_cycle(u, v) is not None:
+                seq_name, start, end = edge.chr_name, edge.start, edge.end
+                if subgr.alternating_cycle(u, v, cycles_cache) is not None:
                     seq_cuts.append(ContigBreak(seq_name, start, end, True))
                     continue
 
@@ -113,59 +117,23 @@ class ChimeraDetector4Ancestor(object):
         #bp_graph.debug_output()
         return seq_cuts
 
-    def _valid_2break(self, bp_graph, red_edge):
-        """
-        Checks if there is a valid 2-break through the given red edge
-        """
-        assert len(bp_graph) == 4
-        red_1, red_2 = red_edge
-        cand_1, cand_2 = tuple(set(bp_graph.nodes()) - set(red_edge))
-        if abs(cand_1) == abs(cand_2):
-            return False
-
-        if bp_graph.has_edge(red_1, cand_1):
-            if not bp_graph.has_edge(red_2, cand_2):
-                return False
-            known_1 = red_1, cand_1
-            known_2 = red_2, cand_2
-        elif bp_graph.has_edge(red_1, cand_2):
-            if not bp_graph.has_edge(red_2, cand_1):
-                return False
-            known_1 = red_1, cand_2
-            known_2 = red_2, cand_1
-        else:
-            return False
-
-        chr_1 = {}
-        for data in bp_graph[known_1[0]][known_1[1]].values():
-            chr_1[data["genome_id"]] = data["chr_name"]
-        chr_2 = {}
-        for data in bp_graph[known_2[0]][known_2[1]].values():
-            chr_2[data["genome_id"]] = data["chr_name"]
-        common_genomes = set(chr_1.keys()).intersection(chr_2.keys())
-        for genome in common_genomes:
-            if chr_1[genome] != chr_2[genome]:
-                return False
-
-        return True
-
     def break_contigs(self, perm_container, block_sizes):
         """
         Breaks contigs in inferred cut positions
         """
-        new_container = deepcopy(perm_container)
+        new_container = copy(perm_container)
         new_ancestor_perms = []
         num_breaks = 0
         num_chimeras = 0
 
-        for perm in new_container.ancestor_perms:
+        for perm in perm_container.ancestor_perms:
             break_points = []
             for size in block_sizes:
                 break_points.extend(self.hierarchical_cuts[perm.chr_name][size])
             break_points = list(set(break_points))
             num_breaks += len(break_points)
             if not break_points:
-                new_ancestor_perms.append(perm)
+                new_ancestor_perms.append(perm.view())
             else:
                 num_chimeras += 1
                 new_ancestor_perms.extend(_break_permutation(perm, break_points))
@@ -177,23 +145,25 @@ class ChimeraDetector4Ancestor(object):
 
 
 def _break_permutation(permutation, break_points):
+    """
+    Cuts the permutation into pieces. Blocks of the pieces are
+    new objects, as their coordinates are shifted
+    """
     broken_perms = []
 
     cuts_stack = copy(sorted(break_points))
     cuts_stack.append(permutation.seq_len)
-    current_perm = deepcopy(permutation)
-    current_perm.blocks = []
+    current_perm = permutation.view([])
     shift = 0
 
     for block in permutation.blocks:
         if block.end <= cuts_stack[0]:
-            block.start -= shift
-            block.end -= shift
-            current_perm.blocks.append(block)
+            current_perm.blocks.append(Block(block.block_id, block.sign,
+                                             block.start - shift,
+                                             block.end - shift))
             continue
 
-        if block.start < cuts_stack[0]:
-            block.start = cuts_stack[0]
+        block_start = max(block.start, cuts_stack[0])
 
         #we have passed the current cut
         current_perm.seq_start = shift
@@ -204,10 +174,9 @@ def _break_permutation(permutation, break_points):
         shift = cuts_stack[0]
         cuts_stack.pop(0)
 
-        current_perm = deepcopy(permutation)
-        block.start -= shift
-        block.end -= shift
-        current_perm.blocks = [block]
+        current_perm = permutation.view([Block(block.block_id, block.sign,
+                                               block_start - shift,
+                                               block.end - shift)])
 
     current_perm.seq_start = shift
     current_perm.seq_end = cuts_stack[0]
@@ -8,13 +8,21 @@ by recovering perfect matching
 """
 
 from collections import namedtuple
-import logging
+from itertools import izip
 import os
+import logging
+import time
+import hashlib
+import multiprocessing
+import cPickle
 from copy import copy
 
 import networkx as nx
 
 from ragout.shared.debug import DebugConfig
+from ragout.shared.datatypes import GenomeRegistry
+from ragout.breakpoint_graph.matching import (max_weight_matching,
+                                              approx_max_weight_matching)
 
 logger = logging.getLogger()
 debugger = DebugConfig.get_instance()
@@ -23,12 +31,22 @@ Adjacency = namedtuple("Adjacency", ["block", "distance",
 
 
 class AdjacencyInferer(object):
-    def __init__(self, breakpoint_graph, phylogeny, ancestral = False):
+    def __init__(self, breakpoint_graph, phylogeny, ancestral = False,
+                 workers=1, warm_start=None, approx_matching_size=None):
+        """
+        warm_start - adjacencies inferred at the previous stage, mapped
+        to the current blocks (matching guesses, see _min_weight_matching)
+        approx_matching_size - components with more nodes are matched
+        approximately (None - always exact)
+        """
         self.main_graph = breakpoint_graph
         self.phylogeny = phylogeny
         self.ancestral = ancestral
+        self.workers = workers
+        self.warm_start = warm_start
+        self.approx_matching_size = approx_matching_size
 
-    def infer_adjacencies(self, debug=False, filename="adjacencies.txt"):
+    def infer_adjacencies(self, filename="adjacencies.txt"):
         """
         Infers missing adjacencies by recovering perfect matching
         """
@@ -38,13 +56,40 @@ class AdjacencyInferer(object):
         logger.debug("Found {0} connected components"
                              .format(len(subgraphs)))
 
+        MIN_LOG_SIZE = 20
         chosen_edges = []
-        self.orphans_count = 0
+        orphans_count = 0
+        trimmed_count = 0
+        total_time = 0.0
+        cache_hits = self.phylogeny.cache_hits
+        cache_misses = self.phylogeny.cache_misses
+        start = time.time()
+        for subgraph, (edges, orphans, trimmed, elapsed) in \
+                izip(subgraphs, self._component_results(subgraphs)):
+            chosen_edges.extend(edges)
+            orphans_count += orphans
+            trimmed_count += trimmed
+            total_time += elapsed
+            if len(subgraph) > MIN_LOG_SIZE:
+                logger.debug("Component of size {0} processed in {1:.3f}s"
+                             .format(len(subgraph), elapsed))
+        self.orphans_count = orphans_count
         self.guessed_count = 0
-        self.trimmed_count = 0
-        for subgraph in subgraphs:
-            chosen_edges.extend(self._process_component(subgraph))
-
+        self.trimmed_count = trimmed_count
+
+        logger.debug("Components processed in {0:.2f}s with {1} worker(s), "
+                     "{2:.2f}s in total".format(time.time() - start,
+                                               self.workers, total_time))
+        logger.debug("Solutions of {0} out of {1} components were "
+                     "cached ({2:.1f}% hit rate)"
+                     .format(self.cache_hits, len(subgraphs),
+                             _percent(self.cache_hits, len(subgraphs))))
+        cache_hits = self.phylogeny.cache_hits - cache_hits
+        cache_misses = self.phylogeny.cache_misses - cache_misses
+        logger.debug("Parsimony scores cache: {0} hits, {1} misses "
+                     "({2:.1f}% hit rate)".format(cache_hits, cache_misses,
+                                   _percent(cache_hits,
+                                            cache_hits + cache_misses)))
         logger.debug("Inferred {0} adjacencies".format(len(chosen_edges)))
         logger.debug("{0} orphaned nodes".format(self.orphans_count))
         logger.debug("{0} guessed edges".format(self.guessed_count))
@@ -53,13 +98,13 @@ class AdjacencyInferer(object):
         adjacencies = {}
         for node_1, node_2 in chosen_edges:
             distance = 0
-            supporting_genomes = []
+            supporting_genomes = frozenset()
             infinity = self.main_graph.is_infinity(node_1, node_2)
             if not infinity:
                 distance = self.main_graph.get_distance(node_1, node_2,
                                                         self.phylogeny)
-                supporting_genomes = self.main_graph \
-                                        .genomes_chrs_support(node_1, node_2)
+                supporting_genomes = frozenset(self.main_graph
+                                               .support_ids(node_1, node_2))
                 assert abs(node_1) != abs(node_2)
 
             adjacencies[node_1] = Adjacency(node_2, distance,
@@ -69,12 +114,105 @@ class AdjacencyInferer(object):
 
         self.main_graph.debug_output()
         self._debug_output(chosen_edges)
-        if debug:
-            fDebugger = open(filename, "w")
-            for block, adj in adjacencies.items():
-                fDebugger.write("%s -- %s -- %s\n" %(block, str(adj.block), ",".join([p.genome for p in adj.supporting_genomes])))
+        if debugger.output_enabled("adjacencies"):
+            with debugger.open(filename) as f:
+                _output_adjacencies(adjacencies, f)
         return adjacencies
 
+    def _component_results(self, subgraphs):
+        """
+        Yields results of _run_component in the order of components.
+        Components solved before (in previous stages or runs, see
+        SolutionCache) are not processed again
+        """
+        cache = SolutionCache.get_instance()
+        keys = [self._component_key(subgraph) for subgraph in subgraphs]
+        unsolved = [subgraph for subgraph, key in izip(subgraphs, keys)
+                    if key not in cache]
+        self.cache_hits = len(subgraphs) - len(unsolved)
+
+        solved = self._solve_components(unsolved)
+        for key in keys:
+            solution = cache.get(key)
+            if solution is not None:
+                edges, orphans, trimmed = solution
+                yield list(edges), orphans, trimmed, 0.0
+                continue
+            edges, orphans, trimmed, elapsed = next(solved)
+            cache.add(key, (edges, orphans, trimmed))
+            yield edges, orphans, trimmed, elapsed
+
+    def _component_key(self, subgraph):
+        """
+        Fingerprint of everything that the solution of a component
+        depends on: nodes and colored edges in the graph order,
+        genomes, phylogeny and matching mode. Components that may
+        be matched approximately (see _min_weight_matching) get
+        the size threshold into the key, so their solutions are
+        never reused by exact runs
+        """
+        approx_size = self.approx_matching_size
+        if approx_size is not None and len(subgraph) <= approx_size:
+            approx_size = None
+        return hashlib.md5(repr((subgraph.component_fingerprint(),
+                                 subgraph.nodes(), self.main_graph.references,
+                                 self.main_graph.ancestor, self.ancestral,
+                                 self.phylogeny.tree_string,
+                                 approx_size))).hexdigest()
+
+    def _solve_components(self, subgraphs):
+        """
+        Yields results of _run_component in the order of components.
+        With several workers, components are processed by a pool
+        of forked processes - since connected_components returns
+        the largest components first, they are scheduled first too.
+        Small components are sent in batches
+        """
+        MIN_BATCH_SIZE = 100
+        if self.workers < 2 or len(subgraphs) < 2:
+            for subgraph in subgraphs:
+                yield self._run_component(subgraph)
+            return
+
+        batches = [[]]
+        batch_size = 0
+        for index, subgraph in enumerate(subgraphs):
+            if batch_size >= MIN_BATCH_SIZE:
+                batches.append([])
+                batch_size = 0
+            batches[-1].append(index)
+            batch_size += len(subgraph)
+
+        pool = multiprocessing.Pool(min(self.workers, len(batches)),
+                                    initializer=_init_worker,
+                                    initargs=(self, subgraphs))
+        try:
+            for results, (hits, misses) in pool.imap(_run_worker_batch,
+                                                      batches):
+                #parsimony cache counters of the worker
+                self.phylogeny.cache_hits += hits
+                self.phylogeny.cache_misses += misses
+                for result in results:
+                    yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _run_component(self, subgraph):
+        """
+        Processes a component. Returns chosen edges, number of orphaned
+        nodes and trimmed edges and processing time
+        """
+        self.orphans_count = 0
+        self.trimmed_count = 0
+        start = time.time()
+        chosen_edges = self._process_component(subgraph)
+        return (chosen_edges, self.orphans_count, self.trimmed_count,
+                time.time() - start)
+
     def _process_component(self, subgraph):
         """
         Processes a connected component of the breakpoint graph
@@ -102,7 +240,9 @@ class AdjacencyInferer(object):
                     unused_nodes.remove(n)
                 continue
 
-            matching_edges = _min_weight_matching(trim_subgraph)
+            matching_edges = _min_weight_matching(trim_subgraph,
+                                                  self.warm_start,
+                                                  self.approx_matching_size)
 
             for edge in matching_edges:
                 for n in edge:
@@ -128,38 +268,124 @@ class AdjacencyInferer(object):
         Removes edges with known target adjacencies (red edges from paper)
         """
         trimmed_graph = graph.copy()
+        known_genome = (self.main_graph.ancestor if ancestral
+                        else self.main_graph.target)
+        known_mask = self.main_graph.genome_mask(known_genome)
         for v1, v2 in graph.edges_iter():
             if not trimmed_graph.has_node(v1) or not trimmed_graph.has_node(v2):
                 continue
 
-            genome_ids = set(self.main_graph.genomes_support(v1, v2))
-            if not ancestral:
-                if self.main_graph.target in genome_ids:
-                    for node in [v1, v2]:
-                        trimmed_graph.remove_node(node)
-                    self.trimmed_count += 1
-            else:
-                if self.main_graph.ancestor in genome_ids:
-                    for node in [v1,v2]:
-                        trimmed_graph.remove_node(node)
-                    self.trimmed_count += 1
+            if self.main_graph.genomes_mask(v1, v2) & known_mask:
+                for node in [v1, v2]:
+                    trimmed_graph.remove_node(node)
+                self.trimmed_count += 1
 
         return trimmed_graph
 
     def _debug_output(self, chosen_edges):
-        if not debugger.debugging:
+        if debugger.output_enabled("dot"):
+            with debugger.open("predicted_edges.dot") as f:
+                _output_edges(chosen_edges, f)
+        if debugger.output_enabled("adjacencies"):
+            with debugger.open("phylogeny.txt") as f:
+                _output_phylogeny(self.phylogeny.tree_string,
+                                  self.main_graph.target, f)
+
+
+class SolutionCache(object):
+    """
+    Singleton storing solutions of breakpoint graph components
+    (chosen edges, numbers of orphaned nodes and trimmed edges)
+    by component fingerprint. It is shared by all stages and
+    could be saved to disk to be reused by the next runs
+    """
+    instance = None
+
+    def __init__(self):
+        self.solutions = {}
+        self.filename = None
+        self.loaded = 0
+        self.hits = 0
+        self.misses = 0
+
+    def set_file(self, filename):
+        """
+        Loads solutions from the given file (if it exists),
+        save() writes them there
+        """
+        self.filename = filename
+        if not os.path.isfile(filename):
             return
+        try:
+            with open(filename, "rb") as f:
+                self.solutions.update(cPickle.load(f))
+        except (IOError, EOFError, cPickle.UnpicklingError) as e:
+            logger.warning("Can't read solutions cache: {0}".format(e))
+            return
+        self.loaded = len(self.solutions)
+        logger.debug("Loaded {0} cached component solutions"
+                     .format(self.loaded))
+
+    def save(self):
+        if self.filename is None:
+            return
+        logger.debug("Component solutions cache: {0} hits, {1} misses "
+                     "({2:.1f}% hit rate)".format(self.hits, self.misses,
+                                   _percent(self.hits, self.hits + self.misses)))
+        if not self.misses:
+            return
+        try:
+            with open(self.filename, "wb") as f:
+                cPickle.dump(self.solutions, f, cPickle.HIGHEST_PROTOCOL)
+        except IOError as e:
+            logger.warning("Can't write solutions cache: {0}".format(e))
+
+    def __contains__(self, key):
+        return key in self.solutions
+
+    def get(self, key):
+        solution = self.solutions.get(key)
+        if solution is not None:
+            self.hits += 1
+        return solution
 
-        phylo_out = os.path.join(debugger.debug_dir, "phylogeny.txt")
-        edges_out = os.path.join(debugger.debug_dir, "predicted_edges.dot")
-        _output_edges(chosen_edges, edges_out)
-        _output_phylogeny(self.phylogeny.tree_string, self.main_graph.target,
-                          phylo_out)
+    def add(self, key, solution):
+        self.misses += 1
+        self.solutions[key] = solution
 
+    @staticmethod
+    def get_instance():
+        if not SolutionCache.instance:
+            SolutionCache.instance = SolutionCache()
+        return SolutionCache.instance
 
-def _min_weight_matching(graph):
+
+def _percent(part, total):
+    return 100.0 * part / total if total else 0.0
+
+
+#inferer and components of a worker process (see _component_results)
+_worker_job = None
+
+def _init_worker(inferer, subgraphs):
+    global _worker_job
+    _worker_job = (inferer, subgraphs)
+
+
+def _run_worker_batch(indices):
+    inferer, subgraphs = _worker_job
+    hits = inferer.phylogeny.cache_hits
+    misses = inferer.phylogeny.cache_misses
+    results = [inferer._run_component(subgraphs[i]) for i in indices]
+    return results, (inferer.phylogeny.cache_hits - hits,
+                     inferer.phylogeny.cache_misses - misses)
+
+
+def _min_weight_matching(graph, warm_start=None, approx_size=None):
     """
-    Finds a perfect matching with minimum weight
+    Finds a perfect matching with minimum weight. Adjacencies
+    from warm_start are tried first (see max_weight_matching).
+    Graphs with more than approx_size nodes are matched approximately
     """
     for v1, v2 in graph.edges_iter():
         graph[v1][v2]["weight"] = -graph[v1][v2]["weight"] #want minimum weght
@@ -168,7 +394,19 @@ def _min_weight_matching(graph):
     if len(graph) > MIN_LOG_SIZE:
         logger.debug("Finding perfect matching for a component of "
                      "size {0}".format(len(graph)))
-    edges = nx.max_weight_matching(graph, maxcardinality=True)
+    if approx_size is not None and len(graph) > approx_size:
+        edges, bound = approx_max_weight_matching(graph)
+        weight = sum(graph[v1][v2]["weight"] for v1, v2 in edges.items()) / 2
+        logger.debug("Approximate matching for a component of size {0}: "
+                     "cost {1}, lower bound {2}, gap {3}"
+                     .format(len(graph), -weight, -bound, bound - weight))
+    else:
+        initial = None
+        if warm_start:
+            initial = dict((node, warm_start[node].block) for node in graph
+                           if node in warm_start)
+        edges = max_weight_matching(graph, maxcardinality=True,
+                                    initial=initial)
     unique_edges = set()
     for v1, v2 in edges.items():
         if not (v2, v1) in unique_edges:
@@ -177,21 +415,31 @@ def _min_weight_matching(graph):
     return list(unique_edges)
 
 
-def _output_edges(edges, out_file):
+def _output_edges(edges, fout):
     """
     Outputs list of edges in dot format
     """
-    with open(out_file, "w") as fout:
-        fout.write("graph {\n")
-        for (v1, v2) in edges:
-            fout.write("{0} -- {1};\n".format(v1, v2))
-        fout.write("}")
+    fout.write("graph {\n")
+    for (v1, v2) in edges:
+        fout.write("{0} -- {1};\n".format(v1, v2))
+    fout.write("}")
 
 
-def _output_phylogeny(tree_string, target_name, out_file):
+def _output_phylogeny(tree_string, target_name, fout):
     """
     Outputs phylogenetic tree in plain text
     """
-    with open(out_file, "w") as fout:
-        fout.write(tree_string + "\n")
-        fout.write(target_name)
+    fout.write(tree_string + "\n")
+    fout.write(target_name)
+
+
+def _output_adjacencies(adjacencies, fout):
+    """
+    Outputs inferred adjacencies with supporting genomes
+    """
+    registry = GenomeRegistry.get_instance()
+    for block, adj in adjacencies.items():
+        genomes = [p.genome for p in
+                   registry.id_pairs(adj.supporting_genomes)]
+        fout.write("{0} -- {1} -- {2}\n".format(block, adj.block,
+                                                ",".join(genomes)))
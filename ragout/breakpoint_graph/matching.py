@@ -0,0 +1,827 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+This module implements maximum weight matching algorithms
+for adjacency inference and repeat resolution. Graphs are
+converted into integer-indexed adjacency lists, the blossom
+algorithm follows networkx.max_weight_matching (and visits
+nodes in the same order). Results are the same, except for
+ties resolved inside blossoms, which networkx orders arbitrarily
+"""
+
+from itertools import repeat
+
+
+def max_weight_matching(graph, maxcardinality=False, initial=None):
+    """
+    Computes a maximum weight matching of networkx graph. If maxcardinality
+    is set, the matching is chosen among maximum cardinality matchings.
+    Returns a dictionary mate (mate[v] == w if v is matched to w)
+    as networkx.max_weight_matching does. An initial guess (a dictionary
+    mate, possibly partial) is used as the result if it is certainly
+    the only optimal matching, otherwise it is ignored
+    """
+    nodes = graph.nodes()
+    if not nodes:
+        return {}
+
+    num_nodes = len(nodes)
+    index = dict((node, i) for i, node in enumerate(nodes))
+    neighbors = []
+    weights = {}
+    for i, node in enumerate(nodes):
+        node_neighbors = []
+        for other, data in graph.adj[node].iteritems():
+            j = index[other]
+            if j == i:
+                continue
+            node_neighbors.append(j)
+            weights[i * num_nodes + j] = data.get("weight", 1)
+        neighbors.append(node_neighbors)
+
+    mate = None
+    if maxcardinality:
+        mate = _forced_perfect_matching(neighbors)
+    if mate is None and maxcardinality and initial:
+        guess = [index.get(initial.get(node), -1) for node in nodes]
+        mate = _unique_perfect_matching(neighbors, weights, guess)
+    if mate is None:
+        #blossom algorithm visits vertices (and delta3 candidates)
+        #in the order of networkx data structures
+        vertex_order = [index[v] for v in dict(zip(nodes, repeat(None)))]
+        mate = _blossom_matching(neighbors, weights, vertex_order,
+                                 maxcardinality)
+
+    return dict((nodes[v], nodes[w]) for v, w in enumerate(mate) if w >= 0)
+
+
+def max_weight_bipartite_matching(graph, left_nodes):
+    """
+    Maximum weight matching among maximum cardinality matchings
+    of a bipartite networkx graph (left_nodes is one of the parts).
+    Solved as an assignment problem. Returns a dictionary mate
+    """
+    left = [n for n in graph.nodes() if n in left_nodes]
+    right = [n for n in graph.nodes() if n not in left_nodes]
+    if not left or not right:
+        return {}
+
+    transpose = len(left) > len(right)
+    if transpose:
+        left, right = right, left
+    right_index = dict((node, j) for j, node in enumerate(right))
+
+    #every real edge gets a bonus which is larger than the weight
+    #difference of any two matchings - this way the larger matching
+    #is always preferred
+    total_weight = 0
+    for u, v, data in graph.edges_iter(data=True):
+        total_weight += abs(data.get("weight", 1))
+    bonus = 2 * total_weight + 1
+
+    costs = []
+    for node in left:
+        row = [0] * len(right)
+        for other, data in graph.adj[node].iteritems():
+            row[right_index[other]] = -(data.get("weight", 1) + bonus)
+        costs.append(row)
+
+    mate = {}
+    for i, j in enumerate(_solve_assignment(costs)):
+        if costs[i][j] == 0:
+            continue
+        mate[left[i]] = right[j]
+        mate[right[j]] = left[i]
+    return mate
+
+
+def approx_max_weight_matching(graph, max_passes=10, max_cycle=8):
+    """
+    Approximate maximum weight matching among maximum cardinality
+    matchings: a greedy matching (heaviest edges first) is extended with
+    augmenting paths and then improved by local search - exchanges of
+    matched edges for edges to single vertices and rotations of
+    alternating cycles with up to max_cycle matched edges.
+    Returns a dictionary mate and an upper bound for the weight
+    of the exact solution
+    """
+    EPS = 1e-12
+    nodes = graph.nodes()
+    num_nodes = len(nodes)
+    index = dict((node, i) for i, node in enumerate(nodes))
+    neighbors = [[] for _ in xrange(num_nodes)]
+    weights = {}
+    edges = []
+    for u, v, data in graph.edges_iter(data=True):
+        i, j = index[u], index[v]
+        if i == j:
+            continue
+        weight = data.get("weight", 1)
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+        weights[i * num_nodes + j] = weights[j * num_nodes + i] = weight
+        edges.append((-weight, min(i, j), max(i, j)))
+
+    def weight(i, j):
+        return weights[i * num_nodes + j]
+
+    #heaviest edges are tried first everywhere
+    for v in xrange(num_nodes):
+        neighbors[v].sort(key=lambda w: -weight(v, w))
+
+    mate = [-1] * num_nodes
+    for _weight, i, j in sorted(edges):
+        if mate[i] < 0 and mate[j] < 0:
+            mate[i], mate[j] = j, i
+
+    for u in xrange(num_nodes):
+        if mate[u] < 0:
+            _augment(u, neighbors, mate)
+
+    for _ in xrange(max_passes):
+        improved = False
+        #exchanging v = w for u - v
+        for u in xrange(num_nodes):
+            if mate[u] >= 0:
+                continue
+            best = None
+            for v in neighbors[u]:
+                if mate[v] < 0:
+                    best = (None, v)
+                    break
+                gain = weight(u, v) - weight(v, mate[v])
+                if gain > EPS and (best is None or gain > best[0]):
+                    best = (gain, v)
+            if best is not None:
+                _gain, v = best
+                if mate[v] >= 0:
+                    mate[mate[v]] = -1
+                mate[u], mate[v] = v, u
+                improved = True
+
+        #rotating short alternating cycles
+        for a in xrange(num_nodes):
+            if (mate[a] >= 0 and
+                    _improve_cycle(a, neighbors, weights, mate, max_cycle)):
+                improved = True
+
+        if not improved:
+            break
+
+    #any matching of k edges weights at most half of the sum of 2k
+    #largest "best incident edge" values (with k at least as large
+    #as the cardinality found)
+    best_incident = sorted((weight(v, neighbors[v][0])
+                            for v in xrange(num_nodes) if neighbors[v]),
+                           reverse=True)
+    cardinality = sum(1 for v in mate if v >= 0) / 2
+    prefix = sum(best_incident[:2 * cardinality])
+    bound = prefix
+    for value in best_incident[2 * cardinality:]:
+        prefix += value
+        bound = max(bound, prefix)
+    bound /= 2.0
+
+    return (dict((nodes[v], nodes[w]) for v, w in enumerate(mate) if w >= 0),
+            bound)
+
+
+def _improve_cycle(root, neighbors, weights, mate, max_length):
+    """
+    Looks for an alternating cycle through the matched edge of the
+    given vertex that increases matching weight if rotated. Cycles
+    contain up to max_length matched edges, partial gains are
+    kept positive (as in Lin-Kernighan heuristic)
+    """
+    EPS = 1e-12
+    num_nodes = len(neighbors)
+    first = mate[root]
+    visited = set([root, first])
+    #stack of (vertex, next neighbor position, gain, depth)
+    stack = [(first, 0, -weights[root * num_nodes + first], 1)]
+    path = [(root, first)]
+    while stack:
+        u, pos, gain, depth = stack.pop()
+        if pos >= len(neighbors[u]):
+            path.pop()
+            continue
+        stack.append((u, pos + 1, gain, depth))
+        v = neighbors[u][pos]
+        if v in visited or mate[v] < 0:
+            continue
+        w = mate[v]
+        partial_gain = gain + weights[u * num_nodes + v]
+        if partial_gain <= EPS:
+            continue
+        new_gain = partial_gain - weights[v * num_nodes + w]
+        closing = w * num_nodes + root
+        if closing in weights and new_gain + weights[closing] > EPS:
+            path.append((v, w))
+            #matched edges become (first, v1), (w1, v2), ..., (wk, root)
+            cycle = [x for edge in path for x in edge][1:] + [root]
+            for x, y in zip(cycle[::2], cycle[1::2]):
+                mate[x], mate[y] = y, x
+            return True
+        if depth < max_length:
+            visited.add(v)
+            visited.add(w)
+            path.append((v, w))
+            stack.append((w, 0, new_gain, depth + 1))
+    return False
+
+
+def _augment(root, neighbors, mate, max_depth=100):
+    """
+    Depth-first search for an augmenting path starting from
+    a single vertex. Blossoms are not contracted, so some
+    paths may be missed
+    """
+    visited = set([root])
+    #stack of (vertex, next neighbor position)
+    stack = [(root, 0)]
+    path = []
+    while stack:
+        u, pos = stack.pop()
+        if pos >= len(neighbors[u]):
+            if path:
+                path.pop()
+            continue
+        stack.append((u, pos + 1))
+        v = neighbors[u][pos]
+        if v in visited:
+            continue
+        visited.add(v)
+        if mate[v] < 0:
+            path.append((u, v))
+            for x, y in path:
+                mate[x], mate[y] = y, x
+            return True
+        if len(path) >= max_depth:
+            continue
+        w = mate[v]
+        visited.add(w)
+        path.append((u, v))
+        stack.append((w, 0))
+    return False
+
+
+def _unique_perfect_matching(neighbors, weights, mate):
+    """
+    Checks if the given perfect matching is the only maximum weight
+    one. It is if there are vertex potentials y such that y[u] + y[v]
+    equals the weight of every matched edge and exceeds the weight of
+    every other edge (then any other perfect matching is lighter).
+    Potentials of the ends of a matched edge depend on a single
+    variable, so the constraints have two variables each and are
+    solved as shortest paths (Bellman-Ford). The search gives up after
+    a few passes, as the matching is recomputed anyway if it fails.
+    Returns the matching or None
+    """
+    EPS = 1e-9
+    MAX_PASSES = 10
+    num_nodes = len(neighbors)
+    #matched edge k = (v, mate[v]), v < mate[v] gives a variable t_k:
+    #y[v] = t_k, y[mate[v]] = weight - t_k. Vertex v refers to the
+    #shortest path node 2 * k (+t_k) or 2 * k + 1 (-t_k) and a shift
+    path_node = [0] * num_nodes
+    shift = [0] * num_nodes
+    num_vars = 0
+    for v in xrange(num_nodes):
+        w = mate[v]
+        if w < 0 or mate[w] != v or v * num_nodes + w not in weights:
+            return None
+        if v < w:
+            path_node[v] = 2 * num_vars
+            path_node[w] = 2 * num_vars + 1
+            shift[w] = weights[v * num_nodes + w]
+            num_vars += 1
+
+    #y[a] + y[b] > weight(a, b) for unmatched edges gives
+    #-x - y <= shift[a] + shift[b] - weight(a, b) - EPS for the
+    #path nodes x, y of a, b. Node pairs 2k, 2k + 1 are opposite
+    constraints = []
+    for a in xrange(num_nodes):
+        for b in neighbors[a]:
+            if a < b and mate[a] != b:
+                bound = shift[a] + shift[b] - weights[a * num_nodes + b] - EPS
+                x, y = path_node[a], path_node[b]
+                constraints.append((y, x ^ 1, bound))
+                constraints.append((x, y ^ 1, bound))
+
+    distance = [0] * (2 * num_vars)
+    for _ in xrange(min(2 * num_vars + 1, MAX_PASSES)):
+        updated = False
+        for src, dst, length in constraints:
+            if distance[src] + length < distance[dst]:
+                distance[dst] = distance[src] + length
+                updated = True
+        if not updated:
+            break
+    else:
+        return None     #negative cycle (no potentials) or too long paths
+
+    potentials = [0] * num_nodes
+    for v in xrange(num_nodes):
+        k = path_node[v] & ~1
+        value = (distance[k] - distance[k + 1]) / 2.0
+        potentials[v] = (value if path_node[v] == k else
+                         shift[v] - value)
+    for a in xrange(num_nodes):
+        for b in neighbors[a]:
+            if (mate[a] != b and potentials[a] + potentials[b] <=
+                                 weights[a * num_nodes + b]):
+                return None
+    return mate
+
+
+def _forced_perfect_matching(neighbors):
+    """
+    Matches vertices of degree one with their only neighbors as long
+    as possible. If that results in a perfect matching, it is the
+    only maximum cardinality matching (this is the case for trees
+    and paths with perfect matchings). Returns None otherwise
+    """
+    num_nodes = len(neighbors)
+    if num_nodes % 2:
+        return None
+
+    mate = [-1] * num_nodes
+    degree = [len(adj) for adj in neighbors]
+    leaves = [v for v in xrange(num_nodes) if degree[v] == 1]
+    matched = 0
+    while leaves:
+        v = leaves.pop()
+        if mate[v] >= 0:
+            continue
+        partner = -1
+        for w in neighbors[v]:
+            if mate[w] < 0:
+                partner = w
+                break
+        if partner < 0:
+            return None
+
+        mate[v], mate[partner] = partner, v
+        matched += 2
+        for w in neighbors[partner]:
+            if mate[w] >= 0:
+                continue
+            degree[w] -= 1
+            if degree[w] == 1:
+                leaves.append(w)
+            elif degree[w] == 0:
+                return None
+
+    if matched != num_nodes:
+        return None
+    return mate
+
+
+def _solve_assignment(costs):
+    """
+    Minimum cost assignment of rows to distinct columns
+    (rows <= columns), shortest augmenting path method with potentials.
+    Returns the assigned column of every row
+    """
+    INF = float("inf")
+    num_rows, num_cols = len(costs), len(costs[0])
+    row_pot = [0] * (num_rows + 1)
+    col_pot = [0] * (num_cols + 1)
+    #col_row[j] is the row assigned to column j (1-based, 0 is free)
+    col_row = [0] * (num_cols + 1)
+    way = [0] * (num_cols + 1)
+    for row in xrange(1, num_rows + 1):
+        col_row[0] = row
+        cur_col = 0
+        min_slack = [INF] * (num_cols + 1)
+        used = [False] * (num_cols + 1)
+        while True:
+            used[cur_col] = True
+            cur_row = col_row[cur_col]
+            row_costs = costs[cur_row - 1]
+            delta = INF
+            next_col = 0
+            for j in xrange(1, num_cols + 1):
+                if used[j]:
+                    continue
+                cur = row_costs[j - 1] - row_pot[cur_row] - col_pot[j]
+                if cur < min_slack[j]:
+                    min_slack[j] = cur
+                    way[j] = cur_col
+                if min_slack[j] < delta:
+                    delta = min_slack[j]
+                    next_col = j
+            for j in xrange(num_cols + 1):
+                if used[j]:
+                    row_pot[col_row[j]] += delta
+                    col_pot[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            cur_col = next_col
+            if col_row[cur_col] == 0:
+                break
+
+        while cur_col:
+            prev_col = way[cur_col]
+            col_row[cur_col] = col_row[prev_col]
+            cur_col = prev_col
+
+    assignment = [0] * num_rows
+    for j in xrange(1, num_cols + 1):
+        if col_row[j]:
+            assignment[col_row[j] - 1] = j - 1
+    return assignment
+
+
+def _blossom_matching(neighbors, weights, vertex_order, maxcardinality):
+    """
+    Primal-dual blossom algorithm (Galil, 1986) on integer vertices.
+    This is networkx.max_weight_matching with dictionaries replaced by
+    lists: vertices are 0..n-1, non-trivial blossoms get ids n..2n-1.
+    See the networkx code for a detailed explanation.
+    Returns mate list (-1 for single vertices)
+    """
+    num_nodes = len(neighbors)
+    maxweight = 0
+    allinteger = True
+    for weight in weights.itervalues():
+        if weight > maxweight:
+            maxweight = weight
+        allinteger = allinteger and isinstance(weight, (int, long))
+
+    mate = [-1] * num_nodes
+    label = [None] * (2 * num_nodes)
+    labeledge = [None] * (2 * num_nodes)
+    inblossom = range(num_nodes)
+    blossomparent = [None] * (2 * num_nodes)
+    blossombase = range(num_nodes) + [None] * num_nodes
+    blossomchilds = [None] * (2 * num_nodes)
+    blossomedges = [None] * (2 * num_nodes)
+    mybestedges = [None] * (2 * num_nodes)
+    bestedge = [None] * (2 * num_nodes)
+    dualvar = [maxweight] * num_nodes
+    blossomdual = [0] * (2 * num_nodes)
+    unusedblossoms = range(2 * num_nodes - 1, num_nodes - 1, -1)
+    allowedge = set()
+    queue = []
+
+    def blossoms():
+        return [b for b in xrange(num_nodes, 2 * num_nodes)
+                if blossombase[b] is not None]
+
+    def leaves(b):
+        if b < num_nodes:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                for v in leaves(t):
+                    yield v
+
+    def slack(v, w):
+        return dualvar[v] + dualvar[w] - 2 * weights[v * num_nodes + w]
+
+    def allow(v, w):
+        allowedge.add(v * num_nodes + w)
+        allowedge.add(w * num_nodes + v)
+
+    def assignLabel(w, t, v):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        if v is not None:
+            labeledge[w] = labeledge[b] = (v, w)
+        else:
+            labeledge[w] = labeledge[b] = None
+        bestedge[w] = bestedge[b] = None
+        if t == 1:
+            queue.extend(leaves(b))
+        elif t == 2:
+            base = blossombase[b]
+            assignLabel(mate[base], 1, base)
+
+    def scanBlossom(v, w):
+        path = []
+        base = None
+        while v is not None:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labeledge[b] is None:
+                v = None
+            else:
+                v = labeledge[b][0]
+                b = inblossom[v]
+                v = labeledge[b][0]
+            if w is not None:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def addBlossom(base, v, w):
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = None
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomedges[b] = edgs = [(v, w)]
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            edgs.append(labeledge[bv])
+            v = labeledge[bv][0]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        edgs.reverse()
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            edgs.append((labeledge[bw][1], labeledge[bw][0]))
+            w = labeledge[bw][0]
+            bw = inblossom[w]
+        label[b] = 1
+        labeledge[b] = labeledge[bb]
+        blossomdual[b] = 0
+        for v in leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+
+        bestedgeto = {}
+        for bv in path:
+            if bv >= num_nodes:
+                if mybestedges[bv] is not None:
+                    nblist = mybestedges[bv]
+                    mybestedges[bv] = None
+                else:
+                    nblist = [(v, w) for v in leaves(bv)
+                              for w in neighbors[v]]
+            else:
+                nblist = [(bv, w) for w in neighbors[bv]]
+            for k in nblist:
+                (i, j) = k
+                if inblossom[j] == b:
+                    i, j = j, i
+                bj = inblossom[j]
+                if (bj != b and label[bj] == 1 and
+                    ((bj not in bestedgeto) or
+                     slack(i, j) < slack(*bestedgeto[bj]))):
+                    bestedgeto[bj] = k
+            bestedge[bv] = None
+        mybestedges[b] = list(bestedgeto.values())
+        mybestedge = None
+        for k in mybestedges[b]:
+            kslack = slack(*k)
+            if mybestedge is None or kslack < mybestslack:
+                mybestedge = k
+                mybestslack = kslack
+        bestedge[b] = mybestedge
+
+    def expandBlossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = None
+            if s >= num_nodes:
+                if endstage and blossomdual[s] == 0:
+                    expandBlossom(s, endstage)
+                else:
+                    for v in leaves(s):
+                        inblossom[v] = s
+            else:
+                inblossom[s] = s
+        if (not endstage) and label[b] == 2:
+            childs = blossomchilds[b]
+            edges = blossomedges[b]
+            entrychild = inblossom[labeledge[b][1]]
+            j = childs.index(entrychild)
+            if j & 1:
+                j -= len(childs)
+                jstep = 1
+            else:
+                jstep = -1
+            v, w = labeledge[b]
+            while j != 0:
+                if jstep == 1:
+                    p, q = edges[j]
+                else:
+                    q, p = edges[j - 1]
+                label[w] = None
+                label[q] = None
+                assignLabel(w, 2, v)
+                allow(p, q)
+                j += jstep
+                if jstep == 1:
+                    v, w = edges[j]
+                else:
+                    w, v = edges[j - 1]
+                allow(v, w)
+                j += jstep
+            bw = childs[j]
+            label[w] = label[bw] = 2
+            labeledge[w] = labeledge[bw] = (v, w)
+            bestedge[bw] = None
+            j += jstep
+            while childs[j] != entrychild:
+                bv = childs[j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                if bv >= num_nodes:
+                    for v in leaves(bv):
+                        if label[v]:
+                            break
+                else:
+                    v = bv
+                if label[v]:
+                    label[v] = None
+                    label[mate[blossombase[bv]]] = None
+                    assignLabel(v, 2, labeledge[v][0])
+                j += jstep
+        label[b] = None
+        labeledge[b] = None
+        bestedge[b] = None
+        mybestedges[b] = None
+        blossomparent[b] = None
+        blossombase[b] = None
+        blossomchilds[b] = None
+        blossomedges[b] = None
+        blossomdual[b] = 0
+        unusedblossoms.append(b)
+
+    def augmentBlossom(b, v):
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= num_nodes:
+            augmentBlossom(t, v)
+        childs = blossomchilds[b]
+        edges = blossomedges[b]
+        i = j = childs.index(t)
+        if i & 1:
+            j -= len(childs)
+            jstep = 1
+        else:
+            jstep = -1
+        while j != 0:
+            j += jstep
+            t = childs[j]
+            if jstep == 1:
+                w, x = edges[j]
+            else:
+                x, w = edges[j - 1]
+            if t >= num_nodes:
+                augmentBlossom(t, w)
+            j += jstep
+            t = childs[j]
+            if t >= num_nodes:
+                augmentBlossom(t, x)
+            mate[w] = x
+            mate[x] = w
+        blossomchilds[b] = childs[i:] + childs[:i]
+        blossomedges[b] = edges[i:] + edges[:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augmentMatching(v, w):
+        for (s, j) in ((v, w), (w, v)):
+            while True:
+                bs = inblossom[s]
+                if bs >= num_nodes:
+                    augmentBlossom(bs, s)
+                mate[s] = j
+                if labeledge[bs] is None:
+                    break
+                t = labeledge[bs][0]
+                bt = inblossom[t]
+                s, j = labeledge[bt]
+                if bt >= num_nodes:
+                    augmentBlossom(bt, j)
+                mate[j] = s
+
+    while True:
+        #a stage: finding an augmenting path
+        for b in xrange(2 * num_nodes):
+            label[b] = labeledge[b] = bestedge[b] = None
+        for b in blossoms():
+            mybestedges[b] = None
+        allowedge.clear()
+        del queue[:]
+
+        for v in xrange(num_nodes):
+            if mate[v] < 0 and label[inblossom[v]] is None:
+                assignLabel(v, 1, None)
+
+        augmented = False
+        while True:
+            #a substage
+            while queue and not augmented:
+                v = queue.pop()
+                for w in neighbors[v]:
+                    bv = inblossom[v]
+                    bw = inblossom[w]
+                    if bv == bw:
+                        continue
+                    if v * num_nodes + w not in allowedge:
+                        kslack = slack(v, w)
+                        if kslack <= 0:
+                            allow(v, w)
+                    if v * num_nodes + w in allowedge:
+                        if label[bw] is None:
+                            assignLabel(w, 2, v)
+                        elif label[bw] == 1:
+                            base = scanBlossom(v, w)
+                            if base is not None:
+                                addBlossom(base, v, w)
+                            else:
+                                augmentMatching(v, w)
+                                augmented = True
+                                break
+                        elif label[w] is None:
+                            label[w] = 2
+                            labeledge[w] = (v, w)
+                    elif label[bw] == 1:
+                        if bestedge[bv] is None or kslack < slack(*bestedge[bv]):
+                            bestedge[bv] = (v, w)
+                    elif label[w] is None:
+                        if bestedge[w] is None or kslack < slack(*bestedge[w]):
+                            bestedge[w] = (v, w)
+
+            if augmented:
+                break
+
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+
+            if not maxcardinality:
+                deltatype = 1
+                delta = min(dualvar)
+
+            for v in xrange(num_nodes):
+                if label[inblossom[v]] is None and bestedge[v] is not None:
+                    d = slack(*bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+
+            top_blossoms = blossoms()
+            for b in vertex_order + top_blossoms:
+                if (blossomparent[b] is None and label[b] == 1 and
+                        bestedge[b] is not None):
+                    kslack = slack(*bestedge[b])
+                    d = kslack // 2 if allinteger else kslack / 2.0
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+
+            for b in top_blossoms:
+                if (blossomparent[b] is None and label[b] == 2 and
+                        (deltatype == -1 or blossomdual[b] < delta)):
+                    delta = blossomdual[b]
+                    deltatype = 4
+                    deltablossom = b
+
+            if deltatype == -1:
+                deltatype = 1
+                delta = max(0, min(dualvar))
+
+            for v in xrange(num_nodes):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in top_blossoms:
+                if blossomparent[b] is None:
+                    if label[b] == 1:
+                        blossomdual[b] += delta
+                    elif label[b] == 2:
+                        blossomdual[b] -= delta
+
+            if deltatype == 1:
+                break
+            elif deltatype == 2 or deltatype == 3:
+                (v, w) = deltaedge
+                allow(v, w)
+                queue.append(v)
+            elif deltatype == 4:
+                expandBlossom(deltablossom, False)
+
+        if not augmented:
+            break
+
+        #end of a stage: expanding S-blossoms with zero dual
+        for b in blossoms():
+            if blossombase[b] is None:
+                continue
+            if (blossomparent[b] is None and label[b] == 1 and
+                    blossomdual[b] == 0):
+                expandBlossom(b, True)
+
+    return mate
@@ -9,15 +9,17 @@ provides some other usefull functions
 """
 
 from collections import defaultdict
+from array import array
 import logging
-import os
 import math
-from copy import deepcopy
+import os
+import struct
+import sys
 from itertools import chain
 
 from ragout.shared.debug import DebugConfig
 from ragout.shared import config
-from ragout.shared.datatypes import Block, Permutation, output_permutations
+from ragout.shared.datatypes import Block, Permutation, write_permutations
 import ragout.breakpoint_graph.repeat_resolver as rr
 
 logger = logging.getLogger()
@@ -40,7 +42,8 @@ class PermutationContainer:
         self.recipe = recipe
 
         logging.debug("Reading permutation file")
-        permutations = _parse_blocks_coords(block_coords_file)
+        columns = _shared_blocks_coords(block_coords_file)
+        permutations = columns.permutations()
         if not permutations:
             raise PermException("Error reading permutations")
 
@@ -64,7 +67,9 @@ class PermutationContainer:
             if genome not in has_sequences:
                 raise PermException("No sequences read for genome {0}. Check "
                                     "recipe for correctness.".format(genome))
-        _check_coverage(self.ref_perms + self.target_perms)
+        ref_target_genomes = set(recipe["references"] + [recipe["target"]])
+        ancestor_genomes = set(recipe["genomes"]) - ref_target_genomes
+        _check_coverage(columns, ref_target_genomes)
 
         logger.debug("Read {0} reference sequences"
                      .format(len(self.ref_perms)))
@@ -81,12 +86,14 @@ class PermutationContainer:
         """if not len(self.ancestor_perms):
             raise PermException("No synteny blocks found in "
                                 "ancestor sequences")"""
-        self._filter_indels(allow_ref_indels)
+        to_keep = self._filter_indels(allow_ref_indels)
         logger.debug("{0} target sequences left after indel filtering"
                                         .format(len(self.target_perms)))
 
-        repeats = _find_repeats(self.ref_perms + self.target_perms)
-        ancs_repeats = _find_repeats(self.ancestor_perms)
+        #indel filtering removes whole blocks, so it does not change
+        #which of the kept blocks are repetitive
+        repeats = _find_repeats(columns, ref_target_genomes) & to_keep
+        ancs_repeats = _find_repeats(columns, ancestor_genomes) & to_keep
         ###
         if resolve_repeats:
             if phylogeny is None:
@@ -105,14 +112,15 @@ class PermutationContainer:
         logger.debug("{0} target sequences left after repeat filtering"
                      .format(len(self.target_perms)))
 
-        if debugger.debugging:
-            file = os.path.join(debugger.debug_dir, "filtered_contigs.txt")
-            output_permutations(self.target_perms, file)
+        if debugger.output_enabled("links"):
+            with debugger.open("filtered_contigs.txt") as f:
+                write_permutations(self.target_perms, f)
 
     def _filter_indels(self, allow_ref_indels):
         """
         Keep only blocks that appear in target and
-        all references (or one reference, if allow_ref_indels is set)
+        all references (or one reference, if allow_ref_indels is set).
+        Returns the set of kept blocks
         """
         multiplicity = defaultdict(int)
         target_blocks = set()
@@ -137,6 +145,7 @@ class PermutationContainer:
         self.ref_perms = _filter_permutations(self.ref_perms, to_keep)
         self.target_perms = _filter_permutations(self.target_perms, to_keep)
         self.ancestor_perms = _filter_permutations(self.ancestor_perms, to_keep)
+        return to_keep
 
     def _filter_repeats(self, repeats, ancestral = False):
         """
@@ -152,18 +161,22 @@ class PermutationContainer:
                                         inverse=True)
 
 
-def _find_repeats(permutations):
+def _find_repeats(columns, genomes):
     """
-    Returns a set of repetitive blocks
+    Returns a set of blocks that are repeated within
+    any of the given genomes
     """
-    index = defaultdict(set)
     repeats = set()
-    for perm in permutations:
-        for block in perm.blocks:
-            if perm.genome_name in index[block.block_id]:
-                repeats.add(block.block_id)
-            else:
-                index[block.block_id].add(perm.genome_name)
+    block_ids = columns.block_id
+    for genome_rows in columns.genome_rows(genomes).itervalues():
+        genome_blocks = set()
+        for _seq_id, rows in genome_rows:
+            for row in rows:
+                block_id = block_ids[row]
+                if block_id in genome_blocks:
+                    repeats.add(block_id)
+                else:
+                    genome_blocks.add(block_id)
     return repeats
 
 
@@ -177,16 +190,129 @@ def _filter_permutations(permutations, blocks, inverse=False):
     for perm in permutations:
         new_blocks = list(filter(filter_func, perm.blocks))
         if new_blocks:
-            new_perms.append(deepcopy(perm))
-            new_perms[-1].blocks = new_blocks
+            new_perms.append(perm.view(new_blocks))
     return new_perms
 
 
-def _parse_blocks_coords(filename):
+class BlockColumns:
     """
-    Parses a file with blocks coords
+    Synteny blocks from blocks_coords file stored by columns: sequence
+    index, block id, sign, start and end of every block instance (in
+    the file order). Rows of every sequence sorted by start are listed
+    in seq_rows
+    """
+    def __init__(self):
+        #sequences: (genome name, chromosome name, length)
+        self.sequences = []
+        #sequence indices in the order of the file's sequence ids
+        self.seq_order = []
+        self.seq_rows = []
+        self.seq_index = array("l")
+        self.block_id = array("l")
+        self.sign = array("b")
+        self.start = array("l")
+        self.end = array("l")
+
+    def permutations(self):
+        """
+        Returns permutations of the sequences with blocks
+        """
+        perms = []
+        block_ids, signs = self.block_id, self.sign
+        starts, ends = self.start, self.end
+        for seq_id in self.seq_order:
+            rows = self.seq_rows[seq_id]
+            if not rows:
+                continue
+            genome_name, chr_name, seq_len = self.sequences[seq_id]
+            blocks = [Block(block_ids[i], signs[i], starts[i], ends[i])
+                      for i in rows]
+            perms.append(Permutation(genome_name, chr_name, seq_len, blocks))
+        return perms
+
+    def genome_rows(self, genomes):
+        """
+        Rows of the sequences with blocks, grouped by genome
+        (only the given genomes). Returns a dict with lists
+        of (sequence index, rows) pairs
+        """
+        by_genome = defaultdict(list)
+        for seq_id in self.seq_order:
+            genome_name = self.sequences[seq_id][0]
+            if genome_name in genomes and self.seq_rows[seq_id]:
+                by_genome[genome_name].append((seq_id, self.seq_rows[seq_id]))
+        return by_genome
+
+
+def _read_blocks_coords(filename, use_cache=True):
+    """
+    Reads a file with blocks coords into columns (see BlockColumns).
+    The columns are also stored in a binary file next to it, which is
+    read instead of the text next time (see _load_blocks_cache)
+    """
+    if use_cache:
+        columns = _load_blocks_cache(filename)
+        if columns is not None:
+            logger.debug("Synteny blocks are loaded from binary cache")
+            return columns
+
+    columns = _parse_blocks_text(filename)
+    if use_cache:
+        _save_blocks_cache(filename, columns)
+    return columns
+
+
+#files parsed during the current run: stages with the same block size
+#(and phylogeny inference) read the same file. Filtering works on
+#fresh permutations, so the columns themselves are never modified
+_parsed_blocks = {}
+
+
+def _shared_blocks_coords(filename):
+    """
+    Returns columns of the file, parsing it only if it was not
+    parsed before during this run (or has changed since)
+    """
+    key = os.path.abspath(filename)
+    source = _cache_source(filename)
+    if key in _parsed_blocks and _parsed_blocks[key][0] == source:
+        logger.debug("Synteny blocks are taken from the previous parse")
+        return _parsed_blocks[key][1]
+
+    columns = _read_blocks_coords(filename)
+    _parsed_blocks[key] = (source, columns)
+    return columns
+
+
+def read_backend_blocks(files):
+    """
+    Reads the blocks coords files made by a synteny backend (a dict
+    indexed by block sizes), so their binary caches are written and
+    the parsed columns are shared with the next readers of the run
     """
-    perm_by_id = {}
+    for filename in files.values():
+        _shared_blocks_coords(filename)
+
+
+def release_parsed_blocks():
+    """
+    Forgets the files parsed during the run
+    """
+    _parsed_blocks.clear()
+
+
+def _parse_blocks_text(filename):
+    """
+    Parses a file with blocks coords into columns
+    """
+    columns = BlockColumns()
+    seq_by_id = {}
+    seq_rows = columns.seq_rows
+    seq_index = columns.seq_index
+    block_ids = columns.block_id
+    signs = columns.sign
+    starts = columns.start
+    ends = columns.end
     with open(filename, "r") as f:
         header = True
         for line in f:
@@ -210,49 +336,168 @@ def _parse_blocks_coords(filename):
                                         "'genome.chromosome'")
 
                 genome_name, chr_name = tokens
-                perm_by_id[chr_id] = Permutation(genome_name, chr_name,
-                                                 int(chr_size), [])
+                seq_by_id[chr_id] = len(columns.sequences)
+                columns.sequences.append((genome_name, chr_name,
+                                          int(chr_size)))
+                seq_rows.append([])
 
             else:
-                if line.startswith("Seq_id") or line.startswith("-"):
+                first_char = line[0]
+                if first_char == "-" or (first_char == "S" and
+                                         line.startswith("Seq_id")):
                     continue
 
-                if line.startswith("Block"):
+                if first_char == "B" and line.startswith("Block"):
                     block_id = int(line.split(" ")[1][1:])
                     continue
 
                 seq_id, sign, start, end, length = line.split("\t")
                 if sign == "-":
                     start, end = end, start
-                if int(end) < int(start):
+                start, end = int(start), int(end)
+                if end < start:
                     raise PermException("Error in permutations file format")
 
-                sign_num = 1 if sign == "+" else -1
-                perm_by_id[seq_id].blocks.append(Block(block_id, sign_num,
-                                                      int(start), int(end)))
+                seq = seq_by_id[seq_id]
+                seq_rows[seq].append(len(block_ids))
+                seq_index.append(seq)
+                block_ids.append(block_id)
+                signs.append(1 if sign == "+" else -1)
+                starts.append(start)
+                ends.append(end)
+
+    #sequences with repeated ids are dropped
+    columns.seq_order = list(seq_by_id.values())
+    by_start = starts.__getitem__
+    for rows in seq_rows:
+        rows.sort(key=by_start)
+    return columns
+
+
+#binary cache layout: header, sequence names (genome and chromosome
+#separated by tabs, one per line), then raw arrays - sequence lengths,
+#seq_order, concatenated seq_rows with their offsets and the columns
+_CACHE_MAGIC = "RGBC"
+_CACHE_VERSION = 1
+_CACHE_HEADER = struct.Struct("<4sIQdc3BQQQQ")
+_CACHE_TYPECODES = ["l", "l", "l", "l", "l", "l", "b", "l", "l"]
 
-    for perm in perm_by_id.values():
-        perm.blocks.sort(key=lambda b: b.start)
 
-    out_perms = list(filter(lambda b: len(b.blocks), perm_by_id.values()))
-    return out_perms
+def _blocks_cache_file(filename):
+    return os.path.splitext(filename)[0] + ".bin"
 
 
-def _check_coverage(permutations):
+def _cache_source(filename):
     """
-    Checks if synteny blocks coverage is acceptable
+    Size and modification time of the text file
     """
-    by_genome = defaultdict(list)
-    for perm in permutations:
-        by_genome[perm.genome_name].append(perm)
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime
+
 
-    for genome_name, genome_perms in by_genome.items():
+def _save_blocks_cache(filename, columns):
+    """
+    Writes columns into the binary cache file. Arrays are stored as
+    they are in memory, so the file is only valid for the same byte
+    order and item sizes (which are checked when loading)
+    """
+    src_size, src_mtime = _cache_source(filename)
+    names = "\n".join("{0}\t{1}".format(genome, chr_name)
+                      for genome, chr_name, _len in columns.sequences)
+    row_offsets = array("l", [0])
+    rows = array("l")
+    for seq_rows in columns.seq_rows:
+        rows.extend(seq_rows)
+        row_offsets.append(len(rows))
+    arrays = [array("l", [length for _g, _c, length
+                          in columns.sequences]),
+              array("l", columns.seq_order), row_offsets, rows,
+              columns.seq_index, columns.block_id, columns.sign,
+              columns.start, columns.end]
+
+    header = _CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, src_size,
+                                src_mtime, sys.byteorder[0],
+                                array("l").itemsize, array("b").itemsize, 0,
+                                len(columns.sequences),
+                                len(columns.seq_order), len(rows), len(names))
+    cache_file = _blocks_cache_file(filename)
+    try:
+        with open(cache_file, "wb") as f:
+            f.write(header)
+            f.write(names)
+            for values in arrays:
+                values.tofile(f)
+    except IOError as e:
+        logger.debug("Can't write synteny blocks cache: {0}".format(e))
+
+
+def _load_blocks_cache(filename):
+    """
+    Loads columns from the binary cache file, if it was made from the
+    text file of the same size and modification time. Returns None
+    if there is no valid cache
+    """
+    cache_file = _blocks_cache_file(filename)
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with open(cache_file, "rb") as f:
+            (magic, version, src_size, src_mtime, byteorder, long_size,
+             byte_size, _pad, num_seqs, num_order, num_rows,
+             names_len) = _CACHE_HEADER.unpack(f.read(_CACHE_HEADER.size))
+            if ((magic, version) != (_CACHE_MAGIC, _CACHE_VERSION) or
+                    (src_size, src_mtime) != _cache_source(filename) or
+                    byteorder != sys.byteorder[0] or
+                    long_size != array("l").itemsize or
+                    byte_size != array("b").itemsize):
+                return None
+
+            names = f.read(names_len).split("\n") if num_seqs else []
+            sizes = [num_seqs, num_order, num_seqs + 1] + [num_rows] * 6
+            arrays = []
+            for typecode, size in zip(_CACHE_TYPECODES, sizes):
+                values = array(typecode)
+                values.fromfile(f, size)
+                arrays.append(values)
+    except (IOError, EOFError, struct.error) as e:
+        logger.debug("Can't read synteny blocks cache: {0}".format(e))
+        return None
+
+    (lengths, seq_order, row_offsets, rows, columns_seq, columns_block,
+     columns_sign, columns_start, columns_end) = arrays
+    columns = BlockColumns()
+    columns.sequences = [tuple(name.split("\t")) + (length,)
+                         for name, length in zip(names, lengths)]
+    columns.seq_order = seq_order.tolist()
+    columns.seq_rows = [rows[row_offsets[i]:row_offsets[i + 1]].tolist()
+                        for i in xrange(num_seqs)]
+    columns.seq_index = columns_seq
+    columns.block_id = columns_block
+    columns.sign = columns_sign
+    columns.start = columns_start
+    columns.end = columns_end
+    return columns
+
+
+def _parse_blocks_coords(filename):
+    """
+    Parses a file with blocks coords
+    """
+    return _read_blocks_coords(filename).permutations()
+
+
+def _check_coverage(columns, genomes):
+    """
+    Checks if synteny blocks coverage of the given genomes is acceptable
+    """
+    starts, ends = columns.start, columns.end
+    for genome_name, genome_rows in columns.genome_rows(genomes).items():
         total_length = 0
         total_covered = 0
-        for perm in genome_perms:
-            total_length += perm.length()
-            for block in perm.blocks:
-                total_covered += block.length()
+        for seq_id, rows in genome_rows:
+            total_length += columns.sequences[seq_id][2]
+            for row in rows:
+                total_covered += ends[row] - starts[row]
 
         coverage = float(total_covered) / total_length
         logger.debug("\"{0}\" synteny blocks coverage: {1:2.4}%"
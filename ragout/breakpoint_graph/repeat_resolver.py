@@ -16,6 +16,8 @@ import logging
 
 import networkx as nx
 
+from ragout.breakpoint_graph.matching import max_weight_bipartite_matching
+
 logger = logging.getLogger()
 
 
@@ -65,6 +67,7 @@ def resolve_repeats(ref_perms, target_perms, repeats,
     logger.debug("Purely repetitive sequences: {0}".format(purely_repetitive))
 
     #getting matches
+    leaf_states = _leaf_states(phylogeny, draft_refs)
     repetitive_matches = []
     unique_matches = []
     for repeat_id, contexts in ref_contexts.items():
@@ -74,7 +77,7 @@ def resolve_repeats(ref_perms, target_perms, repeats,
 
         profiles = _split_into_profiles(by_genome, repeats, phylogeny)
         parsimony_test = lambda p: _parsimony_test(p, phylogeny, target_name,
-                                                   draft_refs)
+                                                   leaf_states)
         profiles = list(filter(parsimony_test, profiles))
         unique_m, repetitive_m = _match_target_contexts(profiles,
                                             trg_contexts[repeat_id], repeats)
@@ -132,21 +135,31 @@ def resolve_repeats(ref_perms, target_perms, repeats,
                         .format(next_block_id - first_block_id))
     logger.debug("Saved sequences: {0}".format(len(to_remove)))
     logger.debug("Added {0} extra contigs".format(new_contigs))
+    logger.debug("Parsimony scores cache: {0} hits, {1} misses"
+                 .format(phylogeny.cache_hits, phylogeny.cache_misses))
 
 
-def _parsimony_test(profile, phylogeny, target_name, draft_refs):
+def _leaf_states(phylogeny, draft_refs):
+    """
+    Presence states of the tree leaves without any repeat
+    instances ("void" for draft references)
     """
-    Determines if the given uniqe instance of a repeat exists in target genome
+    return {g : False if g not in draft_refs else None
+            for g in phylogeny.terminals_dfs_order()}
+
+
+def _parsimony_test(profile, phylogeny, target_name, leaf_states):
     """
-    states = {g : False if g not in draft_refs else None
-              for g in phylogeny.terminals_dfs_order()}
+    Determines if the given uniqe instance of a repeat exists in target genome.
+    Both presence and absence in target are scored with a single pass
+    over the tree (see Phylogeny.estimate_target_states)
+    """
+    states = dict(leaf_states)
     for ctx in profile:
         states[ctx.perm.genome_name] = True
 
-    states[target_name] = False
-    score_without = phylogeny.estimate_tree(states)
-    states[target_name] = True
-    score_with = phylogeny.estimate_tree(states)
+    score_without, score_with = phylogeny.estimate_target_states(
+                                    states, target_name, [False, True])
     return score_with < score_without
 
 
@@ -360,7 +373,11 @@ def _profile_similarity(profile, genome_ctx, repeats, same_len):
 
 
 def _max_weight_matching(graph):
-    edges = nx.max_weight_matching(graph, maxcardinality=True)
+    """
+    Graphs here are bipartite (profiles vs contexts)
+    """
+    profiles = set(n for n in graph.nodes() if graph.node[n]["profile"])
+    edges = max_weight_bipartite_matching(graph, profiles)
     unique_edges = set()
     for v1, v2 in edges.items():
         if not (v2, v1) in unique_edges:
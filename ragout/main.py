@@ -11,7 +11,8 @@ import sys
 import shutil
 import logging
 import argparse
-from collections import namedtuple
+from bisect import bisect_left
+from collections import namedtuple, defaultdict
 from copy import deepcopy
 
 import ragout.assembly_graph.assembly_refine as asref
@@ -24,15 +25,17 @@ from ragout.scaffolder.output_generator import OutputGenerator
 from ragout.overlap.overlap import OverlapException
 from ragout.phylogeny.phylogeny import Phylogeny, PhyloException
 from ragout.breakpoint_graph.permutation import (PermutationContainer,
-                                                 PermException)
+                                                 PermException,
+                                                 release_parsed_blocks)
 from ragout.synteny_backend.synteny_backend import (SyntenyBackend,
                                                     BackendException)
 from ragout.parsers.recipe_parser import parse_ragout_recipe, RecipeException
 from ragout.parsers.fasta_parser import read_fasta_dict, FastaError
-from ragout.shared.debug import DebugConfig
-from ragout.shared.datatypes import (Permutation, Block, Contig, Scaffold, Link)
+from ragout.shared.debug import DebugConfig, DEBUG_ARTIFACTS
+from ragout.shared.datatypes import (Permutation, Block, Contig, Scaffold, Link,
+                                     GenomeRegistry)
 from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
-from ragout.breakpoint_graph.inferer import AdjacencyInferer
+from ragout.breakpoint_graph.inferer import AdjacencyInferer, SolutionCache
 from ragout.breakpoint_graph.chimera_detector import ChimeraDetector
 from ragout.breakpoint_graph.chimera_detector_ancestor import ChimeraDetector4Ancestor
 from ragout.phylogeny.phylogeny import *
@@ -46,25 +49,29 @@ import synteny_backend.hal
 
 logger = logging.getLogger()
 debugger = DebugConfig.get_instance()
-debugger.set_debugging(True) 
-debugger.set_debug_dir("./debug")
 
 RunStage = namedtuple("RunStage", ["name", "block_size", "ref_indels",
                                    "repeats", "rearrange"])
 
 
-def oDebugger(scaffolds):
+def oDebugger(scaffolds, filename):
     """
     debugging contigs sequences
     :param scaffolds:
+    :param filename: output file in the debug directory
     :return:
     """
-    for i, scf in enumerate(scaffolds):
-        logger.debug("Scaffold %d" %i)
-        for j, cnt in enumerate(scf.contigs):
-            blocksStr = " ".join(map(str, [block.block_id*block.sign for block in cnt.perm.blocks]))
-            logger.debug("Contig %d %s" % (j, blocksStr))
-            logger.debug("Evidence by: %s" %(",".join([p.genome for p in cnt.link.supporting_genomes])))
+    if not debugger.output_enabled("links"):
+        return
+
+    registry = GenomeRegistry.get_instance()
+    with debugger.open(filename) as f:
+        for i, scf in enumerate(scaffolds):
+            f.write("Scaffold %d\n" %i)
+            for j, cnt in enumerate(scf.contigs):
+                blocksStr = " ".join(map(str, [block.block_id*block.sign for block in cnt.perm.blocks]))
+                f.write("Contig %d %s\n" % (j, blocksStr))
+                f.write("Evidence by: %s\n" %(",".join([p.genome for p in registry.id_pairs(cnt.link.supporting_genomes)])))
 
 def enable_logging(log_file, debug):
     """
@@ -105,7 +112,8 @@ def check_extern_modules(backend):
 
 def ancestor_construct(scaffolds, ancestor, target, phylogeny,
                        naming_ref, ancestor_sequences, out_dir, stage_perms=None,
-                       run_stages=None, targetDone=False, solid_scaffolds=False):
+                       run_stages=None, targetDone=False, solid_scaffolds=False,
+                       threads=1, approx_matching=None):
 
     run_stages = run_stages[:-1]
     ###Enable ChimeraDetector4Ancestor
@@ -117,6 +125,7 @@ def ancestor_construct(scaffolds, ancestor, target, phylogeny,
 
     prev_stages = []
     scaffolds = None
+    adjacencies = None
     ###apply for all stages
     last_stage = run_stages[-1]
     for stage in run_stages:
@@ -126,13 +135,21 @@ def ancestor_construct(scaffolds, ancestor, target, phylogeny,
 
         if not solid_scaffolds:
             broken_perms = chim_detect.break_contigs(stage_perms[stage], [stage])
+            breakpoint_graph = raw_bp_graphs[stage]
+            breakpoint_graph.update_from(broken_perms)
         else:
             broken_perms = stage_perms[stage]
-        breakpoint_graph = BreakpointGraph(broken_perms, ancestral=True, ancestor=ancestor, name=stage.name)
-        adj_inferer = AdjacencyInferer(breakpoint_graph, phylogeny, ancestral= True)
-        adjacencies = adj_inferer.infer_adjacencies(debug=True, filename="%s.adj"%stage.name)
+            breakpoint_graph = BreakpointGraph(broken_perms, ancestral=True, ancestor=ancestor)
+        breakpoint_graph.writedot(stage.name)
+        adj_inferer = AdjacencyInferer(breakpoint_graph, phylogeny, ancestral= True,
+                                       workers=threads,
+                                       warm_start=matching_guess(prev_stages,
+                                                                 adjacencies,
+                                                                 stage_perms),
+                                       approx_matching_size=approx_matching)
+        adjacencies = adj_inferer.infer_adjacencies(filename="%s.adj"%stage.name)
         cur_scaffolds = scfldr.build_scaffolds(adjacencies, broken_perms, ancestral=True)
-        oDebugger(cur_scaffolds)
+        oDebugger(cur_scaffolds, "%s.scaffolds"%stage.name)
         if scaffolds is not None:
             if not solid_scaffolds:
                 merging_perms = chim_detect.break_contigs(stage_perms[stage],
@@ -166,10 +183,72 @@ def make_run_stages(block_sizes, resolve_repeats):
     return stages
 
 
-def get_phylogeny_and_naming_ref(recipe, permutation_file):
+def matching_guess(prev_stages, adjacencies, stage_perms):
     """
-    Retrieves phylogeny (infers if necessary) as well as
-    naming reference genome
+    Adjacencies of the previous stage as a matching guess (see
+    AdjacencyInferer). If the previous stage had other synteny blocks,
+    block ends are mapped by coordinates of the draft sequences
+    (see _map_block_ends), unmapped adjacencies are dropped
+    """
+    if len(prev_stages) < 2 or not adjacencies:
+        return None
+    prev_stage, stage = prev_stages[-2], prev_stages[-1]
+    if prev_stage.block_size == stage.block_size:
+        return adjacencies
+
+    node_map = _map_block_ends(stage_perms[prev_stage], stage_perms[stage])
+    guess = {}
+    for node, adjacency in adjacencies.iteritems():
+        if node in node_map and adjacency.block in node_map:
+            guess[node_map[node]] = adjacency._replace(
+                                        block=node_map[adjacency.block])
+    return guess
+
+
+def _map_block_ends(prev_perms, perms):
+    """
+    Maps block ends of draft (target and ancestor) sequences between
+    two permutation containers: the left end of a block is mapped
+    to the left end of the first block that overlaps it in the same
+    sequence, the right end - to the right end of the last one.
+    Ends that are mapped ambiguously are left out
+    """
+    def draft_perms(container):
+        return container.target_perms + container.ancestor_perms
+
+    sequences = {}
+    for perm in draft_perms(perms):
+        sequences[(perm.genome_name, perm.chr_name)] = perm.blocks
+
+    images = defaultdict(set)
+    for prev_perm in draft_perms(prev_perms):
+        blocks = sequences.get((prev_perm.genome_name, prev_perm.chr_name))
+        if not blocks:
+            continue
+        starts = [b.start for b in blocks]
+        for prev_block in prev_perm.blocks:
+            first = max(bisect_left(starts, prev_block.start) - 1, 0)
+            last = bisect_left(starts, prev_block.end)
+            overlap = [b for b in blocks[first:last]
+                       if b.start < prev_block.end and b.end > prev_block.start]
+            if not overlap:
+                continue
+            images[prev_block.signed_id()].add(overlap[0].signed_id())
+            images[-prev_block.signed_id()].add(-overlap[-1].signed_id())
+
+    sources = defaultdict(int)
+    for nodes in images.itervalues():
+        for node in nodes:
+            sources[node] += 1
+    return dict((node, next(iter(nodes))) for node, nodes in images.iteritems()
+                if len(nodes) == 1 and sources[next(iter(nodes))] == 1)
+
+
+def get_phylogeny_and_naming_ref(recipe, permutation_file, threads=1,
+                                 sketch_size=None):
+    """
+    Retrieves phylogeny (infers if necessary, from MinHash sketches
+    if sketch_size is set) as well as naming reference genome
     """
     if "tree" in recipe:
         logger.info("Phylogeny is taken from the recipe")
@@ -178,7 +257,8 @@ def get_phylogeny_and_naming_ref(recipe, permutation_file):
         logger.info("Inferring phylogeny from synteny blocks data")
         perm_cont = PermutationContainer(permutation_file,
                                            recipe, False, True, None)
-        phylogeny = Phylogeny.from_permutations(perm_cont)
+        phylogeny = Phylogeny.from_permutations(perm_cont, threads,
+                                                permutation_file, sketch_size)
         logger.info(phylogeny.tree_string)
 
     leaves_sorted = phylogeny.nodes_by_distance(recipe["target"], onlyLeaves=True)
@@ -200,12 +280,17 @@ def run_ragout(args):
 
     debug_root = os.path.join(args.out_dir, "debug")
     debugger.set_debugging(args.debug)
+    debugger.set_artifacts(args.debug_artifacts)
     debugger.set_debug_dir(debug_root)
     debugger.clear_debug_dir()
 
     out_log = os.path.join(args.out_dir, "ragout.log")
     enable_logging(out_log, args.debug)
     logger.info("Starting Ragout v{0}".format(__version__))
+    GenomeRegistry.reset()
+    if args.solutions_cache:
+        SolutionCache.get_instance().set_file(os.path.join(args.out_dir,
+                                                           "solutions.cache"))
 
     check_extern_modules(args.synteny_backend)
     all_backends = SyntenyBackend.get_available_backends()
@@ -226,7 +311,9 @@ def run_ragout(args):
     run_stages = make_run_stages(synteny_blocks, args.resolve_repeats)
     phylo_perm_file = perm_files[synteny_blocks[-1]]
     phylogeny, naming_ref = get_phylogeny_and_naming_ref(recipe,
-                                                         phylo_perm_file)
+                                                         phylo_perm_file,
+                                                         args.threads,
+                                                         args.sketch_phylogeny)
 
     logger.info("Processing permutation files")
     raw_bp_graphs = {}
@@ -237,6 +324,7 @@ def run_ragout(args):
                                                   recipe, stage.repeats,
                                                   stage.ref_indels, phylogeny)
         raw_bp_graphs[stage] = BreakpointGraph(stage_perms[stage])
+    release_parsed_blocks()
 
     target_sequences = read_fasta_dict(backend.get_target_fasta())
     if backend.get_ancestor_fasta():
@@ -250,18 +338,25 @@ def run_ragout(args):
     last_stage = run_stages[-1]
     if not args.targetDone:
         prev_stages = []
+        adjacencies = None
         for stage in run_stages:
             logger.info("Stage \"{0}\"".format(stage.name))
             debugger.set_debug_dir(os.path.join(debug_root, stage.name))
             prev_stages.append(stage)
 
+            breakpoint_graph = raw_bp_graphs[stage]
             if not args.solid_scaffolds:
                 broken_perms = chim_detect.break_contigs(stage_perms[stage], [stage])
+                breakpoint_graph.update_from(broken_perms)
             else:
                 broken_perms = stage_perms[stage]
-            breakpoint_graph = BreakpointGraph(broken_perms)
 
-            adj_inferer = AdjacencyInferer(breakpoint_graph, phylogeny)
+            adj_inferer = AdjacencyInferer(breakpoint_graph, phylogeny,
+                                           workers=args.threads,
+                                           warm_start=matching_guess(prev_stages,
+                                                                     adjacencies,
+                                                                     stage_perms),
+                                           approx_matching_size=args.approx_matching)
             adjacencies = adj_inferer.infer_adjacencies()
             cur_scaffolds = scfldr.build_scaffolds(adjacencies, broken_perms)
 
@@ -284,7 +379,7 @@ def run_ragout(args):
             overlap.make_overlap_graph(backend.get_target_fasta(), out_overlap)
             scaffolds = asref.refine_scaffolds(out_overlap, scaffolds,
                                                target_sequences)
-            if args.debug:
+            if debugger.output_enabled("dot"):
                 shutil.copy(out_overlap, debugger.debug_dir)
             os.remove(out_overlap)
 
@@ -298,11 +393,27 @@ def run_ragout(args):
                             phylogeny, naming_ref,
                            ancestor_sequences, args.out_dir, stage_perms=stage_perms,
                            run_stages=run_stages, targetDone=args.targetDone,
-                           solid_scaffolds=args.solid_scaffolds)
+                           solid_scaffolds=args.solid_scaffolds,
+                           threads=args.threads,
+                           approx_matching=args.approx_matching)
     ###
+    SolutionCache.get_instance().save()
+    debugger.flush()
     logger.info("Done!")
 
 
+def _debug_artifacts(string):
+    """
+    Parses a list of debug artifacts from the command line
+    """
+    artifacts = [a.strip() for a in string.split(",") if a.strip()]
+    for artifact in artifacts:
+        if artifact not in DEBUG_ARTIFACTS:
+            raise argparse.ArgumentTypeError("unknown debug artifact '{0}'"
+                                             .format(artifact))
+    return artifacts
+
+
 def main():
     parser = argparse.ArgumentParser(description="A tool for reference-assisted"
                                                  " assembly", formatter_class= \
@@ -340,8 +451,26 @@ def main():
     parser.add_argument("--debug", action="store_true",
                         dest="debug", default=False,
                         help="enable debug output")
+    parser.add_argument("--debug-artifacts", dest="debug_artifacts",
+                        type=_debug_artifacts, default=",".join(DEBUG_ARTIFACTS),
+                        help="comma-separated kinds of debug output to write "
+                        "(" + ", ".join(DEBUG_ARTIFACTS) + ")")
+    parser.add_argument("--approx-matching", dest="approx_matching",
+                        type=int, default=None, metavar="SIZE",
+                        help="use approximate matching for breakpoint graph "
+                        "components with more than SIZE nodes")
+    parser.add_argument("--sketch-phylogeny", dest="sketch_phylogeny",
+                        type=int, default=None, metavar="SIZE",
+                        help="infer phylogeny (if not given in recipe) from "
+                        "MinHash sketches of SIZE breakpoints per genome "
+                        "instead of exact breakpoint distances")
+    parser.add_argument("--solutions-cache", action="store_true",
+                        dest="solutions_cache", default=False,
+                        help="keep solved breakpoint graph components in "
+                        "the output directory to reuse them in next runs")
     parser.add_argument("-t", "--threads", dest="threads", type=int,
-                        default=1, help="number of threads for synteny backend")
+                        default=1, help="number of threads for synteny backend, "
+                        "phylogeny and adjacency inference")
     parser.add_argument("--version", action="version", version=__version__)
     args = parser.parse_args()
 
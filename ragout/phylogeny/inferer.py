@@ -9,109 +9,292 @@ breakpoints data
 
 from __future__ import print_function
 from collections import defaultdict
-from itertools import (combinations, product,
-                       combinations_with_replacement, chain)
+from itertools import chain
+import multiprocessing
+import heapq
+import os
+import logging
+import cPickle
 
 from newick.tree import Leaf, Tree
 
+logger = logging.getLogger()
+
 class TreeInferer:
-    def __init__(self, perm_container):
+    def __init__(self, perm_container, workers=1, permutation_file=None,
+                 sketch_size=None):
+        """
+        With sketch_size set, distances are estimated from MinHash
+        sketches of genome breakpoints (of this size), which
+        are cached beside the permutation_file (if given)
+        """
         self.perms_by_genome = defaultdict(list)
         for perm in chain(perm_container.ref_perms,
                           perm_container.target_perms):
             self.perms_by_genome[perm.genome_name].append(perm)
+        self.workers = workers
+        self.sketch_size = sketch_size
+        self.permutation_file = permutation_file
+        self.breakpoints = {}
+        self.breakpoint_ids = {}
+
+    def _genome_breakpoints(self, genome):
+        """
+        Returns a set of breakpoints (adjacencies) of a genome,
+        computed once for every genome. Breakpoints are numbered
+        (same for all genomes), as integer sets intersect faster
+        """
+        if genome not in self.breakpoints:
+            breakpoint_ids = self.breakpoint_ids
+            self.breakpoints[genome] = set(breakpoint_ids.setdefault(
+                                                bp, len(breakpoint_ids))
+                                           for bp in _breakpoints(
+                                                self.perms_by_genome[genome]))
+        return self.breakpoints[genome]
 
     def _genome_distance(self, genome_1, genome_2):
         """
         Calculates breakpoint distance between two genomes
         """
-        breakpoints_1 = set()
-        n_blocks_1 = 0
-        for perm in self.perms_by_genome[genome_1]:
-            n_blocks_1 += len(perm.blocks)
-            for bl_1, bl_2 in zip(perm.blocks[:-1], perm.blocks[1:]):
-                bp = sorted([-bl_1.signed_id(), bl_2.signed_id()])
-                breakpoints_1.add(tuple(bp))
-
-        breakpoints_2 = set()
-        n_blocks_2 = 0
-        for perm in self.perms_by_genome[genome_2]:
-            n_blocks_2 += len(perm.blocks)
-            for bl_1, bl_2 in zip(perm.blocks[:-1], perm.blocks[1:]):
-                bp = sorted([-bl_1.signed_id(), bl_2.signed_id()])
-                breakpoints_2.add(tuple(bp))
-
-        return (min(len(breakpoints_1), len(breakpoints_2)) -
-                len(breakpoints_1 & breakpoints_2))
+        return _breakpoint_distance(self._genome_breakpoints(genome_1),
+                                    self._genome_breakpoints(genome_2))
         #return (max(n_blocks_1, n_blocks_2) - 
         #        len(breakpoints_1 & breakpoints_2) - 2)
 
+    def _distance_matrix(self, genomes):
+        """
+        Pairwise breakpoint distances between the given genomes (as
+        a list of rows). With several workers, rows are computed by
+        a pool of forked processes
+        """
+        if self.sketch_size:
+            return self._sketch_distance_matrix(genomes)
+
+        breakpoints = [self._genome_breakpoints(g) for g in genomes]
+        if self.workers > 1 and len(genomes) > 2:
+            pool = multiprocessing.Pool(min(self.workers, len(genomes) - 1),
+                                        initializer=_init_worker,
+                                        initargs=(breakpoints,))
+            try:
+                upper_rows = pool.map(_distance_row, xrange(len(genomes)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            upper_rows = [_row_distances(breakpoints, i)
+                          for i in xrange(len(genomes))]
+
+        distances = [[0] * len(genomes) for _ in genomes]
+        for i, row in enumerate(upper_rows):
+            for j, distance in enumerate(row, i + 1):
+                distances[i][j] = distances[j][i] = distance
+        return distances
+
+    def _sketch_distance_matrix(self, genomes):
+        """
+        Pairwise breakpoint distances estimated from MinHash sketches
+        """
+        logger.debug("Estimating breakpoint distances from sketches "
+                     "of size {0}".format(self.sketch_size))
+        sketches = {}
+        if self.permutation_file:
+            sketch_file = (os.path.splitext(self.permutation_file)[0] +
+                           ".sketches")
+            stat = os.stat(self.permutation_file)
+            source = (stat.st_size, stat.st_mtime, self.sketch_size)
+            sketches = _load_sketches(sketch_file, source)
+        new_sketches = 0
+        for genome in genomes:
+            if genome not in sketches:
+                sketches[genome] = _minhash_sketch(
+                        _breakpoints(self.perms_by_genome[genome]),
+                        self.sketch_size)
+                new_sketches += 1
+        logger.debug("{0} of {1} genome sketches were cached"
+                     .format(len(genomes) - new_sketches, len(genomes)))
+        if self.permutation_file and new_sketches:
+            _save_sketches(sketch_file, source, sketches)
+
+        distances = [[0] * len(genomes) for _ in genomes]
+        for i, genome_1 in enumerate(genomes):
+            for j in xrange(i + 1, len(genomes)):
+                distances[i][j] = distances[j][i] = \
+                    _sketch_distance(sketches[genome_1], sketches[genomes[j]],
+                                     self.sketch_size)
+        return distances
+
     def build(self):
         """
-        Implementation of neighbor-joining algorithm
+        Implementation of neighbor-joining algorithm.
+        Distances are stored in a matrix indexed by node number (leaves
+        first, then internal nodes in the order of joining) - the rows
+        grow as nodes are added. On every iteration, Q values are computed
+        from the row sums of the distances between the remaining nodes.
+        Among the pairs with the lowest Q value, the first one by node
+        numbers is joined
         """
         MIN_LEN = 0.000001
-        genomes = self.perms_by_genome.keys()
-        taxas = list(map(Leaf, sorted(genomes)))
-        for t in taxas:
+        genomes = sorted(self.perms_by_genome.keys())
+        nodes = list(map(Leaf, genomes))
+        for t in nodes:
             t.terminal = True
 
-        distances = defaultdict(lambda : {})
-        for t_1, t_2 in combinations_with_replacement(taxas, 2):
-            distances[t_1][t_2] = self._genome_distance(t_1.identifier,
-                                                        t_2.identifier)
-            distances[t_2][t_1] = distances[t_1][t_2]
-
-        def calc_q(taxas):
-            q_matrix = defaultdict(lambda : {})
-            for t_1, t_2 in combinations(taxas, 2):
-                other_dist = 0
-                for other_t in taxas:
-                    other_dist += distances[t_1][other_t]
-                    other_dist += distances[t_2][other_t]
-                q_matrix[t_1][t_2] = ((len(taxas) - 2) * distances[t_1][t_2] -
-                                     other_dist)
-                q_matrix[t_2][t_1] = q_matrix[t_1][t_2]
-            return q_matrix
+        distances = self._distance_matrix(genomes)
+        taxas = range(len(nodes))
 
         while len(taxas) > 1:
             #determine two closest ones
-            q_matrix = calc_q(taxas)
+            num_taxas = len(taxas)
+            row_sums = {}
+            for t_1 in taxas:
+                dist_row = distances[t_1]
+                row_sums[t_1] = sum(dist_row[t] for t in taxas)
+
             lowest_dst = float("inf")
             lowest_pair = None
-            for t_1, t_2 in sorted(combinations(taxas, 2)):
-                if q_matrix[t_1][t_2] < lowest_dst:
-                    lowest_dst = q_matrix[t_1][t_2]
-                    lowest_pair = (t_1, t_2)
+            for pos, t_1 in enumerate(taxas):
+                dist_row = distances[t_1]
+                sum_1 = row_sums[t_1]
+                for t_2 in taxas[pos + 1:]:
+                    q_value = ((num_taxas - 2) * dist_row[t_2] -
+                               (sum_1 + row_sums[t_2]))
+                    if q_value < lowest_dst:
+                        lowest_dst = q_value
+                        lowest_pair = (t_1, t_2)
 
             #calculate distances to new internal node from joined taxas
             new_taxa = Tree()
             new_taxa.terminal = False
 
-            old_1, old_2 = sorted(lowest_pair)
-            other_dist = 0
-            for other_taxa in taxas:
-                other_dist += distances[old_1][other_taxa]
-                other_dist -= distances[old_2][other_taxa]
-            div_dist = (0.5 / (len(taxas) - 2) * other_dist
-                        if len(taxas) > 2 else 0)
-            dist_1 = 0.5 * distances[old_1][old_2] + div_dist
-            dist_2 = distances[old_1][old_2] - dist_1
+            old_1, old_2 = lowest_pair
+            pair_dist = distances[old_1][old_2]
+            other_dist = row_sums[old_1] - row_sums[old_2]
+            div_dist = (0.5 / (num_taxas - 2) * other_dist
+                        if num_taxas > 2 else 0)
+            dist_1 = 0.5 * pair_dist + div_dist
+            dist_2 = pair_dist - dist_1
             dist_1, dist_2 = max(MIN_LEN, dist_1), max(MIN_LEN, dist_2)
 
-            new_taxa.add_edge((old_1, None, dist_1))
-            new_taxa.add_edge((old_2, None, dist_2))
+            new_taxa.add_edge((nodes[old_1], None, dist_1))
+            new_taxa.add_edge((nodes[old_2], None, dist_2))
             taxas.remove(old_1)
             taxas.remove(old_2)
 
+            new_id = len(nodes)
+            nodes.append(new_taxa)
+            for row in distances:
+                row.append(0)
+            new_row = [0] * (new_id + 1)
             for other_taxa in taxas:
-                distances[new_taxa][other_taxa] = \
+                new_row[other_taxa] = \
                     0.5 * (distances[old_1][other_taxa] +
-                           distances[old_2][other_taxa] -
-                           distances[old_1][old_2])
-                distances[other_taxa][new_taxa] = distances[new_taxa][other_taxa]
-            distances[new_taxa][new_taxa] = 0
-            taxas.append(new_taxa)
+                           distances[old_2][other_taxa] - pair_dist)
+                distances[other_taxa][new_id] = new_row[other_taxa]
+            distances.append(new_row)
+            taxas.append(new_id)
 
-        tree = list(taxas)[0]
+        tree = nodes[taxas[0]]
         return tree
+
+
+def _breakpoints(perms):
+    """
+    Returns a set of breakpoints (adjacencies) of the permutations
+    """
+    breakpoints = set()
+    for perm in perms:
+        for bl_1, bl_2 in zip(perm.blocks[:-1], perm.blocks[1:]):
+            bp = sorted([-bl_1.signed_id(), bl_2.signed_id()])
+            breakpoints.add(tuple(bp))
+    return breakpoints
+
+
+def _breakpoint_distance(breakpoints_1, breakpoints_2):
+    return (min(len(breakpoints_1), len(breakpoints_2)) -
+            len(breakpoints_1 & breakpoints_2))
+
+
+def _row_distances(breakpoints, index):
+    """
+    Distances from a genome to the genomes that follow it
+    """
+    return [_breakpoint_distance(breakpoints[index], other)
+            for other in breakpoints[index + 1:]]
+
+
+_HASH_MASK = (1 << 64) - 1
+
+def _breakpoint_hash(breakpoint):
+    """
+    64-bit hash of a breakpoint, which (unlike the built-in hash)
+    does not depend on the platform, so sketches could be stored
+    """
+    value = (((breakpoint[0] & 0xFFFFFFFF) << 32) |
+             (breakpoint[1] & 0xFFFFFFFF))
+    #splitmix64 finalizer
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _HASH_MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _HASH_MASK
+    return value ^ (value >> 31)
+
+
+def _minhash_sketch(breakpoints, sketch_size):
+    """
+    Bottom-k MinHash sketch: the number of breakpoints
+    and the sorted list of the smallest breakpoint hashes
+    """
+    hashes = heapq.nsmallest(sketch_size, map(_breakpoint_hash, breakpoints))
+    return len(breakpoints), hashes
+
+
+def _sketch_distance(sketch_1, sketch_2, sketch_size):
+    """
+    Estimates breakpoint distance (see _breakpoint_distance).
+    Jaccard index of breakpoint sets is estimated from the smallest
+    hashes of their union, then the number of shared breakpoints
+    is derived from it and the known numbers of breakpoints
+    """
+    size_1, hashes_1 = sketch_1
+    size_2, hashes_2 = sketch_2
+    union = heapq.nsmallest(sketch_size, set(hashes_1) | set(hashes_2))
+    if not union:
+        return 0
+    shared = len(set(hashes_1) & set(hashes_2) & set(union))
+    jaccard = float(shared) / len(union)
+    common = jaccard * (size_1 + size_2) / (1 + jaccard)
+    return min(size_1, size_2) - common
+
+
+def _load_sketches(filename, source):
+    """
+    Loads genome sketches (if the file exists). They are only valid for
+    the same source: size and modification time of the permutation
+    file and the sketch size
+    """
+    if not os.path.isfile(filename):
+        return {}
+    try:
+        with open(filename, "rb") as f:
+            stored_source, sketches = cPickle.load(f)
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError) as e:
+        logger.warning("Can't read genome sketches: {0}".format(e))
+        return {}
+    return sketches if stored_source == source else {}
+
+
+def _save_sketches(filename, source, sketches):
+    try:
+        with open(filename, "wb") as f:
+            cPickle.dump((source, sketches), f, cPickle.HIGHEST_PROTOCOL)
+    except IOError as e:
+        logger.warning("Can't write genome sketches: {0}".format(e))
+
+
+_worker_breakpoints = None
+
+def _init_worker(breakpoints):
+    global _worker_breakpoints
+    _worker_breakpoints = breakpoints
+
+
+def _distance_row(index):
+    return _row_distances(_worker_breakpoints, index)
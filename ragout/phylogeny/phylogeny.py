@@ -8,14 +8,13 @@ This module provides some phylogeny-related functions
 """
 
 import math
-from collections import defaultdict
-from itertools import chain
+from collections import defaultdict, OrderedDict
+from itertools import chain, izip
 import logging
 
-import networkx as nx
-
 from ragout.parsers.phylogeny_parser import (parse_tree, PhyloException)
 from ragout.phylogeny.inferer import TreeInferer
+from ragout.shared import config
 from newick.tree import (Tree, Leaf)
 logger = logging.getLogger()
 
@@ -27,84 +26,451 @@ class Phylogeny:
     def __init__(self, tree):
         self.tree = tree
         self.tree_string = str(tree)
+        self._flatten()
         self._scale_branches()
+        self._scores_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._ancestor_subtrees = {}
+        self._node_distances = {}
+        self._distance_orders = {}
 
     @classmethod
     def from_newick(phylo, newick_str):
         return phylo(parse_tree(newick_str))
 
     @classmethod
-    def from_permutations(phylo, perm_container):
-        ti = TreeInferer(perm_container)
+    def from_permutations(phylo, perm_container, workers=1,
+                          permutation_file=None, sketch_size=None):
+        ti = TreeInferer(perm_container, workers, permutation_file,
+                         sketch_size)
         return phylo(ti.build())
 
-    def _scale_branches(self):
+    def _flatten(self):
         """
-        Fits mu coefficient according to branch lengths
-        to avoid underflows/overflows
+        Stores the tree as arrays in postorder (children before parents):
+        tree nodes, their identifiers, leaf names (None for internal nodes),
+        children with branch lengths, parents and the first index of every
+        subtree. Branch lengths and node indices are also listed in preorder
         """
-        def tree_length(node):
-            if node.terminal:
-                return []
-
-            lengths = []
-            for node, _bootstrap, length in node.get_edges():
-                assert length is not None
-                lengths.append(length)
-                lengths.extend(tree_length(node))
+        self._nodes = []
+        self._node_ids = {}
+        self._identifiers = []
+        self._leaf_names = []
+        self._leaf_order = []
+        self._leaf_index = {}
+        self._children = []
+        self._parents = []
+        self._subtree_start = []
+        self._branch_lengths = []
+        preorder = []
+
+        stack = [(self.tree, None, False)]
+        while stack:
+            node, length, visited = stack.pop()
+            if not visited:
+                preorder.append(node)
+                if node is not self.tree:
+                    assert length is not None
+                    self._branch_lengths.append(length)
+                stack.append((node, length, True))
+                if not node.terminal:
+                    for child, _bootstrap, child_length in reversed(node.edges):
+                        stack.append((child, child_length, False))
+                continue
 
-            return lengths
+            index = len(self._nodes)
+            self._node_ids[node] = index
+            self._nodes.append(node)
+            self._identifiers.append(node.identifier)
+            self._parents.append(-1)
+            if node.terminal:
+                self._leaf_names.append(node.identifier)
+                self._leaf_order.append(node.identifier)
+                self._leaf_index[node.identifier] = index
+                self._children.append([])
+                self._subtree_start.append(index)
+            else:
+                children = [(self._node_ids[child], child_length)
+                            for child, _bootstrap, child_length in node.edges]
+                self._leaf_names.append(None)
+                self._children.append(children)
+                self._subtree_start.append(self._subtree_start[children[0][0]])
+                for child, _length in children:
+                    self._parents[child] = index
+        self._preorder = [self._node_ids[node] for node in preorder]
 
-        lengths = tree_length(self.tree)
+    def _scale_branches(self):
+        """
+        Fits mu coefficient according to branch lengths
+        to avoid underflows/overflows and precomputes
+        state change scores for every branch
+        """
+        lengths = self._branch_lengths
         assert len(lengths)
         self.mu = float(1) / _median(lengths)
         logger.debug("Branch lengths: {0}, mu = {1}".format(lengths, self.mu))
 
+        self._penalties = [[(child, _change_score(length, self.mu))
+                            for child, length in children]
+                           for children in self._children]
+
     def estimate_tree(self, leaf_states, internal_scores={}):
         """
-        Scores the tree with weighted parsimony procedure
+        Scores the tree with weighted parsimony procedure.
+        Scores without internal_scores are cached (see _partition_key)
+        """
+        if internal_scores:
+            if self.tree in internal_scores.keys():
+                return min(internal_scores[self.tree])
+            _states, scores = self.score_states(leaf_states, internal_scores)
+            return min(scores)
+
+        leaf_codes, codes, has_void, others = self._partition(leaf_states)
+        key = (leaf_codes, has_void, bool(others))
+        score = self._cached_score(key)
+        if score is None:
+            score = min(self.score_states(leaf_states)[1])
+            self._cache_score(key, score)
+        return score
+
+    def estimate_ancestral_tree(self, leaf_states, ancestor, ancestor_state):
         """
-        all_states = set(leaf_states.values())
+        Scores the tree with the given internal node (ancestor)
+        restricted to the given state. The ancestor subtree is scored
+        apart, with its own branch scaling (see estimate_labeled_tree)
+        """
+        return self.estimate_ancestral_states(leaf_states, ancestor,
+                                              [ancestor_state])[0]
 
-        #score of a tree branch
-        def branch_score(parent, child, branch):
-            if parent == child or child is None:
-                return 0.0
+    def estimate_ancestral_states(self, leaf_states, ancestor,
+                                  ancestor_states):
+        """
+        Scores the tree for each of the given states of the ancestor
+        (see estimate_ancestral_tree), other states are fixed.
+        Returns the list of scores
+        """
+        if self.tree.identifier == ancestor:
+            #not cached, as the root scores are treated differently
+            #(see estimate_tree)
+            return [self._ancestral_score(leaf_states, ancestor, state)
+                    for state in ancestor_states]
+
+        leaf_codes, codes, has_void, others = self._partition(leaf_states)
+        keys = []
+        scores = []
+        for ancestor_state in ancestor_states:
+            state_others = others
+            if ancestor_state in codes:
+                fixed = codes[ancestor_state]
+            elif ancestor_state is None:
+                fixed = -1 if has_void else "absent"
+            elif ancestor_state in others:
+                #other non-leaf states are not the same as this one
+                fixed = "other"
+                state_others = others - set([ancestor_state])
             else:
-                #prevent underflow
-                length = max(branch, 0.0000001)
-                #adding one to counter possibly small exp value
-                return 1.0 + math.exp(-self.mu * length)
+                fixed = "absent"
+            keys.append((ancestor, fixed, leaf_codes, has_void,
+                         bool(state_others)))
+            scores.append(self._cached_score(keys[-1]))
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            computed = self._score_ancestral_states(leaf_states, ancestor,
+                                        [ancestor_states[i] for i in missing])
+            for i, score in izip(missing, computed):
+                scores[i] = score
+                self._cache_score(keys[i], score)
+        return scores
+
+    def _ancestral_score(self, leaf_states, ancestor, ancestor_state):
+        ancestor_tree, ancestor_phylo = self._ancestor_subtree(ancestor)
+        ancestor_scores = estimate_labeled_tree(ancestor_phylo, leaf_states,
+                                                {ancestor: ancestor_state})
+        return self.estimate_tree(leaf_states, internal_scores=
+                                  {ancestor_tree: ancestor_scores})
+
+    def _ancestor_subtree(self, ancestor):
+        """
+        Returns the ancestor node and the phylogeny of its subtree
+        (built once for every ancestor)
+        """
+        if ancestor not in self._ancestor_subtrees:
+            ancestor_tree = get_node(self.tree, ancestor)
+            self._ancestor_subtrees[ancestor] = (ancestor_tree,
+                                                 Phylogeny(ancestor_tree))
+        return self._ancestor_subtrees[ancestor]
 
-        #recursive
-        def rec_helper(root):
-            if root.terminal:
-                leaf_score = (lambda s: 0.0 if s == leaf_states[root.identifier]
-                                            else float("inf"))
-                return {s : leaf_score(s) for s in all_states}
-
-            nodes_scores = {}
-            for node, _bootstrap, _length  in root.get_edges():
-                if node in internal_scores:
-                    nodes_scores[node] = internal_scores[node]
-                else:
-                    nodes_scores[node] = rec_helper(node)
-
-            root_scores = defaultdict(float)
-            for root_state in all_states:
-                for node, _bootstrap, branch_length in root.edges:
-                    min_score = float("inf")
-                    for child_state in all_states:
-                        score = (nodes_scores[node][child_state] +
-                                branch_score(root_state, child_state,
-                                             branch_length))
-                        min_score = min(min_score, score)
-                    root_scores[root_state] += min_score
-
-            return root_scores
-        if self.tree in internal_scores.keys():
-            return min(internal_scores[self.tree])
-        return min(rec_helper(self.tree).values())
+    def _score_ancestral_states(self, leaf_states, ancestor, ancestor_states):
+        """
+        Restricting the ancestor to a state only leaves one of its
+        subtree root scores, so the subtree is scored once without
+        restrictions. The rest of the tree is scored once too, except
+        for the path from the ancestor to the root, which is rescored
+        for every ancestor state (like in _score_target_states)
+        """
+        INF = float("inf")
+        ancestor_tree, ancestor_phylo = self._ancestor_subtree(ancestor)
+        if ancestor_phylo._identifiers.count(ancestor) > 1:
+            #several nodes are restricted at once
+            return [self._ancestral_score(leaf_states, ancestor, state)
+                    for state in ancestor_states]
+
+        all_states, subtree_scores = ancestor_phylo.score_states(leaf_states)
+        codes = dict((state, i) for i, state in enumerate(all_states))
+        num_states = len(all_states)
+        void = codes.get(None)
+
+        ancestor_node = self._node_ids[ancestor_tree]
+        path = set()
+        path_node = ancestor_node
+        while path_node >= 0:
+            path.add(path_node)
+            path_node = self._parents[path_node]
+        subtree_start = self._subtree_start[ancestor_node]
+
+        node_scores = [None] * len(self._nodes)
+        for index, leaf_name in enumerate(self._leaf_names):
+            if index in path or subtree_start <= index < ancestor_node:
+                continue
+
+            if leaf_name is not None:
+                scores = [INF] * num_states
+                scores[codes[leaf_states[leaf_name]]] = 0.0
+                node_scores[index] = (scores, 0.0,
+                                      scores[void] if void is not None else INF)
+                continue
+
+            scores = [0.0] * num_states
+            for child, penalty in self._penalties[index]:
+                _add_child_scores(scores, node_scores[child], penalty)
+            node_scores[index] = (scores, min(scores),
+                                  scores[void] if void is not None else INF)
+
+        ancestral_scores = []
+        for ancestor_state in ancestor_states:
+            scores = [INF] * num_states
+            state_code = codes.get(ancestor_state)
+            if state_code is not None:
+                scores[state_code] = subtree_scores[state_code]
+            path_scores = (scores, min(scores),
+                           scores[void] if void is not None else INF)
+
+            path_node = ancestor_node
+            while self._parents[path_node] >= 0:
+                parent = self._parents[path_node]
+                scores = [0.0] * num_states
+                for child, penalty in self._penalties[parent]:
+                    _add_child_scores(scores, path_scores if child == path_node
+                                      else node_scores[child], penalty)
+                path_scores = (scores, min(scores),
+                               scores[void] if void is not None else INF)
+                path_node = parent
+            ancestral_scores.append(min(path_scores[0]))
+
+        return ancestral_scores
+
+    def _partition(self, leaf_states):
+        """
+        The score depends only on how leaves are partitioned into equal
+        states, which leaves are "void" (None) and if there are other
+        states (void or not) given for non-leaf genomes. Returns canonical
+        codes of the leaves (-1 for void), codes of non-void leaf states,
+        if there is a void state and the set of other non-void states
+        """
+        codes = {}
+        leaf_codes = []
+        for name in self._leaf_order:
+            state = leaf_states[name]
+            if state is None:
+                leaf_codes.append(-1)
+                continue
+            code = codes.get(state)
+            if code is None:
+                code = len(codes)
+                codes[state] = code
+            leaf_codes.append(code)
+
+        has_void = False
+        others = set()
+        for state in leaf_states.itervalues():
+            if state is None:
+                has_void = True
+            elif state not in codes:
+                others.add(state)
+        return tuple(leaf_codes), codes, has_void, others
+
+    def _cached_score(self, key):
+        score = self._scores_cache.pop(key, None)
+        if score is None:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        self._scores_cache[key] = score     #most recently used go last
+        return score
+
+    def _cache_score(self, key, score):
+        self._scores_cache[key] = score
+        if len(self._scores_cache) > config.vals["parsimony_cache_size"]:
+            self._scores_cache.popitem(last=False)
+
+    def score_states(self, leaf_states, internal_scores={},
+                     internal_states={}):
+        """
+        Weighted parsimony (Sankoff) dynamic programming over the
+        flattened tree. States are encoded with integers and every state
+        change costs the same, so it is enough to check the same state,
+        the "void" state and the best state overall. Subtrees with scores
+        given in internal_scores (by tree node) are not traversed, nodes
+        from internal_states (by identifier) are restricted to the given
+        state. Returns the list of states and the list of root scores
+        """
+        INF = float("inf")
+        all_states = list(set(leaf_states.values()))
+        codes = dict((state, i) for i, state in enumerate(all_states))
+        num_states = len(all_states)
+        void = codes.get(None)
+
+        skipped = set()
+        external = {}
+        for node, scores in internal_scores.iteritems():
+            index = self._node_ids.get(node)
+            if index is not None:
+                external[index] = scores
+                skipped.update(xrange(self._subtree_start[index], index))
+        restricted = {}
+        if internal_states:
+            for index, identifier in enumerate(self._identifiers):
+                if (self._leaf_names[index] is None and
+                        identifier in internal_states):
+                    restricted[index] = codes.get(internal_states[identifier],
+                                                  -1)
+
+        #scores of every node: (list of scores, best score, void score)
+        node_scores = [None] * len(self._nodes)
+        for index, leaf_name in enumerate(self._leaf_names):
+            if index in skipped:
+                continue
+
+            if index in external:
+                scores = external[index]
+                best, void_score = min(scores.values()), scores.get(None, INF)
+                node_scores[index] = ([scores[s] for s in all_states],
+                                      best, void_score)
+                continue
+
+            if leaf_name is not None:
+                scores = [INF] * num_states
+                scores[codes[leaf_states[leaf_name]]] = 0.0
+                node_scores[index] = (scores, 0.0,
+                                      scores[void] if void is not None else INF)
+                continue
+
+            scores = [0.0] * num_states
+            for child, penalty in self._penalties[index]:
+                _add_child_scores(scores, node_scores[child], penalty)
+            if index in restricted:
+                fixed = restricted[index]
+                scores = [score if state == fixed else INF
+                          for state, score in enumerate(scores)]
+
+            node_scores[index] = (scores, min(scores),
+                                  scores[void] if void is not None else INF)
+
+        return all_states, node_scores[-1][0]
+
+    def estimate_target_states(self, leaf_states, target, target_states):
+        """
+        Scores the tree for each of the given states of the target
+        leaf, other leaf states are fixed. Same as estimate_tree calls
+        (and shares the same cache), but subtrees outside of the path
+        from the target to the root are scored only once
+        """
+        states = dict(leaf_states)
+        keys = []
+        scores = []
+        for target_state in target_states:
+            states[target] = target_state
+            leaf_codes, _codes, has_void, others = self._partition(states)
+            keys.append((leaf_codes, has_void, bool(others)))
+            scores.append(self._cached_score(keys[-1]))
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            computed = self._score_target_states(leaf_states, target,
+                                        [target_states[i] for i in missing])
+            for i, score in izip(missing, computed):
+                scores[i] = score
+                self._cache_score(keys[i], score)
+        return scores
+
+    def _score_target_states(self, leaf_states, target, target_states):
+        """
+        The upward pass is done without the target leaf state and with an
+        extra column for a state that no leaf has (a new target state
+        scores like that outside of the target path). Such column is never
+        less than the others, so it does not change the best scores. Then
+        the path to the root is rescored for every target state,
+        summing up the child scores in the same order as score_states
+        """
+        INF = float("inf")
+        base_states = dict(leaf_states)
+        base_states.pop(target, None)
+        all_states = list(set(base_states.values()))
+        if (target not in self._leaf_index or not all_states or
+                None in target_states):
+            #nothing to share
+            scores = []
+            states = dict(leaf_states)
+            for target_state in target_states:
+                states[target] = target_state
+                scores.append(min(self.score_states(states)[1]))
+            return scores
+
+        codes = dict((state, i) for i, state in enumerate(all_states))
+        new_state = len(all_states)
+        num_states = new_state + 1
+        void = codes.get(None)
+
+        node_scores = [None] * len(self._nodes)
+        for index, leaf_name in enumerate(self._leaf_names):
+            if leaf_name is not None:
+                scores = [INF] * num_states
+                if leaf_name != target:
+                    scores[codes[base_states[leaf_name]]] = 0.0
+                node_scores[index] = (scores, 0.0,
+                                      scores[void] if void is not None else INF)
+                continue
+
+            scores = [0.0] * num_states
+            for child, penalty in self._penalties[index]:
+                _add_child_scores(scores, node_scores[child], penalty)
+            node_scores[index] = (scores, min(scores),
+                                  scores[void] if void is not None else INF)
+
+        target_scores = []
+        for target_state in target_states:
+            state_code = codes.get(target_state)
+            num_columns = num_states if state_code is None else new_state
+            scores = [INF] * num_columns
+            scores[new_state if state_code is None else state_code] = 0.0
+            path_scores = (scores, 0.0,
+                           scores[void] if void is not None else INF)
+
+            path_node = self._leaf_index[target]
+            while self._parents[path_node] >= 0:
+                parent = self._parents[path_node]
+                scores = [0.0] * num_columns
+                for child, penalty in self._penalties[parent]:
+                    _add_child_scores(scores, path_scores if child == path_node
+                                      else node_scores[child], penalty)
+                path_scores = (scores, min(scores),
+                               scores[void] if void is not None else INF)
+                path_node = parent
+            target_scores.append(min(path_scores[0]))
+
+        return target_scores
 
     def terminals_dfs_order(self):
         """
@@ -123,28 +489,48 @@ class Phylogeny:
     def nodes_by_distance(self, genome, onlyLeaves=True):
         """
         Returns leaves names sorted by the distance from
-        the given genome.
+        the given genome. Orders are computed once for every genome,
+        equally distant nodes are listed in the tree preorder
         """
-        graph = nx.Graph()
-        start = [None]
-        def rec_helper(root):
-            if root.identifier == genome:
-                start[0] = root
-            if root.terminal:
-                return
-            for node, _bootstrap, branch_length in root.edges:
-                graph.add_edge(root, node, weight=branch_length)
-                rec_helper(node)
-
-        rec_helper(self.tree)
-        distances = nx.single_source_dijkstra_path_length(graph, start[0])
-        if onlyLeaves:
-            nodes = [g for g in distances.keys()
-                  if g.terminal and g.identifier != genome]
-        else:
-            nodes = [g for g in distances.keys()
-                  if g.identifier != genome]
-        return list(map(str, sorted(nodes, key=distances.get)))
+        key = (genome, onlyLeaves)
+        if key not in self._distance_orders:
+            distances = self.node_distances(genome)
+            nodes = [i for i in self._preorder
+                     if self._identifiers[i] != genome and
+                     (not onlyLeaves or self._leaf_names[i] is not None)]
+            nodes.sort(key=distances.__getitem__)
+            self._distance_orders[key] = [str(self._nodes[i]) for i in nodes]
+        return list(self._distance_orders[key])
+
+    def node_distances(self, genome):
+        """
+        Returns distances (sums of branch lengths) from the given genome
+        to all tree nodes, as a list indexed like the flattened tree.
+        Distances are computed once for every genome
+        """
+        if genome not in self._node_distances:
+            starts = [i for i in self._preorder
+                      if self._identifiers[i] == genome]
+            if not starts:
+                raise PhyloException("Genome {0} is not in the tree"
+                                     .format(genome))
+            distances = [None] * len(self._nodes)
+            distances[starts[-1]] = 0
+            queue = [starts[-1]]
+            while queue:
+                node = queue.pop()
+                neighbors = list(self._children[node])
+                parent = self._parents[node]
+                if parent >= 0:
+                    neighbors.extend((parent, length)
+                                     for child, length in self._children[parent]
+                                     if child == node)
+                for neighbor, length in neighbors:
+                    if distances[neighbor] is None:
+                        distances[neighbor] = distances[node] + length
+                        queue.append(neighbor)
+            self._node_distances[genome] = distances
+        return self._node_distances[genome]
 
 
 def _median(values):
@@ -174,45 +560,31 @@ def get_node(Tree, identifier):
 def estimate_labeled_tree(phylogeny, leaf_states, internal_states):
     """
     Scores the labeled-subtree with weighted parsimony procedure
+    (see Phylogeny.score_states). Returns scores of the root states
     """
-    all_states = set(leaf_states.values())
+    all_states, scores = phylogeny.score_states(leaf_states,
+                                                internal_states=internal_states)
+    return defaultdict(float, izip(all_states, scores))
 
-    #score of a tree branch
-    def branch_score(parent, child, branch):
-        if parent == child or child is None:
-            return 0.0
-        else:
-            #prevent underflow
-            length = max(branch, 0.0000001)
-            #adding one to counter possibly small exp value
-            return 1.0 + math.exp(-phylogeny.mu * length)
-
-    #recursive
-    def rec_helper(root):
-        if root.terminal:
-            leaf_score = (lambda s: 0.0 if s == leaf_states[root.identifier]
-                                        else float("inf"))
-            return {s : leaf_score(s) for s in all_states}
-
-        nodes_scores = {}
-        for node, _bootstrap, _length  in root.get_edges():
-                nodes_scores[node] = rec_helper(node)
-
-        root_scores = defaultdict(float)
-        for root_state in all_states:
-
-            if root.identifier in internal_states and root_state != internal_states[root.identifier]:
-                root_scores[root_state] = float("inf")
-                continue
 
-            for node, _bootstrap, branch_length in root.edges:
-                min_score = float("inf")
-                for child_state in all_states:
-                    score = (nodes_scores[node][child_state] +
-                            branch_score(root_state, child_state,
-                                         branch_length))
-                    min_score = min(min_score, score)
-                root_scores[root_state] += min_score
-        return root_scores
-
-    return rec_helper(phylogeny.tree)
+def _add_child_scores(scores, child, penalty):
+    """
+    Adds the best scores of a child subtree for every parent's state
+    (child is a tuple of its scores, the best and the void state score)
+    """
+    child_scores, best, void_score = child
+    cap = min(void_score, best + penalty)
+    for state in xrange(len(scores)):
+        score = child_scores[state]
+        scores[state] += score if score < cap else cap
+
+
+def _change_score(branch, mu):
+    """
+    Score of a state change along a tree branch
+    (keeping the state or changing it to "void" is free)
+    """
+    #prevent underflow
+    length = max(branch, 0.0000001)
+    #adding one to counter possibly small exp value
+    return 1.0 + math.exp(-mu * length)
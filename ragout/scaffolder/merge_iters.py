@@ -9,24 +9,20 @@ moving between two consecutive iterations
 
 from collections import namedtuple, defaultdict
 from itertools import product, chain, combinations
-import os
 import logging
-from copy import deepcopy
 
 import networkx as nx
 
 from ragout.shared.debug import DebugConfig
 from ragout.shared.datatypes import (Contig, Scaffold, Permutation, Link,
-                                     output_scaffolds_premutations, output_permutations)
-from ragout.scaffolder.output_generator import output_links
+                                     write_scaffolds_permutations)
+from ragout.scaffolder.output_generator import write_links
 from ragout.scaffolder.scaffolder import build_scaffolds
 from ragout.breakpoint_graph.inferer import Adjacency
 
 
 logger = logging.getLogger()
 debugger = DebugConfig.get_instance()
-debugger.set_debugging(True)
-debugger.set_debug_dir("./debug_scf")
 
 def merge_scaffolds(big_scaffolds, small_scaffolds, perm_container, rearrange, ancestral = False):
     """
@@ -49,11 +45,11 @@ def merge_scaffolds(big_scaffolds, small_scaffolds, perm_container, rearrange, a
     merged_scf = _merge_scaffolds(big_rearranged, small_updated)
     merged_scf = _merge_consecutive_contigs(merged_scf)
 
-    if debugger.debugging:
-        links_out = os.path.join(debugger.debug_dir, "merged.links")
-        output_links(merged_scf, links_out)
-        perms_out = os.path.join(debugger.debug_dir, "merged_scaffolds.txt")
-        output_scaffolds_premutations(merged_scf, perms_out)
+    if debugger.output_enabled("links"):
+        with debugger.open("merged.links") as f:
+            write_links(merged_scf, f)
+        with debugger.open("merged_scaffolds.txt") as f:
+            write_scaffolds_permutations(merged_scf, f)
 
     return merged_scf
 
@@ -83,7 +79,7 @@ def _merge_consecutive_contigs(scaffolds):
             if not consistent:
                 if cur_perm:
                     new_contigs.append(Contig.with_perm(cur_perm, cur_sign, cur_link))
-                cur_perm = deepcopy(cnt.perm)
+                cur_perm = cnt.perm.view(list(cnt.perm.blocks))
 
             cur_sign = cnt.sign
             cur_link = cnt.link
@@ -188,7 +184,7 @@ class RearrangementProjector:
         adjacencies = {}
         for (u, v, data) in self.bp_graph.edges_iter(data=True):
             if data["scf_set"] == "old":
-                gap, support = 0, []
+                gap, support = 0, frozenset()
                 if not data["infinity"]:
                     gap = data["link"].gap
                     support = data["link"].supporting_genomes
@@ -271,9 +267,8 @@ class RearrangementProjector:
             for next_cont in scf.contigs[pos + 1:]:
                 if next_cont.name() not in old_contigs:
                     prev_cont.link.gap += next_cont.length() + next_cont.link.gap
-                    common_genomes = (set(prev_cont.link.supporting_genomes) &
-                                      set(next_cont.link.supporting_genomes))
-                    prev_cont.link.supporting_genomes = list(common_genomes)
+                    prev_cont.link.supporting_genomes &= \
+                                        next_cont.link.supporting_genomes
                     continue
 
                 bp_graph.add_edge(prev_cont.right_end(), next_cont.left_end(),
@@ -10,6 +10,7 @@ import os
 from ragout.parsers.fasta_parser import write_fasta_dict, reverse_complement
 from ragout.__version__ import __version__
 import ragout.shared.config as config
+from ragout.shared.datatypes import GenomeRegistry
 
 logger = logging.getLogger()
 
@@ -223,43 +224,50 @@ def output_links(scaffolds, out_links):
     """
     Outputs pretty table with information about adjacencies
     """
+    with open(out_links, "w") as f:
+        write_links(scaffolds, f)
+
+
+def write_links(scaffolds, f):
+    """
+    Writes links table to an open file
+    """
     HEADER = ["sequence", "start", "length", "gap", "support"]
     COL_GAP = 4
 
-    with open(out_links, "w") as f:
-        for scf in sorted(scaffolds, key=lambda s: s.name):
-            rows = []
-            cur_pos = 0
+    for scf in sorted(scaffolds, key=lambda s: s.name):
+        rows = []
+        cur_pos = 0
 
-            for contig in scf.contigs:
-                start = cur_pos
-                cur_pos = start + contig.length() + contig.link.gap
-                support = _support_to_string(contig.link)
+        for contig in scf.contigs:
+            start = cur_pos
+            cur_pos = start + contig.length() + contig.link.gap
+            support = _support_to_string(contig.link)
 
-                rows.append([contig.signed_name(), str(start),
-                            str(contig.length()), str(contig.link.gap),
-                            support])
+            rows.append([contig.signed_name(), str(start),
+                        str(contig.length()), str(contig.link.gap),
+                        support])
 
-            col_widths = repeat(0)
-            for row in [HEADER] + rows:
-                col_widths = [max(len(v), w) for v, w in zip(row, col_widths)]
-            line_len = sum(col_widths) + COL_GAP * len(col_widths)
+        col_widths = repeat(0)
+        for row in [HEADER] + rows:
+            col_widths = [max(len(v), w) for v, w in zip(row, col_widths)]
+        line_len = sum(col_widths) + COL_GAP * len(col_widths)
 
-            #header
-            f.write("-" * line_len + "\n")
-            f.write(scf.name + "\n")
-            f.write("-" * line_len + "\n")
-            for hdr, width in zip(HEADER, col_widths):
-                f.write(hdr + (" " * (width - len(hdr) + COL_GAP)))
-            f.write("\n" + "-" * line_len + "\n")
+        #header
+        f.write("-" * line_len + "\n")
+        f.write(scf.name + "\n")
+        f.write("-" * line_len + "\n")
+        for hdr, width in zip(HEADER, col_widths):
+            f.write(hdr + (" " * (width - len(hdr) + COL_GAP)))
+        f.write("\n" + "-" * line_len + "\n")
 
-            #values
-            for row in rows:
-                for val, width in zip(row, col_widths):
-                    f.write(val + (" " * (width - len(val) + COL_GAP)))
-                f.write("\n")
+        #values
+        for row in rows:
+            for val, width in zip(row, col_widths):
+                f.write(val + (" " * (width - len(val) + COL_GAP)))
+            f.write("\n")
 
-            f.write("-" * line_len + "\n\n")
+        f.write("-" * line_len + "\n\n")
 
 
 def _support_to_string(link):
@@ -267,7 +275,8 @@ def _support_to_string(link):
     Converts information about supporting adjacencies to string.
     Could be used separately form OutputGenerator for debugging purposes
     """
-    supp_genomes = sorted(link.supporting_genomes)
+    registry = GenomeRegistry.get_instance()
+    supp_genomes = sorted(registry.id_pairs(link.supporting_genomes))
     support_to_str = lambda gc: "{0}:{1}".format(gc.genome, gc.chr)
     support = ",".join(map(support_to_str, supp_genomes))
     if link.supporting_assembly:
@@ -10,15 +10,14 @@ formats
 
 from collections import defaultdict, namedtuple
 from itertools import repeat
-import os
 import copy
 import logging
 
 from ragout.shared.debug import DebugConfig
 from ragout.shared.datatypes import (Permutation, Contig, Scaffold, Link,
-                                     output_scaffolds_premutations,
-                                     output_permutations)
-from ragout.scaffolder.output_generator import output_links
+                                     write_scaffolds_permutations,
+                                     write_permutations)
+from ragout.scaffolder.output_generator import write_links
 
 
 logger = logging.getLogger()
@@ -43,13 +42,13 @@ def build_scaffolds(adjacencies, perm_container, debug_output=True,
     logger.debug("{0} contigs were joined into {1} scaffolds"
                         .format(num_contigs, len(scaffolds)))
 
-    if debugger.debugging and debug_output:
-        links_out = os.path.join(debugger.debug_dir, "scaffolder.links")
-        output_links(scaffolds, links_out)
-        contigs_out = os.path.join(debugger.debug_dir, "scaffolder_contigs.txt")
-        output_permutations(perm_container.target_perms, contigs_out)
-        perms_out = os.path.join(debugger.debug_dir, "scaffolder_scaffolds.txt")
-        output_scaffolds_premutations(scaffolds, perms_out)
+    if debugger.output_enabled("links") and debug_output:
+        with debugger.open("scaffolder.links") as f:
+            write_links(scaffolds, f)
+        with debugger.open("scaffolder_contigs.txt") as f:
+            write_permutations(perm_container.target_perms, f)
+        with debugger.open("scaffolder_scaffolds.txt") as f:
+            write_scaffolds_permutations(scaffolds, f)
 
     return scaffolds
 
@@ -114,7 +113,7 @@ def assign_scaffold_names(scaffolds, perm_container, ref_genome):
             new_contigs = map(lambda c: c.reverse_copy(), scf.contigs)[::-1]
             for i in xrange(len(new_contigs) - 2):
                 new_contigs[i].link = new_contigs[i + 1].link
-            new_contigs[-1].link = Link(0, [])
+            new_contigs[-1].link = Link(0, frozenset())
             scf.contigs = new_contigs
 
 
@@ -38,6 +38,13 @@ vals =  {
 
             "big_genome_threshold" : 500 * 1024 * 1024,
 
+            #alternating paths of chimera detection are searched up
+            #to this number of nodes (None - unbounded)
+            "max_alternating_path" : None,
+
+            #maximum number of cached parsimony scores (per phylogeny)
+            "parsimony_cache_size" : 100000,
+
             "min_synteny_coverage" : 0.6,
             "min_overlap_rate" : 0.5,
             "min_scaffold_gap": 11,
@@ -9,11 +9,15 @@ This module provides some common data structures
 from collections import namedtuple
 from copy import copy, deepcopy
 
+GenChrPair = namedtuple("GenChrPair", ["genome", "chr"])
 
-class Block:
+
+class Block(object):
     """
     Represents synteny block
     """
+    __slots__ = ("block_id", "sign", "start", "end")
+
     def __init__(self, block_id, sign, start=None, end=None):
         self.block_id = block_id
         self.sign = sign
@@ -45,6 +49,18 @@ class Permutation:
         self.repeat_id = 0
         self.draft = False
 
+    def view(self, blocks=None):
+        """
+        Returns a shallow copy of the permutation, which shares
+        blocks with this one (or has the given list of blocks).
+        Shared blocks are not modified in place: those who need
+        other coordinates make new blocks
+        """
+        perm = copy(self)
+        if blocks is not None:
+            perm.blocks = blocks
+        return perm
+
     def length(self):
         assert self.seq_end > self.seq_start
         return self.seq_end - self.seq_start
@@ -86,11 +102,15 @@ class Permutation:
 
 def output_permutations(permutations, out_file):
     with open(out_file, "w") as f:
-        for perm in permutations:
-            f.write(">" + perm.name() + "\n")
-            for block in perm.blocks:
-                f.write("{0:+} ".format(block.signed_id()))
-            f.write("$\n")
+        write_permutations(permutations, f)
+
+
+def write_permutations(permutations, f):
+    for perm in permutations:
+        f.write(">" + perm.name() + "\n")
+        for block in perm.blocks:
+            f.write("{0:+} ".format(block.signed_id()))
+        f.write("$\n")
 
 
 class Contig:
@@ -98,7 +118,7 @@ class Contig:
         self.perm = permutation
         self.sign = sign
         if link is None:
-            link = Link(0, [])
+            link = Link(0, frozenset())
         self.link = link
 
     @staticmethod
@@ -165,7 +185,9 @@ class Contig:
 
 class Link:
     """
-    Represens an adjancency between teo contigs
+    Represens an adjancency between teo contigs.
+    Supporting genomes are stored as a frozenset of
+    GenomeRegistry pair ids
     """
     def __init__(self, gap, supporting_genomes):
         self.gap = gap
@@ -173,6 +195,56 @@ class Link:
         self.supporting_assembly = False
 
 
+class GenomeRegistry:
+    """
+    Singleton that gives run-wide integer ids to genomes and
+    (genome, chromosome) pairs, so their sets could be stored
+    as genome bitmasks and sets of pair ids. Ids are given in
+    the order of appearance, draft contigs usually come last
+    """
+    instance = None
+
+    def __init__(self):
+        self.genomes = []
+        self.genome_ids = {}
+        self.pairs = []
+        self.pair_ids = {}
+
+    def genome_id(self, genome):
+        if genome not in self.genome_ids:
+            self.genome_ids[genome] = len(self.genomes)
+            self.genomes.append(genome)
+        return self.genome_ids[genome]
+
+    def pair_id(self, genome, chr_name):
+        pair = GenChrPair(genome, chr_name)
+        if pair not in self.pair_ids:
+            self.genome_id(genome)
+            self.pair_ids[pair] = len(self.pairs)
+            self.pairs.append(pair)
+        return self.pair_ids[pair]
+
+    def id_pairs(self, pair_ids):
+        """
+        Converts pair ids back to the list of GenChrPair (in id order)
+        """
+        return [self.pairs[pair_id] for pair_id in sorted(pair_ids)]
+
+    @staticmethod
+    def get_instance():
+        if not GenomeRegistry.instance:
+            GenomeRegistry.instance = GenomeRegistry()
+        return GenomeRegistry.instance
+
+    @staticmethod
+    def reset():
+        """
+        Forgets the ids of the previous run. Graphs that were
+        built before keep referring to the old registry
+        """
+        GenomeRegistry.instance = None
+
+
 class Scaffold:
     def __init__(self, name):
         self.left = None
@@ -191,13 +263,16 @@ class Scaffold:
 
 def output_scaffolds_premutations(scaffolds, out_file):
     with open(out_file, "w") as f:
-        permutations = []
-        for scf in scaffolds:
-            blocks = []
-            for contig in scf.contigs:
-                blocks.extend(contig.signed_perm())
-
-            f.write(">" + scf.name + "\n")
-            for block in blocks:
-                f.write("{0:+} ".format(block))
-            f.write("$\n")
+        write_scaffolds_permutations(scaffolds, f)
+
+
+def write_scaffolds_permutations(scaffolds, f):
+    for scf in scaffolds:
+        blocks = []
+        for contig in scf.contigs:
+            blocks.extend(contig.signed_perm())
+
+        f.write(">" + scf.name + "\n")
+        for block in blocks:
+            f.write("{0:+} ".format(block))
+        f.write("$\n")
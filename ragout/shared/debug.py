@@ -5,21 +5,51 @@ for debug output
 
 import os
 import shutil
+import logging
+import atexit
+import threading
+from Queue import Queue
+
+logger = logging.getLogger()
+
+#kinds of debug output that could be selected separately
+DEBUG_ARTIFACTS = ["dot", "adjacencies", "links"]
 
 
 class DebugConfig():
     """
-    Singleton providing global debug configuration
+    Singleton providing global debug configuration.
+    Debug files are buffered in memory and written
+    by a background thread
     """
     instance = None
 
     def __init__(self):
         self.debug_dir = None
         self.debugging = False
+        self.artifacts = set(DEBUG_ARTIFACTS)
+        self._queue = None
 
     def set_debugging(self, debugging):
         self.debugging = debugging
 
+    def set_artifacts(self, artifacts):
+        """
+        Selects kinds of debug output to be written
+        """
+        unknown = set(artifacts) - set(DEBUG_ARTIFACTS)
+        if unknown:
+            raise ValueError("Unknown debug artifacts: {0}"
+                             .format(", ".join(sorted(unknown))))
+        self.artifacts = set(artifacts)
+
+    def output_enabled(self, artifact):
+        """
+        Checks if the given kind of debug output should be written.
+        Callers should not format anything if it is not
+        """
+        return self.debugging and artifact in self.artifacts
+
     def set_debug_dir(self, debug_dir):
         if not self.debugging:
             return
@@ -30,12 +60,76 @@ class DebugConfig():
     def clear_debug_dir(self):
         if not self.debugging:
             return
+        self.flush()
         if os.path.isdir(self.debug_dir):
             shutil.rmtree(self.debug_dir)
             os.mkdir(self.debug_dir)
 
+    def open(self, filename):
+        """
+        Returns an in-memory file in the current debug directory.
+        It is written to disk in background after being closed
+        """
+        return _DebugFile(self, os.path.join(self.debug_dir, filename))
+
+    def flush(self):
+        """
+        Waits until all pending debug files are written
+        """
+        if self._queue is not None:
+            self._queue.join()
+
+    def _submit(self, path, contents):
+        if self._queue is None:
+            self._queue = Queue()
+            writer = threading.Thread(target=_write_files,
+                                      args=(self._queue,))
+            writer.daemon = True
+            writer.start()
+            atexit.register(self.flush)
+        self._queue.put((path, contents))
+
     @staticmethod
     def get_instance():
         if not DebugConfig.instance:
             DebugConfig.instance = DebugConfig()
         return DebugConfig.instance
+
+
+class _DebugFile(object):
+    """
+    Write-only file buffer, submitted to the writer thread on close
+    """
+    def __init__(self, debugger, path):
+        self.debugger = debugger
+        self.path = path
+        self.chunks = []
+
+    def write(self, string):
+        self.chunks.append(string)
+
+    def close(self):
+        if self.chunks is not None:
+            self.debugger._submit(self.path, "".join(self.chunks))
+            self.chunks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _write_files(queue):
+    """
+    Writer thread loop
+    """
+    while True:
+        path, contents = queue.get()
+        try:
+            with open(path, "w") as f:
+                f.write(contents)
+        except IOError as e:
+            logger.warning("Can't write debug output: {0}".format(e))
+        finally:
+            queue.task_done()
@@ -11,6 +11,7 @@ import os
 from collections import namedtuple, defaultdict
 
 import ragout.shared.config as config
+from ragout.breakpoint_graph.permutation import read_backend_blocks
 
 logger = logging.getLogger()
 
@@ -27,7 +28,8 @@ class SyntenyBackend:
     def make_permutations(self, recipe, blocks,
                           output_dir, overwrite, threads):
         """
-        Runs backend and then prepare data for futher processing
+        Runs backend and then prepare data for futher processing:
+        blocks coords files are parsed (see read_backend_blocks)
         """
         self.target_fasta = recipe["genomes"][recipe["target"]].get("fasta")
         self.threads = threads
@@ -38,6 +40,7 @@ class SyntenyBackend:
         else:
             files = self.run_backend(recipe, output_dir, overwrite, ancestral=True)
         assert sorted(files.keys()) == sorted(blocks)
+        read_backend_blocks(files)
 
         return files
 
@@ -26,19 +26,22 @@ from ragout.scaffolder.output_generator import OutputGenerator
 from ragout.overlap.overlap import OverlapException
 from ragout.phylogeny.phylogeny import Phylogeny, PhyloException
 from ragout.breakpoint_graph.permutation import (PermutationContainer,
-                                                 PermException)
+                                                 PermException,
+                                                 release_parsed_blocks)
 from ragout.synteny_backend.synteny_backend import (SyntenyBackend,
                                                     BackendException)
 from ragout.parsers.recipe_parser import parse_ragout_recipe, RecipeException, _make_dummy_recipe
 from ragout.parsers.fasta_parser import read_fasta_dict, FastaError
 from ragout.shared.debug import DebugConfig
-from ragout.shared.datatypes import (Permutation, Block, Contig, Scaffold, Link)
+from ragout.shared.datatypes import (Permutation, Block, Contig, Scaffold, Link,
+                                     GenomeRegistry)
 from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
-from ragout.breakpoint_graph.inferer import AdjacencyInferer
+from ragout.breakpoint_graph.inferer import AdjacencyInferer, SolutionCache
 from ragout.breakpoint_graph.chimera_detector import ChimeraDetector
 from ragout.breakpoint_graph.chimera_detector_ancestor import ChimeraDetector4Ancestor
 from ragout.phylogeny.phylogeny import *
 from ragout.__version__ import __version__
+from ragout.main import matching_guess
 
 import ragout.synteny_backend.maf
 
@@ -60,6 +63,9 @@ class RagoutInstance(object):
                  backend="maf",
                  is_overwrite = False,
                  is_debug=False,
+                 debug_artifacts=None,
+                 approx_matching=None,
+                 solutions_cache=False,
                  is_resolve_repeats=False,
                  is_solid_scaffolds=False):
         self.maf = maf
@@ -70,6 +76,8 @@ class RagoutInstance(object):
         self.phyloStr = phyloStr
         self.scale = scale
         self.debug = is_debug
+        self.debug_artifacts = debug_artifacts
+        self.approx_matching = approx_matching
         self.outDir = outDir
         self.backend = SyntenyBackend.backends[backend]
         self.overwrite = is_overwrite
@@ -90,6 +98,10 @@ class RagoutInstance(object):
         if not os.path.isdir(self.tmpDir):
             os.mkdir(self.tmpDir)
         self.debug_root = self._set_debugging()
+        GenomeRegistry.reset()
+        if solutions_cache:
+            SolutionCache.get_instance().set_file(os.path.join(self.outDir,
+                                                           "solutions.cache"))
         self._set_exe_paths()
         self._check_extern_modules(backend)
         self.phylogeny, self.naming_ref = self._get_phylogeny_and_naming_ref()
@@ -110,6 +122,7 @@ class RagoutInstance(object):
 
         prev_stages = []
         scaffolds = None
+        adjacencies = None
         ###apply for all stages
         last_stage = self.run_stages[-1]
         for stage in self.run_stages:
@@ -119,10 +132,17 @@ class RagoutInstance(object):
 
             if not self.is_solid_scaffolds:
                 broken_perms = chim_detect.break_contigs(self.stage_perms[stage], [stage])
+                breakpoint_graph = raw_bp_graphs[stage]
+                breakpoint_graph.update_from(broken_perms)
             else:
                 broken_perms = self.stage_perms[stage]
-            breakpoint_graph = BreakpointGraph(broken_perms, ancestral=True, ancestor=self.ancestor)
-            adj_inferer = AdjacencyInferer(breakpoint_graph, self.phylogeny, ancestral= True)
+                breakpoint_graph = BreakpointGraph(broken_perms, ancestral=True, ancestor=self.ancestor)
+            adj_inferer = AdjacencyInferer(breakpoint_graph, self.phylogeny, ancestral= True,
+                                           workers=self.threads,
+                                           warm_start=matching_guess(prev_stages,
+                                                                     adjacencies,
+                                                                     self.stage_perms),
+                                           approx_matching_size=self.approx_matching)
             adjacencies = adj_inferer.infer_adjacencies()
             cur_scaffolds = scfldr.build_scaffolds(adjacencies, broken_perms, ancestral=True)
 
@@ -142,6 +162,8 @@ class RagoutInstance(object):
         logger.info("Done scaffolding for ''{0}''".format(self.ancestor))
         out_gen = OutputGenerator(self.ancestor_seqs, scaffolds)
         out_gen.make_output(self.outDir, self.ancestor, write_fasta=False)
+        SolutionCache.get_instance().save()
+        self.debugger.flush()
 
     def _set_debugging(self):
         if not os.path.isdir(self.outDir):
@@ -152,6 +174,8 @@ class RagoutInstance(object):
 
         debug_root = os.path.join(self.outDir, "debug")
         self.debugger.set_debugging(self.debug)
+        if self.debug_artifacts is not None:
+            self.debugger.set_artifacts(self.debug_artifacts)
         self.debugger.set_debug_dir(debug_root)
         self.debugger.clear_debug_dir()
         return debug_root
@@ -207,6 +231,7 @@ class RagoutInstance(object):
                                                       self.dummy_recipe, stage.repeats,
                                                       stage.ref_indels, self.phylogeny)
             pass
+        release_parsed_blocks()
 
     def make_run_stages(self):
         """
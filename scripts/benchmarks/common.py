@@ -0,0 +1,157 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Synthetic data and helpers shared by the benchmarks
+"""
+
+from __future__ import print_function
+import os
+import time
+import random
+import resource
+import cPickle
+import traceback
+
+from ragout.shared.datatypes import Block, Permutation
+from ragout.parsers.recipe_parser import parse_ragout_recipe
+from ragout.phylogeny.phylogeny import Phylogeny
+from ragout.breakpoint_graph.permutation import PermutationContainer
+
+
+class SyntheticContainer:
+    """
+    Mimics PermutationContainer with randomly rearranged genomes
+    """
+    def __init__(self, num_genomes, num_blocks, num_contigs, seed,
+                 num_reversals=None):
+        rnd = random.Random(seed)
+        self.ref_perms = []
+        self.target_perms = []
+        self.ancestor_perms = []
+
+        genomes = ["genome{0}".format(i) for i in xrange(num_genomes)]
+        self.target = genomes[0]
+        self.references = genomes[1:]
+        self.tree = random_tree(genomes, rnd)
+
+        if num_reversals is None:
+            num_reversals = num_blocks / 50 + 1
+        ancestral = [rnd.choice([-1, 1]) * (i + 1) for i in xrange(num_blocks)]
+        for genome in genomes:
+            order = _random_reversals(ancestral, num_reversals, rnd)
+            if genome == self.target:
+                pieces = _random_split(order, num_contigs, rnd)
+                perms = self.target_perms
+            else:
+                pieces = _random_split(order, 2, rnd)
+                perms = self.ref_perms
+            for chr_id, piece in enumerate(pieces):
+                perms.append(_make_permutation(genome,
+                                               "chr{0}".format(chr_id), piece))
+
+        self.recipe = {"genomes" : {g : {"draft" : False} for g in genomes},
+                       "target" : self.target, "references" : self.references,
+                       "tree" : self.tree}
+
+
+def random_tree(genomes, rnd):
+    """
+    Joins random pairs of subtrees until a single tree is left.
+    Internal nodes are named "ancestor0", "ancestor1"... in join order
+    """
+    subtrees = ["{0}:{1:.3f}".format(g, rnd.uniform(0.01, 0.1))
+                for g in genomes]
+    num_ancestors = 0
+    while len(subtrees) > 1:
+        left = subtrees.pop(rnd.randrange(len(subtrees)))
+        right = subtrees.pop(rnd.randrange(len(subtrees)))
+        subtrees.append("({0},{1})ancestor{2}:{3:.3f}"
+                        .format(left, right, num_ancestors,
+                                rnd.uniform(0.01, 0.1)))
+        num_ancestors += 1
+    tree = subtrees[0]
+    return tree[:tree.rindex(":")] + ";"
+
+
+def _random_reversals(blocks, num_reversals, rnd):
+    blocks = list(blocks)
+    for _ in xrange(num_reversals):
+        start = rnd.randint(0, len(blocks) - 1)
+        end = min(len(blocks), start + rnd.randint(1, 20))
+        blocks[start:end] = [-b for b in blocks[start:end][::-1]]
+    return blocks
+
+
+def _random_split(blocks, num_pieces, rnd):
+    cuts = sorted(rnd.sample(xrange(1, len(blocks)),
+                             min(num_pieces, len(blocks)) - 1))
+    return [blocks[s:e] for s, e in zip([0] + cuts, cuts + [len(blocks)])]
+
+
+def _make_permutation(genome, chr_name, signed_ids):
+    BLOCK_LEN = 1000
+    GAP_LEN = 100
+    blocks = []
+    for pos, signed_id in enumerate(signed_ids):
+        start = pos * (BLOCK_LEN + GAP_LEN)
+        blocks.append(Block(abs(signed_id), 1 if signed_id > 0 else -1,
+                            start, start + BLOCK_LEN))
+    return Permutation(genome, chr_name, len(blocks) * (BLOCK_LEN + GAP_LEN),
+                       blocks)
+
+
+def load_data(args):
+    """
+    Returns permutation container and phylogeny for the benchmark
+    """
+    if args.coords:
+        recipe = parse_ragout_recipe(args.recipe)
+        phylogeny = Phylogeny.from_newick(recipe["tree"])
+        perms = PermutationContainer(args.coords, recipe, False,
+                                     False, phylogeny)
+        return perms, phylogeny
+
+    perms = SyntheticContainer(args.genomes, args.blocks, args.contigs,
+                               args.seed, args.reversals)
+    return perms, Phylogeny.from_newick(perms.tree)
+
+
+def measure(func, *func_args):
+    """
+    Runs function in a forked process, returns
+    wall time (sec) and peak memory growth (MB)
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.time()
+            result = func(*func_args)
+            elapsed = time.time() - start
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            with os.fdopen(write_fd, "w") as f:
+                cPickle.dump((elapsed, (rss_after - rss_before) / 1024.0,
+                              result), f)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "r") as f:
+        data = f.read()
+    _pid, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise RuntimeError("benchmark process failed")
+    return cPickle.loads(data)
+
+
+def print_table(header, rows):
+    widths = [max(len(str(r[i])) for r in [header] + rows)
+              for i in xrange(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(v).rjust(w) for v, w in zip(row, widths)))
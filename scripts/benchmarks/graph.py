@@ -0,0 +1,315 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Benchmarks of the breakpoint graph
+"""
+
+import sys
+import time
+import signal
+
+import networkx as nx
+
+from ragout.shared.datatypes import GenomeRegistry
+from ragout.phylogeny.phylogeny import Phylogeny
+from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
+
+from benchmarks.common import (SyntheticContainer, load_data, measure,
+                               print_table)
+
+
+def _legacy_build(perm_container):
+    return len(_legacy_graph(perm_container))
+
+
+def _legacy_graph(perm_container):
+    """
+    Networkx MultiGraph construction as it was done before the
+    array-backed BreakpointGraph, kept for comparison
+    """
+    graph = nx.MultiGraph()
+    references = set(p.genome_name for p in perm_container.ref_perms)
+    for perm in perm_container.ref_perms + perm_container.target_perms:
+        for prev_block, next_block in perm.iter_pairs():
+            graph.add_node(-prev_block.signed_id())
+            graph.add_node(next_block.signed_id())
+            graph.add_edge(-prev_block.signed_id(), next_block.signed_id(),
+                           genome_id=perm.genome_name, chr_name=perm.chr_name,
+                           start=prev_block.end, end=next_block.start,
+                           infinity=False, color="blue")
+        if perm.genome_name in references and not perm.draft:
+            graph.add_edge(-perm.blocks[-1].signed_id(),
+                           perm.blocks[0].signed_id(),
+                           genome_id=perm.genome_name, chr_name=perm.chr_name,
+                           infinity=True, color="blue")
+    return graph
+
+
+def _compact_build(perm_container):
+    return len(BreakpointGraph(perm_container))
+
+
+def bench_graph_build(args):
+    """
+    Breakpoint graph construction: networkx MultiGraph vs compact engine
+    """
+    perms, _phylogeny = load_data(args)
+    rows = []
+    for name, func in [("networkx", _legacy_build),
+                       ("compact", _compact_build)]:
+        times, memory = [], []
+        for _ in xrange(args.repeat):
+            elapsed, mem, nodes = measure(func, perms)
+            times.append(elapsed)
+            memory.append(mem)
+        rows.append([name, nodes, "{0:.3f}".format(min(times)),
+                     "{0:.1f}".format(min(memory))])
+    print_table(["engine", "nodes", "build (s)", "memory (MB)"], rows)
+
+
+def _legacy_components(perm_container):
+    graph = _legacy_graph(perm_container)
+    start = time.time()
+    components = list(nx.connected_component_subgraphs(graph))
+    return len(components), time.time() - start
+
+
+def _view_components(perm_container):
+    graph = BreakpointGraph(perm_container)
+    start = time.time()
+    components = graph.connected_components()
+    return len(components), time.time() - start
+
+
+def bench_components(args):
+    """
+    Connected components: networkx subgraph copies vs
+    union-find labelling with component views
+    """
+    perms, _phylogeny = load_data(args)
+    rows = []
+    for name, func in [("networkx", _legacy_components),
+                       ("views", _view_components)]:
+        times, memory = [], []
+        for _ in xrange(args.repeat):
+            _elapsed, mem, (num_comp, elapsed) = measure(func, perms)
+            times.append(elapsed)
+            memory.append(mem)
+        rows.append([name, num_comp, "{0:.3f}".format(min(times)),
+                     "{0:.1f}".format(min(memory))])
+    print_table(["engine", "components", "split (s)", "memory (MB)"], rows)
+
+
+def _build_and_score(perms, phylogeny):
+    start = time.time()
+    graph = BreakpointGraph(perms)
+    build_time = time.time() - start
+
+    start = time.time()
+    scored_nodes = 0
+    for subgr in graph.connected_components():
+        if len(subgr) >= 2:
+            subgr.to_weighted_graph(phylogeny)
+            scored_nodes += len(subgr)
+    score_time = time.time() - start
+    return build_time, scored_nodes, score_time
+
+
+def bench_genome_scaling(args):
+    """
+    Graph build time and per-node scoring time as functions
+    of the number of genomes
+    """
+    rows = []
+    for num_genomes in map(int, args.genome_counts.split(",")):
+        perms = SyntheticContainer(num_genomes, args.blocks, args.contigs,
+                                   args.seed, args.reversals)
+        phylogeny = Phylogeny.from_newick(perms.tree)
+        _elapsed, mem, (build_time, nodes, score_time) = \
+                            measure(_build_and_score, perms, phylogeny)
+        rows.append([num_genomes, "{0:.3f}".format(build_time), nodes,
+                     "{0:.1f}".format(score_time * 1000000 / max(nodes, 1)),
+                     "{0:.1f}".format(mem)])
+    print_table(["genomes", "build (s)", "scored nodes", "score (us/node)",
+                 "memory (MB)"], rows)
+
+
+def _support_queries(args):
+    """
+    Genome support of every edge of the largest connected component:
+    edge scan + set construction vs precomputed bitmasks
+    """
+    perms, _phylogeny = load_data(args)
+    graph = BreakpointGraph(perms)
+    component = graph.connected_components()[0]
+    pairs = set()
+    for edge in component.iter_edges():
+        pairs.add((edge.node_1, edge.node_2))
+    pairs = list(pairs) * args.queries
+
+    def scan_query(u, v):
+        return set(graph._genomes[graph._edge_genome[e]]
+                   for e in graph._edges_between(u, v))
+
+    target_mask = graph.genome_mask(graph.target)
+    rows = []
+    for name, query, check in \
+            [("edge scan", scan_query, lambda g: graph.target in g),
+             ("bitmask", graph.genomes_mask, lambda m: m & target_mask)]:
+        start = time.time()
+        for u, v in pairs:
+            check(query(u, v))
+        elapsed = time.time() - start
+        rows.append([name, len(component), len(pairs),
+                     "{0:.3f}".format(elapsed * 1000000 / len(pairs))])
+    return rows
+
+
+def bench_support_sets(args):
+    """
+    Link support intersection (as in scaffold merging) and size of
+    the per-pair support: sets of (genome, chromosome) pairs vs
+    bitmasks over all pairs of the run vs sets of pair ids
+    """
+    perms, _phylogeny = load_data(args)
+    graph = BreakpointGraph(perms)
+    registry = GenomeRegistry.get_instance()
+    id_tuples = [graph.support_ids(e.node_1, e.node_2)
+                 for e in graph.iter_edges()]
+    supports = [("pair sets", [set(registry.id_pairs(ids))
+                               for ids in id_tuples]),
+                ("bitmasks", [sum(1 << i for i in ids) for ids in id_tuples]),
+                ("id sets", [frozenset(ids) for ids in id_tuples])]
+
+    rows = []
+    for name, values in supports:
+        start = time.time()
+        for _ in xrange(args.queries):
+            for supp_1, supp_2 in zip(values[:-1], values[1:]):
+                supp_1 & supp_2
+        elapsed = time.time() - start
+        size = sum(sys.getsizeof(v) for v in values)
+        rows.append([name, len(values), "{0:.3f}".format(elapsed),
+                     size / 1024])
+    size = sum(sys.getsizeof(ids) for ids in
+               dict((id(ids), ids) for ids in id_tuples).itervalues())
+    rows.append(["id tuples (index)", len(id_tuples), "-", size / 1024])
+    print_table(["support", "links", "intersections (s)",
+                 "containers (KB)"], rows)
+
+
+def bench_support_query(args):
+    """
+    Per-edge genome support queries on the largest component
+    """
+    _elapsed, _mem, rows = measure(_support_queries, args)
+    print_table(["method", "component nodes", "queries", "query (us)"], rows)
+
+
+def _legacy_alternating_cycle(graph, node_1, node_2):
+    """
+    Exhaustive recursive search, as it was done before
+    the iterative alternating cycle search, kept for comparison
+    """
+    target_mask = graph.genome_mask(graph.target)
+    visited = set()
+    def rec_helper(node, colored):
+        if node == node_2:
+            return [[node_2]]
+        visited.add(node)
+        paths = []
+        for neighbor in graph.neighbors(node):
+            if neighbor in visited:
+                continue
+            genomes = graph.genomes_mask(node, neighbor)
+            if colored and not genomes & ~target_mask:
+                continue
+            if not colored and not genomes & target_mask:
+                continue
+            far_paths = rec_helper(neighbor, not colored)
+            map(lambda p: p.append(node), far_paths)
+            paths.extend(far_paths)
+        visited.remove(node)
+        return paths
+
+    for path in map(lambda p: p[::-1], rec_helper(node_1, True)):
+        if len(path) % 2 != 0:
+            return None
+        if len(path) == 2:
+            continue
+        masks = [graph.genomes_mask(u, v) for u, v in zip(path[:-1], path[1:])]
+        if not all(m == target_mask for m in masks[1::2]):
+            continue
+        if reduce(lambda a, b: a & b, masks[0::2]):
+            return len(path) / 2
+    return None
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _raise_timeout(_signum, _frame):
+    raise _Timeout()
+
+
+def _cycle_queries(perms, legacy, passes, timeout):
+    cycles_cache = {}
+    graph = BreakpointGraph(perms)
+    target_mask = graph.genome_mask(graph.target)
+    components = graph.connected_components()
+    found = 0
+    start = time.time()
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(timeout)
+    for _ in xrange(passes):
+        for subgr in components:
+            for edge in subgr.genome_edges(subgr.target):
+                if subgr.genomes_mask(edge.node_1, edge.node_2) != target_mask:
+                    continue
+                if legacy:
+                    try:
+                        cycle = _legacy_alternating_cycle(subgr, edge.node_1,
+                                                          edge.node_2)
+                    except RuntimeError:
+                        return len(components[0]), None, "recursion limit"
+                    except _Timeout:
+                        return len(components[0]), None, "timeout"
+                else:
+                    cycle = subgr.alternating_cycle(edge.node_1, edge.node_2,
+                                                    cycles_cache)
+                found += cycle is not None
+    signal.alarm(0)
+    return len(components[0]), found, time.time() - start
+
+
+def bench_alternating_cycle(args):
+    """
+    Chimera detection cycle search: exhaustive recursion vs iterative
+    search with early exit (one pass) and cached results (two passes,
+    as for the last and refine stages of a chimera detector)
+    """
+    perms, _phylogeny = load_data(args)
+    rows = []
+    for name, legacy, passes in [("recursive", True, 1),
+                                 ("iterative", False, 1),
+                                 ("iterative x2", False, 2)]:
+        _elapsed, _mem, (largest, found, search_time) = \
+                measure(_cycle_queries, perms, legacy, passes, args.timeout)
+        if found is None:
+            found = "-"
+        else:
+            search_time = "{0:.3f}".format(search_time)
+        rows.append([name, largest, passes, found, search_time])
+    print_table(["search", "largest component", "passes", "cycles",
+                 "search (s)"], rows)
+
+
+BENCHMARKS = {"alternating-cycle" : bench_alternating_cycle,
+              "components" : bench_components,
+              "genome-scaling" : bench_genome_scaling,
+              "graph-build" : bench_graph_build,
+              "support-query" : bench_support_query,
+              "support-sets" : bench_support_sets}
@@ -0,0 +1,157 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Benchmarks of matching and adjacency inference
+"""
+
+import time
+import random
+
+import networkx as nx
+
+from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
+from ragout.breakpoint_graph.inferer import AdjacencyInferer
+from ragout.breakpoint_graph.matching import (max_weight_matching,
+                                              max_weight_bipartite_matching,
+                                              approx_max_weight_matching)
+
+from benchmarks.common import load_data, measure, print_table
+
+
+def _infer_adjacencies(perms, phylogeny, workers):
+    graph = BreakpointGraph(perms)
+    inferer = AdjacencyInferer(graph, phylogeny, workers=workers)
+    start = time.time()
+    adjacencies = inferer.infer_adjacencies()
+    elapsed = time.time() - start
+    return (len(graph.connected_components()), elapsed,
+            sorted(adjacencies.items()))
+
+
+def bench_inference_workers(args):
+    """
+    Adjacency inference with different numbers of worker processes.
+    Results should not depend on the number of workers
+    """
+    perms, phylogeny = load_data(args)
+    rows = []
+    reference = None
+    for workers in map(int, args.workers.split(",")):
+        times = []
+        for _ in xrange(args.repeat):
+            _elapsed, _mem, (num_comp, elapsed, adjacencies) = \
+                    measure(_infer_adjacencies, perms, phylogeny, workers)
+            times.append(elapsed)
+        if reference is None:
+            reference = adjacencies
+        rows.append([workers, num_comp, "{0:.3f}".format(min(times)),
+                     "yes" if adjacencies == reference else "NO"])
+    print_table(["workers", "components", "inference (s)", "same result"],
+                rows)
+
+
+def _component_matching_graphs(args):
+    """
+    Trimmed weighted components (as given to the matching
+    during adjacency inference) with at least 3 nodes
+    """
+    perms, phylogeny = load_data(args)
+    inferer = AdjacencyInferer(BreakpointGraph(perms), phylogeny)
+    inferer.trimmed_count = 0
+    graphs = []
+    for subgraph in inferer.main_graph.connected_components():
+        trimmed = inferer._trim_known_edges(subgraph.to_weighted_graph(phylogeny))
+        for component in nx.connected_component_subgraphs(trimmed):
+            if len(component) > 2:
+                for v1, v2 in component.edges_iter():
+                    component[v1][v2]["weight"] = -component[v1][v2]["weight"]
+                graphs.append(component)
+    return graphs
+
+
+def _random_matching_graphs(args, bipartite):
+    rnd = random.Random(args.seed)
+    graphs = []
+    for _ in xrange(args.queries):
+        graph = nx.Graph()
+        if bipartite:
+            left = ["p{0}".format(i) for i in xrange(args.matching_size / 2)]
+            right = ["g{0}".format(i) for i in xrange(args.matching_size / 2)]
+            graph.add_nodes_from(left, profile=True)
+            graph.add_nodes_from(right, profile=False)
+            pairs = [(u, v) for u in left for v in right]
+        else:
+            nodes = range(args.matching_size)
+            graph.add_nodes_from(nodes)
+            pairs = [(u, v) for u in nodes for v in nodes if u < v]
+        for u, v in pairs:
+            if rnd.random() < 0.3:
+                graph.add_edge(u, v, weight=-rnd.choice([0.0, 0.5, 1.0,
+                                                         rnd.random()]))
+        graphs.append(graph)
+    return graphs
+
+
+def _run_matchings(graphs, engine, guesses=None):
+    start = time.time()
+    results = []
+    for i, graph in enumerate(graphs):
+        if engine == "networkx":
+            results.append(nx.max_weight_matching(graph, maxcardinality=True))
+        elif engine == "blossom":
+            results.append(max_weight_matching(graph, maxcardinality=True))
+        elif engine == "warm-start":
+            results.append(max_weight_matching(graph, maxcardinality=True,
+                                               initial=guesses[i]))
+        elif engine == "approximate":
+            results.append(approx_max_weight_matching(graph)[0])
+        else:
+            profiles = set(n for n in graph if graph.node[n]["profile"])
+            results.append(max_weight_bipartite_matching(graph, profiles))
+    return time.time() - start, results
+
+
+def _matching_weight(graph, mate):
+    return sum(graph[u][v]["weight"] for u, v in mate.items()) / 2.0
+
+
+def bench_matching(args):
+    """
+    Maximum weight matching: networkx vs array-based blossom
+    (and assignment solver for bipartite graphs). Matchings should
+    have the same size and weight, equal matchings are counted too.
+    Approximate matching is expected to be optimal only sometimes.
+    Warm start gets the networkx matching as a guess, which is
+    accepted only if it is the unique optimum
+    """
+    rows = []
+    datasets = [("components", _component_matching_graphs(args),
+                 ["blossom", "warm-start", "approximate"]),
+                ("random", _random_matching_graphs(args, False),
+                 ["blossom", "warm-start", "approximate"]),
+                ("bipartite", _random_matching_graphs(args, True),
+                 ["blossom", "assignment"])]
+
+    for name, graphs, engines in datasets:
+        nx_time, nx_results = _run_matchings(graphs, "networkx")
+        rows.append([name, len(graphs), "networkx",
+                     "{0:.3f}".format(nx_time), "-", "-"])
+        for engine in engines:
+            elapsed, results = _run_matchings(graphs, engine, nx_results)
+            optimal = equal = 0
+            for graph, expected, result in zip(graphs, nx_results, results):
+                equal += int(expected == result)
+                optimal += int(len(expected) == len(result) and
+                               abs(_matching_weight(graph, expected) -
+                                   _matching_weight(graph, result)) < 1e-9)
+            rows.append([name, len(graphs), engine, "{0:.3f}".format(elapsed),
+                         "{0}/{1}".format(optimal, len(graphs)),
+                         "{0}/{1}".format(equal, len(graphs))])
+    print_table(["graphs", "count", "engine", "time (s)", "optimal",
+                 "same as networkx"], rows)
+
+
+BENCHMARKS = {"inference-workers" : bench_inference_workers,
+              "matching" : bench_matching}
@@ -0,0 +1,312 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Benchmarks of blocks_coords parsing and permutation processing
+"""
+
+import os
+import time
+import random
+import hashlib
+import shutil
+from collections import defaultdict
+from copy import deepcopy
+
+from ragout.shared.datatypes import Block, Permutation
+from ragout.breakpoint_graph.permutation import (_read_blocks_coords,
+                                                 _find_repeats,
+                                                 _check_coverage,
+                                                 _filter_permutations)
+from ragout.breakpoint_graph.chimera_detector import ChimeraDetector
+
+from benchmarks.common import (SyntheticContainer, load_data, measure,
+                               print_table)
+
+
+def _write_blocks_coords(perms, filename):
+    """
+    Writes permutations in blocks_coords format
+    """
+    SEPARATOR = "-" * 80
+    by_block = defaultdict(list)
+    with open(filename, "w") as f:
+        f.write("Seq_id\tSize\tDescription\n")
+        for seq_id, perm in enumerate(perms, 1):
+            f.write("{0}\t{1}\t{2}.{3}\n".format(seq_id, perm.seq_len,
+                                                perm.genome_name,
+                                                perm.chr_name))
+            for block in perm.blocks:
+                by_block[block.block_id].append((seq_id, block))
+        f.write(SEPARATOR + "\n")
+        for block_id, instances in sorted(by_block.items()):
+            f.write("Block #{0}\nSeq_id\tStrand\tStart\tEnd\tLength\n"
+                    .format(block_id))
+            for seq_id, block in instances:
+                start, end = block.start, block.end
+                if block.sign < 0:
+                    start, end = end, start
+                f.write("{0}\t{1}\t{2}\t{3}\t{4}\n"
+                        .format(seq_id, "+" if block.sign > 0 else "-",
+                                start, end, block.length()))
+            f.write(SEPARATOR + "\n")
+
+
+def _legacy_parse(filename):
+    perm_by_id = {}
+    with open(filename, "r") as f:
+        header = True
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if header:
+                if line.startswith("Seq_id"):
+                    continue
+                if line.startswith("-"):
+                    header = False
+                    continue
+                chr_id, chr_size, seq_name = line.split("\t")
+                genome_name, chr_name = seq_name.split(".", 1)
+                perm_by_id[chr_id] = Permutation(genome_name, chr_name,
+                                                 int(chr_size), [])
+            else:
+                if line.startswith("Seq_id") or line.startswith("-"):
+                    continue
+                if line.startswith("Block"):
+                    block_id = int(line.split(" ")[1][1:])
+                    continue
+                seq_id, sign, start, end, length = line.split("\t")
+                if sign == "-":
+                    start, end = end, start
+                sign_num = 1 if sign == "+" else -1
+                perm_by_id[seq_id].blocks.append(Block(block_id, sign_num,
+                                                      int(start), int(end)))
+
+    for perm in perm_by_id.values():
+        perm.blocks.sort(key=lambda b: b.start)
+    perms = list(filter(lambda b: len(b.blocks), perm_by_id.values()))
+
+    #coverage and repeats
+    by_genome = defaultdict(list)
+    for perm in perms:
+        by_genome[perm.genome_name].append(perm)
+    for genome_perms in by_genome.values():
+        sum(p.length() for p in genome_perms)
+        sum(b.length() for p in genome_perms for b in p.blocks)
+    index = defaultdict(set)
+    repeats = set()
+    for perm in perms:
+        for block in perm.blocks:
+            if perm.genome_name in index[block.block_id]:
+                repeats.add(block.block_id)
+            else:
+                index[block.block_id].add(perm.genome_name)
+    return perms, repeats
+
+
+def _columnar_parse(filename, use_cache=False):
+    columns = _read_blocks_coords(filename, use_cache)
+    genomes = set(g for g, _chr, _len in columns.sequences)
+    _check_coverage(columns, genomes)
+    return columns.permutations(), _find_repeats(columns, genomes)
+
+
+def _cached_parse(filename):
+    return _columnar_parse(filename, use_cache=True)
+
+
+def _parse_summary(parse, filename):
+    """
+    Parsing time, number of parsed sequences
+    and a digest of the parsed data
+    """
+    start = time.time()
+    perms, repeats = parse(filename)
+    elapsed = time.time() - start
+    digest = hashlib.md5(str(sorted(repeats)))
+    for perm in perms:
+        digest.update(str((perm.genome_name, perm.chr_name, perm.seq_len)))
+        digest.update(str([(b.signed_id(), b.start, b.end)
+                           for b in perm.blocks]))
+    return elapsed, len(perms), digest.hexdigest()
+
+
+def bench_parse(args):
+    """
+    Parsing blocks_coords file (with coverage check and repeats search):
+    line-by-line parser creating blocks right away vs columnar parser
+    vs loading the columns from the binary cache. Synthetic permutations
+    (or the given file) are written to a temporary file first
+    """
+    filename = os.path.abspath("blocks_coords.txt")
+    if args.coords:
+        shutil.copy(args.coords, filename)
+    else:
+        perms = SyntheticContainer(args.genomes, args.blocks, args.contigs,
+                                   args.seed, args.reversals)
+        _write_blocks_coords(perms.ref_perms + perms.target_perms, filename)
+    _cached_parse(filename)
+
+    rows = []
+    reference = None
+    for name, parse in [("line-by-line", _legacy_parse),
+                        ("columnar", _columnar_parse),
+                        ("binary cache", _cached_parse)]:
+        times, memory = [], []
+        for _ in xrange(args.repeat):
+            _elapsed, mem, (elapsed, num_perms, digest) = \
+                    measure(_parse_summary, parse, filename)
+            times.append(elapsed)
+            memory.append(mem)
+        if reference is None:
+            reference = digest
+        rows.append([name, num_perms, "{0:.3f}".format(min(times)),
+                     "{0:.1f}".format(min(memory)),
+                     "yes" if digest == reference else "NO"])
+    print_table(["parser", "sequences", "time (s)", "memory (MB)",
+                 "same result"], rows)
+
+
+def _legacy_filter(permutations, blocks, inverse=False):
+    """
+    Filtering with a deep copy of every permutation, as it was
+    done before permutations shared blocks, kept for comparison
+    """
+    new_perms = []
+    for perm in permutations:
+        new_blocks = [b for b in perm.blocks
+                      if (b.block_id in blocks) != inverse]
+        if new_blocks:
+            new_perms.append(deepcopy(perm))
+            new_perms[-1].blocks = new_blocks
+    return new_perms
+
+
+def _legacy_break_permutation(permutation, break_points):
+    broken_perms = []
+    cuts_stack = sorted(break_points) + [permutation.seq_len]
+    current_perm = deepcopy(permutation)
+    current_perm.blocks = []
+    shift = 0
+    for block in permutation.blocks:
+        if block.end <= cuts_stack[0]:
+            block.start -= shift
+            block.end -= shift
+            current_perm.blocks.append(block)
+            continue
+        if block.start < cuts_stack[0]:
+            block.start = cuts_stack[0]
+        current_perm.seq_start = shift
+        current_perm.seq_end = cuts_stack[0]
+        if current_perm.blocks:
+            broken_perms.append(current_perm)
+        shift = cuts_stack.pop(0)
+        current_perm = deepcopy(permutation)
+        block.start -= shift
+        block.end -= shift
+        current_perm.blocks = [block]
+    current_perm.seq_start = shift
+    current_perm.seq_end = cuts_stack[0]
+    if current_perm.blocks:
+        broken_perms.append(current_perm)
+    return broken_perms
+
+
+def _legacy_break_contigs(detector, perm_container, block_sizes):
+    new_container = deepcopy(perm_container)
+    new_target_perms = []
+    for perm in new_container.target_perms:
+        break_points = set()
+        for size in block_sizes:
+            break_points.update(detector.hierarchical_cuts[perm.chr_name][size])
+        if not break_points:
+            new_target_perms.append(perm)
+        else:
+            new_target_perms.extend(_legacy_break_permutation(perm,
+                                                              break_points))
+    new_container.target_perms = new_target_perms
+    return new_container
+
+
+def _random_cuts(perm_container, rnd):
+    """
+    Chimera detector with a cut between random adjacent
+    blocks in every tenth target sequence
+    """
+    detector = ChimeraDetector.__new__(ChimeraDetector)
+    detector.hierarchical_cuts = defaultdict(lambda : defaultdict(list))
+    for perm in perm_container.target_perms:
+        if len(perm.blocks) > 1 and rnd.random() < 0.1:
+            pos = rnd.randrange(1, len(perm.blocks))
+            cut = (perm.blocks[pos - 1].end + perm.blocks[pos].start) / 2
+            detector.hierarchical_cuts[perm.chr_name][0].append(cut)
+    return detector
+
+
+def _filter_and_break(perm_container, legacy):
+    """
+    Indel and repeat filtering of all permutations followed
+    by two rounds of contig breaking, as done for every stage
+    """
+    rnd = random.Random(1)
+    filter_perms = _legacy_filter if legacy else _filter_permutations
+    perms = perm_container.ref_perms + perm_container.target_perms
+    block_ids = set(b.block_id for p in perms for b in p.blocks)
+    to_keep = set(b for b in block_ids if rnd.random() < 0.95)
+    repeats = set(b for b in to_keep if rnd.random() < 0.05)
+
+    start = time.time()
+    for attr in ["ref_perms", "target_perms"]:
+        filtered = filter_perms(getattr(perm_container, attr), to_keep)
+        filtered = filter_perms(filtered, repeats, inverse=True)
+        setattr(perm_container, attr, filtered)
+    filter_time = time.time() - start
+
+    detector = _random_cuts(perm_container, rnd)
+    start = time.time()
+    broken = []
+    for _ in xrange(2):
+        if legacy:
+            broken.append(_legacy_break_contigs(detector, perm_container, [0]))
+        else:
+            broken.append(detector.break_contigs(perm_container, [0]))
+    break_time = time.time() - start
+
+    digest = hashlib.md5()
+    for perm in broken[-1].ref_perms + broken[-1].target_perms:
+        digest.update(str((perm.chr_name, perm.seq_start, perm.seq_end)))
+        digest.update(str([(b.signed_id(), b.start, b.end)
+                           for b in perm.blocks]))
+    return filter_time, break_time, digest.hexdigest()
+
+
+def bench_break_contigs(args):
+    """
+    Permutation filtering and contig breaking: deep copies
+    of permutations vs copies sharing the blocks
+    """
+    perms, _phylogeny = load_data(args)
+    rows = []
+    reference = None
+    for name, legacy in [("deepcopy", True), ("shared blocks", False)]:
+        filter_times, break_times, memory = [], [], []
+        for _ in xrange(args.repeat):
+            _elapsed, mem, (filter_time, break_time, digest) = \
+                    measure(_filter_and_break, perms, legacy)
+            filter_times.append(filter_time)
+            break_times.append(break_time)
+            memory.append(mem)
+        if reference is None:
+            reference = digest
+        rows.append([name, "{0:.3f}".format(min(filter_times)),
+                     "{0:.3f}".format(min(break_times)),
+                     "{0:.1f}".format(min(memory)),
+                     "yes" if digest == reference else "NO"])
+    print_table(["permutations", "filter (s)", "break x2 (s)",
+                 "memory (MB)", "same result"], rows)
+
+
+BENCHMARKS = {"break-contigs" : bench_break_contigs,
+              "parse" : bench_parse}
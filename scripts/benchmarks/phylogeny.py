@@ -0,0 +1,338 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Benchmarks of phylogeny inference and parsimony scoring
+"""
+
+import time
+import random
+from collections import defaultdict
+
+import networkx as nx
+
+from ragout.parsers.recipe_parser import parse_ragout_recipe
+from ragout.phylogeny.phylogeny import Phylogeny
+from ragout.phylogeny.inferer import TreeInferer
+from ragout.breakpoint_graph.permutation import (_read_blocks_coords,
+                                                 _find_repeats)
+import ragout.breakpoint_graph.repeat_resolver as rr
+
+from benchmarks.common import (SyntheticContainer, random_tree, load_data,
+                               measure, print_table)
+
+
+def _infer_tree(perms, workers, sketch_size=None):
+    start = time.time()
+    tree = TreeInferer(perms, workers, sketch_size=sketch_size).build()
+    return time.time() - start, str(tree)
+
+
+def bench_tree_inference(args):
+    """
+    Neighbor-joining tree inference from synthetic permutations
+    with different numbers of worker processes (for breakpoint
+    distances). Trees should not depend on the number of workers
+    """
+    rows = []
+    for num_genomes in map(int, args.genome_counts.split(",")):
+        perms = SyntheticContainer(num_genomes, args.blocks, args.contigs,
+                                   args.seed, args.reversals)
+        reference = None
+        for workers in map(int, args.workers.split(",")):
+            times = []
+            for _ in xrange(args.repeat):
+                _elapsed, _mem, (elapsed, tree) = \
+                        measure(_infer_tree, perms, workers)
+                times.append(elapsed)
+            if reference is None:
+                reference = tree
+            rows.append([num_genomes, workers, "{0:.3f}".format(min(times)),
+                         "yes" if tree == reference else "NO"])
+    print_table(["genomes", "workers", "inference (s)", "same tree"], rows)
+
+
+def _tree_splits(tree):
+    """
+    Leaf bipartitions of an unrooted tree (the side without
+    the first leaf by name), trivial ones are skipped
+    """
+    leaves = frozenset(tree.leaves_identifiers)
+    first = min(leaves)
+    splits = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.terminal:
+            continue
+        for child, _bootstrap, _length in node.edges:
+            stack.append(child)
+            side = frozenset(child.leaves_identifiers)
+            if first in side:
+                side = leaves - side
+            if 1 < len(side) < len(leaves) - 1:
+                splits.add(side)
+    return splits
+
+
+def bench_sketch_tree(args):
+    """
+    Phylogeny inference from MinHash sketches of different sizes
+    vs exact breakpoint distances. Trees are compared with
+    Robinson-Foulds distance (the number of splits that are
+    not shared, normalized by the maximum possible)
+    """
+    if args.coords:
+        perms, _phylogeny = load_data(args)
+    else:
+        perms = SyntheticContainer(args.genomes, args.blocks, args.contigs,
+                                   args.seed, args.reversals)
+    sizes = [None] + list(map(int, args.sketch_sizes.split(",")))
+    genomes = set(p.genome_name for p in perms.ref_perms + perms.target_perms)
+    max_splits = max(1, 2 * (len(genomes) - 3))
+    rows = []
+    exact_splits = None
+    for sketch_size in sizes:
+        times = []
+        for _ in xrange(args.repeat):
+            _elapsed, _mem, (elapsed, tree_string) = \
+                    measure(_infer_tree, perms, 1, sketch_size)
+            times.append(elapsed)
+        splits = _tree_splits(Phylogeny.from_newick(tree_string + ";").tree)
+        if exact_splits is None:
+            exact_splits = splits
+        rf_distance = len(splits ^ exact_splits)
+        rows.append([sketch_size or "exact", "{0:.3f}".format(min(times)),
+                     rf_distance,
+                     "{0:.2f}".format(float(rf_distance) / max_splits)])
+    print_table(["sketch size", "inference (s)", "RF distance",
+                 "normalized RF"], rows)
+
+
+def _legacy_nodes_by_distance(phylogeny, genome, only_leaves):
+    graph = nx.Graph()
+    start = [None]
+    def rec_helper(root):
+        if root.identifier == genome:
+            start[0] = root
+        if root.terminal:
+            return
+        for node, _bootstrap, branch_length in root.edges:
+            graph.add_edge(root, node, weight=branch_length)
+            rec_helper(node)
+
+    rec_helper(phylogeny.tree)
+    distances = nx.single_source_dijkstra_path_length(graph, start[0])
+    nodes = [g for g in distances.keys() if g.identifier != genome and
+             (g.terminal or not only_leaves)]
+    return list(map(str, sorted(nodes, key=distances.get)))
+
+
+def bench_distance_order(args):
+    """
+    Genomes ordered by phylogenetic distance (as queried for every
+    inferred adjacency): networkx graph + Dijkstra for every query
+    vs the distance index of Phylogeny. Equally distant genomes
+    may go in different order, so only distances are compared
+    """
+    rows = []
+    rnd = random.Random(args.seed)
+    for num_genomes in map(int, args.genome_counts.split(",")):
+        genomes = ["genome{0}".format(i) for i in xrange(num_genomes)]
+        tree = random_tree(genomes, rnd)
+        queries = [rnd.choice(genomes) for _ in xrange(args.queries * 100)]
+        results = {}
+        times = {}
+        for engine in ["networkx", "index"]:
+            times[engine] = []
+            for _ in xrange(args.repeat):
+                phylogeny = Phylogeny.from_newick(tree)
+                start = time.time()
+                if engine == "networkx":
+                    orders = [_legacy_nodes_by_distance(phylogeny, g, True)
+                              for g in queries]
+                else:
+                    orders = [phylogeny.nodes_by_distance(g, True)
+                              for g in queries]
+                times[engine].append(time.time() - start)
+            results[engine] = [[phylogeny.node_distances(g)[
+                                    phylogeny._leaf_index[leaf]]
+                                for leaf in order]
+                               for g, order in zip(queries, orders)]
+        rows.append([num_genomes, len(queries),
+                     "{0:.1f}".format(min(times["networkx"]) * 1000000 /
+                                      len(queries)),
+                     "{0:.1f}".format(min(times["index"]) * 1000000 /
+                                      len(queries)),
+                     "yes" if results["networkx"] == results["index"]
+                     else "NO"])
+    print_table(["genomes", "queries", "networkx (us/query)",
+                 "index (us/query)", "same distances"], rows)
+
+
+def _random_leaf_states(phylogeny, num_states, rnd):
+    """
+    Random half-breakpoint states of the tree leaves
+    (with some "void" states)
+    """
+    states = {}
+    for leaf in phylogeny.tree.leaves:
+        states[leaf.identifier] = (None if rnd.random() < 0.2
+                                   else rnd.randint(1, num_states))
+    return states
+
+
+def bench_parsimony(args):
+    """
+    Weighted parsimony scoring time (per call) for trees of different
+    sizes: single estimate_tree calls with an empty scores cache,
+    then the same calls again (cached).
+    Target pass scores all states of one leaf with
+    estimate_target_states, ancestral pass - all states of the first
+    joined ancestor with estimate_ancestral_states
+    (both with an empty cache, per state)
+    """
+    NUM_STATES = 4
+    rows = []
+    rnd = random.Random(args.seed)
+    for num_genomes in map(int, args.genome_counts.split(",")):
+        genomes = ["genome{0}".format(i) for i in xrange(num_genomes)]
+        tree = random_tree(genomes, rnd)
+        phylogeny = Phylogeny.from_newick(tree)
+        batch = [_random_leaf_states(phylogeny, NUM_STATES, rnd)
+                 for _ in xrange(args.queries * 100)]
+
+        cold_times = []
+        warm_times = []
+        target_times = []
+        ancestral_times = []
+        target_states = range(1, NUM_STATES + 2)
+        for _ in xrange(args.repeat):
+            phylogeny = Phylogeny.from_newick(tree)
+            start = time.time()
+            cold = [phylogeny.estimate_tree(states) for states in batch]
+            cold_times.append(time.time() - start)
+            hit_rate = float(phylogeny.cache_hits) / len(batch)
+
+            start = time.time()
+            warm = [phylogeny.estimate_tree(states) for states in batch]
+            warm_times.append(time.time() - start)
+            assert cold == warm
+
+            phylogeny = Phylogeny.from_newick(tree)
+            start = time.time()
+            for states in batch:
+                phylogeny.estimate_target_states(states, genomes[0],
+                                                 target_states)
+            target_times.append(time.time() - start)
+
+            phylogeny = Phylogeny.from_newick(tree)
+            start = time.time()
+            for states in batch:
+                phylogeny.estimate_ancestral_states(states, "ancestor0",
+                                                    target_states)
+            ancestral_times.append(time.time() - start)
+
+        rows.append([num_genomes, len(batch),
+                     "{0:.1f}".format(min(cold_times) * 1000000 / len(batch)),
+                     "{0:.1f}".format(hit_rate * 100),
+                     "{0:.1f}".format(min(warm_times) * 1000000 / len(batch)),
+                     "{0:.1f}".format(min(target_times) * 1000000 /
+                                      len(batch) / len(target_states)),
+                     "{0:.1f}".format(min(ancestral_times) * 1000000 /
+                                      len(batch) / len(target_states))])
+    print_table(["genomes", "calls", "cold (us/call)", "cold hits (%)",
+                 "cached (us/call)", "target pass (us/state)",
+                 "ancestral pass (us/state)"], rows)
+
+
+def _legacy_parsimony_test(profile, phylogeny, target_name, draft_refs):
+    states = {g : False if g not in draft_refs else None
+              for g in phylogeny.terminals_dfs_order()}
+    for ctx in profile:
+        states[ctx.perm.genome_name] = True
+
+    states[target_name] = False
+    score_without = phylogeny.estimate_tree(states)
+    states[target_name] = True
+    score_with = phylogeny.estimate_tree(states)
+    return score_with < score_without
+
+
+def _repeat_profiles(args):
+    """
+    Repeat profiles of the references, as given to the parsimony test
+    when resolving repeats (the permutations are not filtered)
+    """
+    recipe = parse_ragout_recipe(args.recipe)
+    phylogeny = Phylogeny.from_newick(recipe["tree"])
+    ref_perms = []
+    target_perms = []
+    draft_refs = set()
+    columns = _read_blocks_coords(args.coords, use_cache=False)
+    for perm in columns.permutations():
+        if perm.genome_name not in recipe["genomes"]:
+            continue
+        if recipe["genomes"][perm.genome_name]["draft"]:
+            draft_refs.add(perm.genome_name)
+        if perm.genome_name == recipe["target"]:
+            target_perms.append(perm)
+        elif perm.genome_name in recipe["references"]:
+            ref_perms.append(perm)
+
+    repeats = _find_repeats(columns, set(recipe["references"] +
+                                         [recipe["target"]]))
+    profiles = []
+    for contexts in rr._get_contexts(ref_perms, repeats).itervalues():
+        by_genome = defaultdict(list)
+        for ctx in contexts:
+            by_genome[ctx.perm.genome_name].append(ctx)
+        profiles.extend(rr._split_into_profiles(by_genome, repeats,
+                                                phylogeny))
+    return recipe, draft_refs, profiles
+
+
+def bench_repeats(args):
+    """
+    Parsimony test of repeat profiles (--repeats): two estimate_tree
+    calls vs a single target pass, each with a fresh phylogeny.
+    Needs real data (synthetic permutations have no repeats)
+    """
+    if not args.coords:
+        raise SystemExit("repeats benchmark requires --coords and --recipe")
+
+    recipe, draft_refs, profiles = _repeat_profiles(args)
+    target = recipe["target"]
+    rows = []
+    results = {}
+    for name in ["two calls", "target pass"]:
+        times = []
+        for _ in xrange(args.repeat):
+            phylogeny = Phylogeny.from_newick(recipe["tree"])
+            start = time.time()
+            if name == "two calls":
+                passed = [_legacy_parsimony_test(p, phylogeny, target,
+                                                 draft_refs)
+                          for p in profiles]
+            else:
+                leaf_states = rr._leaf_states(phylogeny, draft_refs)
+                passed = [rr._parsimony_test(p, phylogeny, target,
+                                             leaf_states)
+                          for p in profiles]
+            times.append(time.time() - start)
+        results[name] = passed
+        rows.append([name, len(profiles), sum(passed),
+                     "{0:.3f}".format(min(times)),
+                     "{0:.1f}".format(min(times) * 1000000 /
+                                      max(1, len(profiles))),
+                     "yes" if passed == results["two calls"] else "NO"])
+    print_table(["engine", "profiles", "passed", "time (s)",
+                 "us/profile", "same result"], rows)
+
+
+BENCHMARKS = {"distance-order" : bench_distance_order,
+              "parsimony" : bench_parsimony,
+              "repeats" : bench_repeats,
+              "sketch-tree" : bench_sketch_tree,
+              "tree-inference" : bench_tree_inference}
@@ -0,0 +1,97 @@
+#!/usr/bin/env python2.7
+
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+A script for benchmarking Ragout internals on real
+(blocks_coords.txt + recipe) or synthetic permutations.
+Benchmarks of every subsystem are in the benchmarks package
+"""
+
+import os
+import sys
+import argparse
+import shutil
+import tempfile
+
+ragout_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ragout_root, "lib"))
+sys.path.insert(0, ragout_root)
+
+import benchmarks.graph
+import benchmarks.matching
+import benchmarks.permutation
+import benchmarks.phylogeny
+
+
+BENCHMARKS = {}
+for module in [benchmarks.graph, benchmarks.matching,
+               benchmarks.permutation, benchmarks.phylogeny]:
+    BENCHMARKS.update(module.BENCHMARKS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Ragout "
+                                     "internals", formatter_class= \
+                                     argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS.keys()),
+                        help="benchmark to run")
+    parser.add_argument("--coords", dest="coords", default=None,
+                        help="blocks_coords.txt file (synthetic data if "
+                        "not set)")
+    parser.add_argument("--recipe", dest="recipe", default=None,
+                        help="recipe file for the coords file")
+    parser.add_argument("--genomes", dest="genomes", type=int, default=5,
+                        help="number of synthetic genomes")
+    parser.add_argument("--genome-counts", dest="genome_counts",
+                        default="5,10,25,50,100,200",
+                        help="comma-separated numbers of synthetic genomes "
+                        "for scaling benchmarks")
+    parser.add_argument("--blocks", dest="blocks", type=int, default=20000,
+                        help="number of synthetic blocks")
+    parser.add_argument("--contigs", dest="contigs", type=int, default=500,
+                        help="number of synthetic target contigs")
+    parser.add_argument("--reversals", dest="reversals", type=int,
+                        default=None, help="number of synthetic reversals "
+                        "per genome (blocks / 50 + 1 if not set)")
+    parser.add_argument("--seed", dest="seed", type=int, default=1,
+                        help="random seed for synthetic data")
+    parser.add_argument("--queries", dest="queries", type=int, default=10,
+                        help="number of queries per edge in query benchmarks")
+    parser.add_argument("--matching-size", dest="matching_size", type=int,
+                        default=60, help="number of nodes in random "
+                        "matching graphs")
+    parser.add_argument("--workers", dest="workers", default="1,2,4",
+                        help="comma-separated numbers of worker processes "
+                        "for parallel benchmarks")
+    parser.add_argument("--sketch-sizes", dest="sketch_sizes",
+                        default="100,1000,10000",
+                        help="comma-separated MinHash sketch sizes "
+                        "for the sketch tree benchmark")
+    parser.add_argument("--timeout", dest="timeout", type=int, default=60,
+                        help="time limit for the slow reference "
+                        "implementations (sec)")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                        help="number of repetitions (best one is reported)")
+    args = parser.parse_args()
+
+    if args.coords and not args.recipe:
+        parser.error("--recipe is required with --coords")
+
+    #keeping stray output files away from the working directory
+    for attr in ["coords", "recipe"]:
+        if getattr(args, attr):
+            setattr(args, attr, os.path.abspath(getattr(args, attr)))
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    try:
+        BENCHMARKS[args.benchmark](args)
+    finally:
+        shutil.rmtree(work_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Unit and regression tests. Run from the Ragout root with
+"python2.7 -m unittest discover -s tests -t ." (or "make unittest")
+"""
+
+import os
+import sys
+
+ragout_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ragout_root, "lib"))
+sys.path.insert(0, ragout_root)
+
+DATA_DIR = os.path.join(ragout_root, "tests", "data")
+PRIMATES_COORDS = os.path.join(ragout_root, "BenchMark", "primates2",
+                               "hal-workdir", "1000", "blocks_coords.txt")
@@ -0,0 +1,211 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Checks the alternating cycle search of chimera detection against
+the exhaustive recursion it replaced, on dense random components
+"""
+
+import random
+import unittest
+
+from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
+from ragout.shared.datatypes import Block, Permutation
+from ragout.shared import config
+
+
+def _reference_cycle(graph, node_1, node_2, max_len=None):
+    """
+    Enumerates all alternating paths (of at most max_len nodes)
+    recursively, then checks them in the order they were found
+    """
+    visited = set()
+    def rec_helper(node, colored):
+        if node == node_2:
+            return [[node_2]]
+
+        visited.add(node)
+        paths = []
+        for neighbor in graph.neighbors(node):
+            if neighbor in visited:
+                continue
+            if (max_len is not None and neighbor != node_2 and
+                    len(visited) + 2 > max_len):
+                continue
+            genomes = graph.genomes_support(node, neighbor)
+            non_target = set(g for g in genomes if g != graph.target)
+            if colored and len(non_target) == 0:
+                continue
+            if not colored and graph.target not in genomes:
+                continue
+
+            far_paths = rec_helper(neighbor, not colored)
+            for path in far_paths:
+                path.append(node)
+            paths.extend(far_paths)
+        visited.remove(node)
+        return paths
+
+    for path in [p[::-1] for p in rec_helper(node_1, True)]:
+        if len(path) % 2 != 0:
+            return None
+        if len(path) == 2:
+            continue
+        edges = list(zip(path[:-1], path[1:]))
+        if not all(set(graph.genomes_support(u, v)) == set([graph.target])
+                   for u, v in edges[1::2]):
+            continue
+        common = set(graph.genomes_support(*edges[0]))
+        for u, v in edges[2::2]:
+            common &= set(graph.genomes_support(u, v))
+        if common:
+            return len(path) / 2
+    return None
+
+
+class _Container:
+    def __init__(self, ref_perms, target_perms):
+        self.ref_perms = ref_perms
+        self.target_perms = target_perms
+        self.ancestor_perms = []
+
+
+def _permutations(rnd, genome, signed_ids, num_pieces, draft):
+    cuts = sorted(rnd.sample(xrange(1, len(signed_ids)), num_pieces - 1))
+    perms = []
+    for chr_id, (start, end) in enumerate(zip([0] + cuts,
+                                              cuts + [len(signed_ids)])):
+        blocks = [Block(abs(b), 1 if b > 0 else -1, pos * 100, pos * 100 + 50)
+                  for pos, b in enumerate(signed_ids[start:end])]
+        perm = Permutation(genome, "chr{0}".format(chr_id),
+                           len(blocks) * 100, blocks)
+        perm.draft = draft
+        perms.append(perm)
+    return perms
+
+
+def _dense_graph(rnd, num_genomes, num_blocks):
+    """
+    Breakpoint graph of randomly shuffled genomes, so most
+    of the nodes are in one dense component
+    """
+    def shuffled():
+        ids = [rnd.choice([-1, 1]) * (i + 1) for i in xrange(num_blocks)]
+        rnd.shuffle(ids)
+        return ids
+
+    ref_perms = []
+    for i in xrange(num_genomes - 1):
+        ref_perms.extend(_permutations(rnd, "ref{0}".format(i), shuffled(),
+                                       rnd.randint(1, 2), False))
+    target_perms = _permutations(rnd, "target", shuffled(),
+                                 rnd.randint(2, 4), True)
+    return BreakpointGraph(_Container(ref_perms, target_perms))
+
+
+def _chimera_queries(graph):
+    """
+    Edges checked by the chimera detector, with their components
+    """
+    target_mask = graph.genome_mask(graph.target)
+    for subgr in graph.connected_components():
+        for edge in subgr.genome_edges(subgr.target):
+            u, v = edge.node_1, edge.node_2
+            if (subgr.genomes_mask(u, v) == target_mask
+                    or subgr.is_infinity(u, v)):
+                yield subgr, u, v
+
+
+class AlternatingCycleTest(unittest.TestCase):
+    def setUp(self):
+        self.max_path = config.vals["max_alternating_path"]
+
+    def tearDown(self):
+        config.vals["max_alternating_path"] = self.max_path
+
+    def assert_same_cycles(self, graphs, max_len):
+        """
+        Same chimera calls and cycle lengths as the exhaustive search
+        """
+        config.vals["max_alternating_path"] = max_len
+        num_queries = 0
+        num_cycles = 0
+        for graph in graphs:
+            for subgr, u, v in _chimera_queries(graph):
+                cycle = subgr.alternating_cycle(u, v)
+                self.assertEqual(cycle, _reference_cycle(subgr, u, v,
+                                                         max_len))
+                num_queries += 1
+                num_cycles += cycle is not None
+        self.assertGreater(num_cycles, 0)
+        self.assertGreater(num_queries, num_cycles)
+
+    def test_dense_components(self):
+        rnd = random.Random(1)
+        self.assert_same_cycles([_dense_graph(rnd, rnd.randint(3, 5),
+                                              rnd.randint(4, 10))
+                                 for _ in xrange(60)], None)
+
+    def test_bounded_search(self):
+        rnd = random.Random(3)
+        graphs = [_dense_graph(rnd, rnd.randint(3, 5), rnd.randint(4, 10))
+                  for _ in xrange(60)]
+        for max_len in [4, 6, 8]:
+            self.assert_same_cycles(graphs, max_len)
+
+    def test_large_dense_component(self):
+        """
+        The unbounded search is not feasible on a large dense
+        component, a bounded one is
+        """
+        rnd = random.Random(4)
+        graph = _dense_graph(rnd, 6, 200)
+        self.assertGreater(len(graph.connected_components()[0]), 300)
+        self.assert_same_cycles([graph], 8)
+
+    def test_cached_cycles(self):
+        rnd = random.Random(2)
+        graph = _dense_graph(rnd, 4, 8)
+        cache = {}
+        for subgr in graph.connected_components():
+            for edge in subgr.genome_edges(subgr.target):
+                u, v = edge.node_1, edge.node_2
+                expected = subgr.alternating_cycle(u, v)
+                self.assertEqual(subgr.alternating_cycle(u, v, cache),
+                                 expected)
+                self.assertEqual(subgr.alternating_cycle(u, v, cache),
+                                 expected)
+
+
+class ComponentViewTest(unittest.TestCase):
+    def test_views(self):
+        rnd = random.Random(5)
+        graph = _dense_graph(rnd, 2, 30)
+        components = graph.connected_components()
+        self.assertGreater(len(components), 1)
+        graph_fingerprint = graph.component_fingerprint()
+
+        all_nodes = []
+        for subgr in components:
+            all_nodes.extend(subgr.nodes())
+            nodes = set(subgr.nodes())
+            self.assertEqual(len(nodes), len(subgr))
+            for node in nodes:
+                self.assertTrue(set(subgr.neighbors(node)) <= nodes)
+                self.assertEqual(set(subgr.neighbors(node)),
+                                 set(graph.neighbors(node)))
+            for edge in subgr.iter_edges():
+                self.assertIn(edge.node_1, nodes)
+                self.assertIn(edge.node_2, nodes)
+            other = components[0 if subgr is not components[0] else 1]
+            node = other.nodes()[0]
+            self.assertRaises(KeyError, subgr.neighbors, node)
+            self.assertFalse(subgr.has_edge(node, other.neighbors(node)[0]))
+            #caches are not shared with the graph
+            self.assertNotEqual(subgr.component_fingerprint(),
+                                graph_fingerprint)
+        self.assertEqual(graph.component_fingerprint(), graph_fingerprint)
+        self.assertEqual(sorted(all_nodes), sorted(graph.nodes()))
+        self.assertEqual(sum(s.num_edges() for s in components),
+                         graph.num_edges())
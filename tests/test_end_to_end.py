@@ -0,0 +1,171 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Runs Ragout on the example datasets with precomputed synteny blocks
+and compares the output links with the ones recorded from the original
+networkx-based code (tests/data). Regenerate them only for intended
+changes of the results
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from tests import ragout_root, DATA_DIR
+import ragout.main as main
+import ragout.maf2synteny.maf2synteny as m2s
+import ragout.overlap.overlap as overlap
+from ragout.breakpoint_graph import permutation as perm
+from ragout.breakpoint_graph.inferer import SolutionCache
+from ragout.shared import config
+from ragout.shared.debug import DEBUG_ARTIFACTS
+from ragout.synteny_backend.synteny_backend import SyntenyBackend
+
+logger = logging.getLogger()
+
+
+def _write_fasta(coords_files, genome, filename):
+    """
+    Random sequences of the genome's chromosomes, with
+    the lengths given in blocks_coords files
+    """
+    rnd = random.Random(42)
+    written = set()
+    with open(filename, "w") as f:
+        for coords in coords_files:
+            for line in open(coords):
+                if line.startswith("-"):
+                    break
+                seq_id, seq_len, seq_name = line.strip().split("\t")
+                if seq_id == "Seq_id":
+                    continue
+                seq_genome, chr_name = seq_name.split(".", 1)
+                if seq_genome != genome or chr_name in written:
+                    continue
+                written.add(chr_name)
+                seq_len = int(seq_len)
+                sequence = "".join(rnd.choice("ACGTNNNN")
+                                   for _ in xrange(seq_len))
+                f.write(">" + chr_name + "\n")
+                for i in xrange(0, seq_len, 60):
+                    f.write(sequence[i:i + 60] + "\n")
+
+
+class PrecomputedBackend(SyntenyBackend):
+    """
+    Returns blocks_coords files of a dataset instead of running
+    a synteny backend. FASTA files are generated
+    """
+    def __init__(self, blocks_dir):
+        SyntenyBackend.__init__(self)
+        self.blocks_dir = blocks_dir
+
+    def run_backend(self, recipe, output_dir, overwrite, ancestral=False):
+        coords = [os.path.join(self.blocks_dir, str(block), "blocks_coords.txt")
+                  for block in self.blocks]
+        self.target_fasta = os.path.join(output_dir, "target.fasta")
+        self.ancestor_fasta = os.path.join(output_dir, "ancestor.fasta")
+        _write_fasta(coords, recipe["target"], self.target_fasta)
+        _write_fasta(coords, recipe["ancestor"], self.ancestor_fasta)
+        return dict(zip(self.blocks, coords))
+
+
+class EndToEndTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.saved = (dict(config.vals["blocks"]),
+                      SyntenyBackend.backends.get("maf"),
+                      m2s.check_binary, overlap.check_binary,
+                      list(logger.handlers), os.getcwd())
+        m2s.check_binary = lambda: True
+        overlap.check_binary = lambda: True
+        SolutionCache.instance = None
+
+    def tearDown(self):
+        (blocks, backend, m2s.check_binary,
+         overlap.check_binary, handlers, cwd) = self.saved
+        config.vals["blocks"] = blocks
+        if backend is None:
+            del SyntenyBackend.backends["maf"]
+        else:
+            SyntenyBackend.backends["maf"] = backend
+        for handler in logger.handlers[:]:
+            if handler not in handlers:
+                logger.removeHandler(handler)
+                handler.close()
+        os.chdir(cwd)
+        SolutionCache.instance = None
+        perm.release_parsed_blocks()
+        shutil.rmtree(self.work_dir)
+
+    def run_dataset(self, dataset, blocks_dir, block_sizes, **options):
+        """
+        Runs Ragout with ancestor reconstruction, returns
+        the output directory
+        """
+        #coords are copied, so the binary cache is not written
+        #into the repository
+        local_blocks = os.path.join(self.work_dir, "blocks")
+        for block in block_sizes:
+            os.makedirs(os.path.join(local_blocks, str(block)))
+            shutil.copy(os.path.join(ragout_root, blocks_dir, str(block),
+                                     "blocks_coords.txt"),
+                        os.path.join(local_blocks, str(block)))
+        config.vals["blocks"]["small"] = block_sizes
+        SyntenyBackend.backends["maf"] = PrecomputedBackend(local_blocks)
+
+        out_dir = os.path.join(self.work_dir, "out")
+        args = argparse.Namespace(recipe=os.path.join(DATA_DIR,
+                                                      dataset + ".rcp"),
+                                  out_dir=out_dir, synteny_backend="maf",
+                                  no_refine=True, solid_scaffolds=False,
+                                  overwrite=False, resolve_repeats=False,
+                                  targetDone=False, ancestor_reconstruct=True,
+                                  debug=False, debug_artifacts=DEBUG_ARTIFACTS,
+                                  approx_matching=None, sketch_phylogeny=None,
+                                  solutions_cache=False, threads=1)
+        for name, value in options.items():
+            setattr(args, name, value)
+
+        #console log is not shown
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            os.chdir(self.work_dir)
+            main.run_ragout(args)
+        finally:
+            sys.stderr = stderr
+        return out_dir
+
+    def assert_links(self, dataset, out_dir):
+        expected_dir = os.path.join(DATA_DIR, dataset)
+        for filename in sorted(os.listdir(expected_dir)):
+            with open(os.path.join(expected_dir, filename)) as f:
+                expected = f.read()
+            with open(os.path.join(out_dir, filename)) as f:
+                self.assertEqual(f.read(), expected,
+                                 "{0} differs".format(filename))
+
+    def test_primates(self):
+        out_dir = self.run_dataset("primates", "BenchMark/primates2/hal-workdir",
+                                   [5000, 1000, 500])
+        self.assert_links("primates", out_dir)
+
+    def test_primates_threads(self):
+        out_dir = self.run_dataset("primates", "BenchMark/primates2/hal-workdir",
+                                   [5000, 1000, 500], threads=2,
+                                   solutions_cache=True)
+        self.assert_links("primates", out_dir)
+
+    def test_pestis(self):
+        out_dir = self.run_dataset("pestis", "petis.root/hal-workdir",
+                                   [5000, 500, 100])
+        self.assert_links("pestis", out_dir)
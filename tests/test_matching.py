@@ -0,0 +1,176 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Checks matching algorithms against networkx.max_weight_matching
+on random graphs, and the matching guesses of the next stages
+"""
+
+import random
+import unittest
+
+import networkx as nx
+
+from ragout.breakpoint_graph.matching import (max_weight_matching,
+                                              max_weight_bipartite_matching,
+                                              approx_max_weight_matching)
+from ragout.breakpoint_graph.inferer import Adjacency
+from ragout.main import RunStage, matching_guess
+from ragout.shared.datatypes import Block, Permutation
+
+EPS = 1e-9
+
+
+def _random_graph(rnd):
+    """
+    Random graph with integer, float, tied or tree-like weights
+    (negative weights as in breakpoint graphs)
+    """
+    num_nodes = rnd.randint(1, 30)
+    nodes = rnd.sample(range(-100, 100), num_nodes)
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    kind = rnd.choice(["int", "float", "tie", "tree"])
+    if kind == "tree":
+        for i in xrange(1, num_nodes):
+            graph.add_edge(nodes[i], nodes[rnd.randrange(i)],
+                           weight=rnd.choice([-1.0, -0.5, 0.25]))
+        return graph
+
+    density = rnd.choice([0.1, 0.2, 0.5, 0.9])
+    for i in xrange(num_nodes):
+        for j in xrange(i + 1, num_nodes):
+            if rnd.random() < density:
+                weight = {"int": rnd.randint(-10, 10),
+                          "float": rnd.uniform(-1, 1),
+                          "tie": rnd.choice([-1.0, -0.5, 0.0])}[kind]
+                graph.add_edge(nodes[i], nodes[j], weight=weight)
+    return graph
+
+
+def _matching_weight(graph, mate):
+    return sum(graph[u][v].get("weight", 1) for u, v in mate.items()) / 2.0
+
+
+class MatchingTest(unittest.TestCase):
+    def assert_valid(self, graph, mate):
+        for u, v in mate.items():
+            self.assertEqual(mate.get(v), u)
+            self.assertTrue(graph.has_edge(u, v))
+
+    def assert_optimal(self, graph, mate, expected):
+        self.assert_valid(graph, mate)
+        self.assertEqual(len(mate), len(expected))
+        self.assertAlmostEqual(_matching_weight(graph, mate),
+                               _matching_weight(graph, expected),
+                               delta=EPS)
+
+    def test_max_weight_matching(self):
+        rnd = random.Random(1)
+        for _ in xrange(500):
+            graph = _random_graph(rnd)
+            for maxcardinality in [False, True]:
+                expected = nx.max_weight_matching(graph, maxcardinality)
+                mate = max_weight_matching(graph, maxcardinality)
+                self.assert_optimal(graph, mate, expected)
+
+    def test_initial_guess(self):
+        """
+        A guess (right or wrong) never changes the optimum
+        """
+        rnd = random.Random(2)
+        for _ in xrange(300):
+            graph = _random_graph(rnd)
+            expected = nx.max_weight_matching(graph, maxcardinality=True)
+            self.assert_optimal(graph, max_weight_matching(graph, True,
+                                                           initial=expected),
+                                expected)
+            other = nx.max_weight_matching(graph, maxcardinality=False)
+            self.assert_optimal(graph, max_weight_matching(graph, True,
+                                                           initial=other),
+                                expected)
+
+    def test_bipartite_matching(self):
+        rnd = random.Random(3)
+        for _ in xrange(300):
+            left = ["p{0}".format(i) for i in xrange(rnd.randint(1, 8))]
+            right = ["g{0}".format(i) for i in xrange(rnd.randint(1, 8))]
+            graph = nx.Graph()
+            graph.add_nodes_from(left + right)
+            for u in left:
+                for v in right:
+                    if rnd.random() < 0.6:
+                        weight = rnd.choice([0.0, 0.2, 0.5, 1.0, rnd.random()])
+                        graph.add_edge(u, v, weight=weight)
+            expected = nx.max_weight_matching(graph, maxcardinality=True)
+            mate = max_weight_bipartite_matching(graph, set(left))
+            self.assert_optimal(graph, mate, expected)
+
+    def test_approx_matching(self):
+        """
+        Approximate matching is valid, not better than the optimum,
+        and the bound is not less than the exact solution
+        """
+        rnd = random.Random(4)
+        for _ in xrange(300):
+            graph = _random_graph(rnd)
+            mate, bound = approx_max_weight_matching(graph)
+            self.assert_valid(graph, mate)
+            best = nx.max_weight_matching(graph, maxcardinality=False)
+            exact = nx.max_weight_matching(graph, maxcardinality=True)
+            self.assertLessEqual(_matching_weight(graph, mate),
+                                 _matching_weight(graph, best) + EPS)
+            self.assertGreaterEqual(bound, _matching_weight(graph, exact) - EPS)
+
+
+class _Container:
+    def __init__(self, sequences):
+        """
+        sequences - {chr name: [(signed block id, start, end)]}
+        """
+        self.target_perms = []
+        self.ancestor_perms = []
+        for chr_name, blocks in sorted(sequences.items()):
+            blocks = [Block(abs(b), 1 if b > 0 else -1, start, end)
+                      for b, start, end in blocks]
+            self.target_perms.append(Permutation("target", chr_name,
+                                                 10000, blocks))
+
+
+def _adjacencies(pairs):
+    adjacencies = {}
+    for node_1, node_2 in pairs:
+        adjacencies[node_1] = Adjacency(node_2, 0, frozenset(), False)
+        adjacencies[node_2] = Adjacency(node_1, 0, frozenset(), False)
+    return adjacencies
+
+
+class MatchingGuessTest(unittest.TestCase):
+    def test_block_mapping(self):
+        """
+        Adjacencies of coarse blocks are mapped to the ends
+        of the overlapping fine blocks
+        """
+        coarse = _Container({"c1" : [(1, 0, 1000), (-2, 2000, 3000)],
+                             "c2" : [(3, 0, 500)],
+                             "c3" : [(5, 0, 100), (6, 100, 200)]})
+        fine = _Container({"c1" : [(10, 0, 400), (-11, 500, 1000),
+                                   (12, 2000, 2400), (13, 2600, 3000)],
+                           "c2" : [(-14, 100, 400)],
+                           "c3" : [(15, 50, 150)]})
+        stages = [RunStage("5000", 5000, False, False, True),
+                  RunStage("500", 500, False, False, True)]
+        stage_perms = dict(zip(stages, [coarse, fine]))
+        #-5, 6 are the ends of block 15 both, 4 is not in fine blocks
+        adjacencies = _adjacencies([(-1, -2), (2, 3), (-5, 6), (4, -3)])
+
+        guess = matching_guess(stages, adjacencies, stage_perms)
+        self.assertEqual(guess, _adjacencies([(11, 12), (-13, -14)]))
+        self.assertIsNone(matching_guess(stages[:1], adjacencies,
+                                         stage_perms))
+
+        refine = RunStage("refine", 500, True, False, False)
+        stage_perms[refine] = fine
+        self.assertIs(matching_guess(stages + [refine], adjacencies,
+                                     stage_perms), adjacencies)
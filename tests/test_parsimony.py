@@ -0,0 +1,158 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Checks parsimony scores of Phylogeny against the straightforward
+recursion (which enumerates all state pairs on every branch)
+on random trees
+"""
+
+import math
+import random
+import unittest
+from collections import defaultdict
+
+from ragout.parsers.phylogeny_parser import parse_tree
+from ragout.phylogeny.phylogeny import Phylogeny, get_node
+
+INF = float("inf")
+
+
+def _branch_score(parent, child, branch, mu):
+    if parent == child or child is None:
+        return 0.0
+    length = max(branch, 0.0000001)
+    return 1.0 + math.exp(-mu * length)
+
+
+def _reference_scores(root, mu, leaf_states, internal_scores={},
+                      internal_states={}):
+    """
+    Scores of every state of the root
+    """
+    all_states = set(leaf_states.values())
+    if root.terminal:
+        return dict((s, 0.0 if s == leaf_states[root.identifier] else INF)
+                    for s in all_states)
+
+    nodes_scores = {}
+    for node, _bootstrap, _length in root.get_edges():
+        if node in internal_scores:
+            nodes_scores[node] = internal_scores[node]
+        else:
+            nodes_scores[node] = _reference_scores(node, mu, leaf_states,
+                                                   internal_scores,
+                                                   internal_states)
+
+    root_scores = defaultdict(float)
+    for root_state in all_states:
+        if (root.identifier in internal_states and
+                root_state != internal_states[root.identifier]):
+            root_scores[root_state] = INF
+            continue
+        for node, _bootstrap, branch_length in root.edges:
+            root_scores[root_state] += min(nodes_scores[node][child_state] +
+                                           _branch_score(root_state,
+                                                         child_state,
+                                                         branch_length, mu)
+                                           for child_state in all_states)
+    return root_scores
+
+
+def _reference_tree(tree, leaf_states, internal_scores={}):
+    mu = Phylogeny(tree).mu
+    if tree in internal_scores:
+        return min(internal_scores[tree])
+    return min(_reference_scores(tree, mu, leaf_states,
+                                 internal_scores).values())
+
+
+def _reference_ancestral(tree, leaf_states, ancestor, ancestor_state):
+    subtree = get_node(tree, ancestor)
+    scores = _reference_scores(subtree, Phylogeny(subtree).mu, leaf_states,
+                               internal_states={ancestor: ancestor_state})
+    return _reference_tree(tree, leaf_states, {subtree: scores})
+
+
+def _random_tree(rnd, leaves, ancestors):
+    """
+    Newick string of a random binary tree, names of the internal
+    nodes are appended to ancestors
+    """
+    if len(leaves) == 1:
+        return leaves[0]
+    split = rnd.randint(1, len(leaves) - 1)
+    name = "anc{0}".format(len(ancestors))
+    ancestors.append(name)
+    left = _random_tree(rnd, leaves[:split], ancestors)
+    right = _random_tree(rnd, leaves[split:], ancestors)
+    return "({0}:{1:.6g},{2}:{3:.6g}){4}".format(left, rnd.random(), right,
+                                       rnd.choice([0.00000001, rnd.random()]),
+                                       name)
+
+
+def _random_states(rnd, leaves, states):
+    leaf_states = dict((leaf, rnd.choice(states)) for leaf in leaves)
+    for i in xrange(rnd.randint(0, 2)):
+        #states of genomes that are not in the tree
+        leaf_states["extra{0}".format(i)] = rnd.choice(states + [7, 8])
+    return leaf_states
+
+
+class ParsimonyTest(unittest.TestCase):
+    def random_trees(self, seed, num_trees):
+        rnd = random.Random(seed)
+        for _ in xrange(num_trees):
+            leaves = ["g{0}".format(i) for i in xrange(rnd.randint(2, 10))]
+            ancestors = []
+            tree = parse_tree(_random_tree(rnd, leaves, ancestors) + ";")
+            yield rnd, tree, leaves, ancestors
+
+    def assert_scores(self, scores, expected):
+        self.assertEqual(len(scores), len(expected))
+        for score, exp_score in zip(scores, expected):
+            self.assertAlmostEqual(score, exp_score, places=9)
+
+    def test_estimate_tree(self):
+        for rnd, tree, leaves, _ancestors in self.random_trees(1, 100):
+            phylogeny = Phylogeny(tree)
+            states_list = [_random_states(rnd, leaves, [None, 1, 2, 3, -5])
+                           for _ in xrange(20)]
+            expected = [_reference_tree(tree, states) for states in states_list]
+            self.assert_scores([phylogeny.estimate_tree(states)
+                                for states in states_list], expected)
+            #scores of the same partitions are cached
+            self.assert_scores([phylogeny.estimate_tree(states)
+                                for states in states_list], expected)
+
+    def test_ancestral_states(self):
+        for rnd, tree, leaves, ancestors in self.random_trees(2, 100):
+            phylogeny = Phylogeny(tree)
+            for _ in xrange(10):
+                leaf_states = _random_states(rnd, leaves, [None, 1, 2, 3, 4])
+                ancestor = rnd.choice(ancestors)
+                states = rnd.sample([1, 2, 3, 4, 5, 7, None], rnd.randint(1, 5))
+                expected = [_reference_ancestral(tree, leaf_states,
+                                                 ancestor, state)
+                            for state in states]
+                self.assert_scores(phylogeny.estimate_ancestral_states(
+                                        leaf_states, ancestor, states), expected)
+                self.assert_scores([phylogeny.estimate_ancestral_tree(
+                                        leaf_states, ancestor, state)
+                                    for state in states], expected)
+
+    def test_target_states(self):
+        for rnd, tree, leaves, _ancestors in self.random_trees(3, 100):
+            phylogeny = Phylogeny(tree)
+            for _ in xrange(10):
+                leaf_states = _random_states(rnd, leaves, [None, 1, 2, 3, 4])
+                target = rnd.choice(leaves + ["extra"])
+                states = rnd.sample([1, 2, 3, 4, 5, 7, None], rnd.randint(1, 5))
+                expected = []
+                for state in states:
+                    target_states = dict(leaf_states)
+                    target_states[target] = state
+                    expected.append(_reference_tree(tree, target_states))
+                self.assert_scores(phylogeny.estimate_target_states(
+                                        leaf_states, target, states), expected)
@@ -0,0 +1,179 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Checks blocks_coords parsing and its binary cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import DATA_DIR, PRIMATES_COORDS
+from ragout.breakpoint_graph import permutation as perm
+from ragout.parsers.recipe_parser import parse_ragout_recipe
+from ragout.synteny_backend.synteny_backend import SyntenyBackend
+
+
+def _perm_tuples(permutations):
+    return [(p.genome_name, p.chr_name, p.seq_len,
+             [(b.block_id, b.signed_id(), b.start, b.end) for b in p.blocks])
+            for p in permutations]
+
+
+def _write_coords(filename, blocks):
+    """
+    Writes blocks_coords file from a dict
+    {block id: [(sequence name, sign, start, end)]}
+    """
+    sequences = ["genome_a.chr1", "genome_a.chr2", "genome_b.chr1"]
+    with open(filename, "w") as f:
+        f.write("Seq_id\tSize\tDescription\n")
+        for seq_id, seq_name in enumerate(sequences):
+            f.write("{0}\t{1}\t{2}\n".format(seq_id + 1, 10000, seq_name))
+        for block_id, instances in sorted(blocks.items()):
+            f.write("-" * 80 + "\n")
+            f.write("Block #{0}\n".format(block_id))
+            f.write("Seq_id\tStrand\tStart\tEnd\tLength\n")
+            for seq_name, sign, start, end in instances:
+                seq_id = sequences.index(seq_name) + 1
+                if sign < 0:
+                    start, end = end, start
+                f.write("{0}\t{1}\t{2}\t{3}\t{4}\n"
+                        .format(seq_id, "+" if sign > 0 else "-", start, end,
+                                abs(end - start)))
+        f.write("-" * 80 + "\n")
+
+
+BLOCKS = {1: [("genome_a.chr1", 1, 100, 500), ("genome_b.chr1", -1, 900, 1300)],
+          2: [("genome_a.chr1", -1, 700, 900), ("genome_b.chr1", 1, 10, 210)],
+          3: [("genome_a.chr2", 1, 5, 50), ("genome_a.chr1", 1, 1000, 1200),
+              ("genome_b.chr1", 1, 2000, 2200)]}
+
+
+class _CoordsBackend(SyntenyBackend):
+    def __init__(self, coords):
+        SyntenyBackend.__init__(self)
+        self.coords = coords
+
+    def run_backend(self, recipe, output_dir, overwrite, ancestral=False):
+        return dict((block, self.coords) for block in self.blocks)
+
+
+class BlocksCoordsTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.coords = os.path.join(self.work_dir, "blocks_coords.txt")
+        perm.release_parsed_blocks()
+
+    def tearDown(self):
+        perm.release_parsed_blocks()
+        shutil.rmtree(self.work_dir)
+
+    def assert_same_columns(self, columns, expected):
+        self.assertEqual(columns.sequences, expected.sequences)
+        self.assertEqual(columns.seq_order, expected.seq_order)
+        self.assertEqual(columns.seq_rows, expected.seq_rows)
+        for name in ["seq_index", "block_id", "sign", "start", "end"]:
+            self.assertEqual(getattr(columns, name), getattr(expected, name))
+        self.assertEqual(_perm_tuples(columns.permutations()),
+                         _perm_tuples(expected.permutations()))
+
+    def test_parse(self):
+        _write_coords(self.coords, BLOCKS)
+        perms = _perm_tuples(perm._read_blocks_coords(self.coords)
+                             .permutations())
+        #sequences are in the order of the parsed dictionary
+        self.assertEqual(sorted(perms),
+                [("genome_a", "chr1", 10000,
+                  [(1, 1, 100, 500), (2, -2, 700, 900), (3, 3, 1000, 1200)]),
+                 ("genome_a", "chr2", 10000, [(3, 3, 5, 50)]),
+                 ("genome_b", "chr1", 10000,
+                  [(2, 2, 10, 210), (1, -1, 900, 1300),
+                   (3, 3, 2000, 2200)])])
+
+    def test_round_trip(self):
+        shutil.copy(PRIMATES_COORDS, self.coords)
+        parsed = perm._read_blocks_coords(self.coords)
+        self.assertTrue(os.path.isfile(perm._blocks_cache_file(self.coords)))
+        loaded = perm._load_blocks_cache(self.coords)
+        self.assertIsNotNone(loaded)
+        self.assert_same_columns(loaded, parsed)
+        self.assert_same_columns(perm._read_blocks_coords(self.coords),
+                                 perm._parse_blocks_text(self.coords))
+
+    def test_stale_cache(self):
+        _write_coords(self.coords, BLOCKS)
+        perm._read_blocks_coords(self.coords)
+        stat = os.stat(self.coords)
+
+        #same size, different modification time
+        changed = dict(BLOCKS)
+        changed[1] = [("genome_a.chr1", 1, 100, 500),
+                      ("genome_b.chr1", 1, 900, 1300)]
+        _write_coords(self.coords, changed)
+        self.assertEqual(os.stat(self.coords).st_size, stat.st_size)
+        os.utime(self.coords, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(perm._load_blocks_cache(self.coords))
+        self.assert_same_columns(perm._read_blocks_coords(self.coords),
+                                 perm._parse_blocks_text(self.coords))
+
+        #different size, same modification time
+        del changed[3]
+        _write_coords(self.coords, changed)
+        os.utime(self.coords, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(perm._load_blocks_cache(self.coords))
+        self.assert_same_columns(perm._read_blocks_coords(self.coords),
+                                 perm._parse_blocks_text(self.coords))
+
+    def test_broken_cache(self):
+        _write_coords(self.coords, BLOCKS)
+        perm._read_blocks_coords(self.coords)
+        cache_file = perm._blocks_cache_file(self.coords)
+        with open(cache_file, "rb") as f:
+            contents = f.read()
+        with open(cache_file, "wb") as f:
+            f.write(contents[:len(contents) / 2])
+        self.assertIsNone(perm._load_blocks_cache(self.coords))
+        self.assert_same_columns(perm._read_blocks_coords(self.coords),
+                                 perm._parse_blocks_text(self.coords))
+
+    def test_container(self):
+        """
+        Permutations are the same whether blocks are parsed
+        from the text or loaded from the cache
+        """
+        shutil.copy(PRIMATES_COORDS, self.coords)
+        recipe = parse_ragout_recipe(os.path.join(DATA_DIR, "primates.rcp"))
+
+        def container_perms():
+            perm.release_parsed_blocks()
+            container = perm.PermutationContainer(self.coords, recipe,
+                                                  False, False, None)
+            return [_perm_tuples(perms) for perms in
+                    [container.ref_perms, container.target_perms,
+                     container.ancestor_perms]]
+
+        from_text = container_perms()
+        self.assertTrue(os.path.isfile(perm._blocks_cache_file(self.coords)))
+        self.assertEqual(container_perms(), from_text)
+        self.assertTrue(all(from_text))
+
+    def test_backend_cache(self):
+        """
+        Backends write the cache, the parse is shared with containers
+        """
+        _write_coords(self.coords, BLOCKS)
+        recipe = {"genomes" : {"genome_a" : {"draft" : True},
+                               "genome_b" : {"draft" : False}},
+                  "target" : "genome_a"}
+        backend = _CoordsBackend(self.coords)
+        files = backend.make_permutations(recipe, [5000], self.work_dir,
+                                          False, 1)
+        self.assertEqual(files, {5000 : self.coords})
+        self.assertTrue(os.path.isfile(perm._blocks_cache_file(self.coords)))
+        self.assertIn(os.path.abspath(self.coords), perm._parsed_blocks)
+        self.assert_same_columns(perm._load_blocks_cache(self.coords),
+                                 perm._parse_blocks_text(self.coords))
@@ -0,0 +1,101 @@
+#(c) 2013-2015 by Authors
+#This file is a part of Ragout program.
+#Released under the BSD license (see LICENSE file)
+
+"""
+Checks the cache of component solutions and that they are keyed
+by matching mode
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import DATA_DIR, PRIMATES_COORDS
+from ragout.breakpoint_graph import permutation as perm
+from ragout.breakpoint_graph.breakpoint_graph import BreakpointGraph
+from ragout.breakpoint_graph.inferer import AdjacencyInferer, SolutionCache
+from ragout.parsers.recipe_parser import parse_ragout_recipe
+from ragout.phylogeny.phylogeny import Phylogeny
+
+
+class SolutionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work_dir, "solutions.cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_save_load(self):
+        solution = ([(1, -2), (-3, 4)], 0, 1)
+        cache = SolutionCache()
+        cache.set_file(self.filename)
+        cache.add("key", solution)
+        cache.save()
+
+        loaded = SolutionCache()
+        loaded.set_file(self.filename)
+        self.assertEqual(loaded.loaded, 1)
+        self.assertIn("key", loaded)
+        self.assertEqual(loaded.get("key"), solution)
+        self.assertIsNone(loaded.get("other"))
+        self.assertEqual(loaded.hits, 1)
+
+
+class ComponentKeyTest(unittest.TestCase):
+    def setUp(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            coords = os.path.join(work_dir, "blocks_coords.txt")
+            shutil.copy(PRIMATES_COORDS, coords)
+            recipe = parse_ragout_recipe(os.path.join(DATA_DIR,
+                                                      "primates.rcp"))
+            container = perm.PermutationContainer(coords, recipe,
+                                                  False, False, None)
+        finally:
+            shutil.rmtree(work_dir)
+
+        self.graph = BreakpointGraph(container)
+        self.phylogeny = Phylogeny.from_newick(recipe["tree"])
+        self.inferer = AdjacencyInferer(self.graph, self.phylogeny)
+        self.components = self.graph.connected_components()
+        self.component = max(self.components, key=len)
+        SolutionCache.instance = None
+
+    def tearDown(self):
+        SolutionCache.instance = None
+
+    def component_key(self, approx_size):
+        inferer = AdjacencyInferer(self.graph, self.phylogeny,
+                                   approx_matching_size=approx_size)
+        return inferer._component_key(self.component)
+
+    def test_component_key(self):
+        keys = [self.inferer._component_key(c) for c in self.components]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(self.inferer._component_key(self.component),
+                         keys[self.components.index(self.component)])
+
+    def test_cached_solutions(self):
+        adjacencies = self.inferer.infer_adjacencies()
+        self.assertEqual(self.inferer.cache_hits, 0)
+        self.assertEqual(self.inferer.infer_adjacencies(), adjacencies)
+        self.assertEqual(self.inferer.cache_hits, len(self.components))
+
+    def test_approx_key(self):
+        size = len(self.component)
+        self.assertGreater(size, 2)
+        exact = self.component_key(None)
+        self.assertEqual(self.component_key(None), exact)
+
+        #approximated components are never shared with exact runs
+        #or runs with another threshold
+        approx = self.component_key(size - 1)
+        self.assertNotEqual(approx, exact)
+        self.assertNotEqual(self.component_key(size - 2), approx)
+
+        #components solved exactly anyway
+        self.assertEqual(self.component_key(size), exact)
+        self.assertEqual(self.component_key(size * 2), exact)